@@ -8,7 +8,10 @@ from ui_components import (
     render_sidebar, 
     render_query_input, 
     render_footer, 
-    display_results
+    render_history_sidebar,
+    render_metrics_sidebar,
+    render_ingestion,
+    display_history_entries
 )
 from utils import initialize_session_state, handle_query_processing
 
@@ -31,9 +34,19 @@ def main():
     
     # Process query
     if st.button("🚀 Process Query", type="primary"):
-        result = handle_query_processing(query_text)
-        if result is not None:
-            display_results(result)
+        handle_query_processing(query_text)
+
+    # Bulk ingestion of uploaded instruction files
+    render_ingestion()
+
+    # Render history browsing after processing so it includes the new results
+    render_history_sidebar()
+
+    # Rolling latency percentiles per pipeline stage
+    render_metrics_sidebar()
+
+    # Results are re-rendered from the session history on every rerun
+    display_history_entries(st.session_state.shown_queries)
     
     # Render footer
     render_footer()
@@ -0,0 +1,188 @@
+"""
+Offline latency/throughput benchmark for P.O.M.S - Portfolio and OMS System
+
+Replays a corpus built from config.EXAMPLE_QUERIES and the few-shot examples
+through route_input_and_extract with the LLM replaced by a local StubChatModel,
+so the numbers measure the pipeline's own overhead (routing, few-shot
+selection, prompt formatting, tool-call parsing, Pydantic validation) plus any
+simulated model latency.
+
+Usage:
+    python benchmark.py --requests 500 --concurrency 1,4,16 --output bench.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+from pydantic import BaseModel
+
+import pots_models
+from config import EXAMPLE_QUERIES
+from extraction_cache import ExtractionCache
+from llm_client import RateLimiter
+from model_cascade import ModelTier
+from stub_llm import StubChatModel
+from tracing import Tracer
+
+def build_corpus() -> List[Tuple[str, List[BaseModel]]]:
+    """Query texts with the tool calls the stub should answer them with."""
+    corpus = []
+    for text, order in pots_models.order_examples:
+        corpus.append((text, [pots_models.Orders(orders=[order])]))
+    for text, holding in pots_models.portfolio_holdings_examples:
+        corpus.append((text, [pots_models.Holdings(holdings=[holding])]))
+    for text, performance in pots_models.portfolio_performance_examples:
+        corpus.append((text, [pots_models.Performances(performances=[performance])]))
+    for text, tool_calls in pots_models.multi_intent_examples:
+        corpus.append((text, list(tool_calls)))
+    for queries in EXAMPLE_QUERIES.values():
+        corpus.extend((text, []) for text in queries)
+    return corpus
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of latency samples, in milliseconds."""
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+    }
+
+def _extract(text: str, args: argparse.Namespace) -> float:
+    """Run one extraction and return its wall-clock duration in seconds."""
+    start = time.perf_counter()
+    try:
+        pots_models.route_input_and_extract(text, use_cache=args.cache, use_fast_path=args.fast_path)
+    except Exception:
+        pass  # injected faults that outlast retries are counted in the resilience section
+    return time.perf_counter() - start
+
+def measure_latency(texts: List[str], args: argparse.Namespace) -> Dict[str, float]:
+    """Sequential per-request latency."""
+    for text in texts[: len(set(texts))]:
+        _extract(text, args)  # warm up lazily built resources
+    return percentiles([_extract(text, args) for text in texts])
+
+def measure_throughput(texts: List[str], concurrency: int, args: argparse.Namespace) -> Dict[str, float]:
+    """Queries per second with `concurrency` callers issuing requests back to back."""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        durations = list(executor.map(lambda text: _extract(text, args), texts))
+        elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "qps": len(texts) / elapsed, **percentiles(durations)}
+
+def measure_allocations(texts: List[str], args: argparse.Namespace) -> Dict[str, float]:
+    """Average traced bytes allocated at peak and retained per request."""
+    tracemalloc.start()
+    peaks, retained = [], []
+    try:
+        for text in texts:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            _extract(text, args)
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes_per_request": sum(peaks) / len(peaks),
+        "retained_bytes_per_request": sum(retained) / len(retained),
+    }
+
+def run(args: argparse.Namespace) -> Dict:
+    """Run every measurement and return the report."""
+    corpus = build_corpus()
+    stub = StubChatModel(
+        answers={text: calls for text, calls in corpus},
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        seed=args.seed,
+    )
+    pots_models.reset_resources()
+    pots_models.register_resource(pots_models.get_llm, stub)
+    pots_models.register_resource(pots_models.get_model_tiers, [ModelTier("stub", stub)])
+    # Measure the pipeline, not the provider's rate limits
+    pots_models.register_resource(pots_models.get_rate_limiter, RateLimiter())
+    pots_models.cascade_stats.reset()
+    pots_models.resilience.reset()
+    pots_models.tracer = Tracer()
+    # Never read or write the real on-disk cache while benchmarking
+    pots_models.extraction_cache = ExtractionCache(
+        models=(pots_models.Orders, pots_models.Holdings, pots_models.Performances, pots_models.Extraction),
+        path=None,
+        date_sensitive_routes=("holdings", "performance", "multi"),
+    )
+
+    texts = [corpus[i % len(corpus)][0] for i in range(args.requests)]
+    report = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "settings": {
+            "requests": args.requests,
+            "corpus_size": len(corpus),
+            "stub_latency_s": args.latency,
+            "stub_jitter_s": args.jitter,
+            "stub_failure_rate": args.failure_rate,
+            "stub_slow_rate": args.slow_rate,
+            "cache": args.cache,
+            "fast_path": args.fast_path,
+        },
+        "routes": {
+            route: sum(1 for text in texts if pots_models.classify_route(text) == route)
+            for route in [*pots_models.ROUTES, None]
+        },
+        "latency": measure_latency(texts, args),
+        "throughput": [measure_throughput(texts, c, args) for c in args.concurrency],
+        "allocations": measure_allocations(texts[: min(len(texts), 200)], args),
+        "fast_path": pots_models.fast_path.stats.as_dict(),
+        "cache": pots_models.extraction_cache.stats.as_dict(),
+        "cascade": pots_models.cascade_stats.as_dict(),
+        "resilience": pots_models.resilience.as_dict(),
+        "stages": pots_models.tracer.snapshot(),
+    }
+    report["routes"]["unrouted"] = report["routes"].pop(None)
+    return report
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the P.O.M.S extraction pipeline")
+    parser.add_argument("--requests", type=int, default=500, help="requests per measurement")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 16, 64],
+                        help="comma-separated concurrency levels for the throughput runs")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of model calls that fail")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of model calls that take --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="latency of slow model calls in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the jitter and injected faults")
+    parser.add_argument("--cache", action="store_true", help="enable the (in-memory) extraction cache")
+    parser.add_argument("--fast-path", action="store_true", help="enable the rule-based fast path")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        sys.stdout.write(report + "\n")
+
+if __name__ == "__main__":
+    main()
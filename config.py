@@ -72,12 +72,29 @@ EXAMPLE_QUERIES = {
     ]
 }
 
+# Result sections with more items than this are shown as one table instead of per-item cards
+TABLE_MODE_THRESHOLD = 20
+
+# Rows per page in table mode
+TABLE_PAGE_SIZE = 50
+
+# Rows of a change-of-positions diff shown on the page; the summary counts every row
+DIFF_DISPLAY_MAX_ROWS = 1000
+
+# Finished change-of-positions diffs kept in memory, so reruns do not rescan the book
+DIFF_CACHE_ENTRIES = 32
+
+# Per-session query history limits
+HISTORY_MAX_ENTRIES = 50
+HISTORY_MAX_BYTES = 5_000_000
+
 # UI text constants
 UI_TEXT = {
     "main_title": "📊 P.O.M.S",
     "subtitle": "Portfolio and OMS System",
     "query_placeholder": "e.g., 'Buy 100 shares of AAPL in account capers' or 'Show my holdings in account ABC as of today'",
-    "query_help": "Ask questions about trading orders, portfolio holdings, or performance analysis",
+    "query_help": "Ask questions about trading orders, portfolio holdings, or performance analysis. Put one query per line to process several at once.",
+    "follow_up_help": "Read queries like 'same for ushy and halifax' or 'make it 300' as changes to the previous result instead of new queries.",
     "footer_text": "P.O.M.S - Portfolio and OMS System | Powered by LangChain & OpenAI"
 }
 
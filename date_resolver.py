@@ -0,0 +1,344 @@
+"""
+Date expression resolution for P.O.M.S - Portfolio and OMS System
+
+Turns the date strings found in queries ("today", "31-Dec-2023", "YTD",
+"end of last quarter", "T-2", ...) into ISO dates locally, so the LLM only has
+to copy the expression it sees. Results are memoized per (expression, today).
+"""
+import datetime
+import re
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+DateRange = Tuple[Optional[str], Optional[str]]
+
+class Bounds(NamedTuple):
+    """First and last day an expression covers; a period stays one even when it is a single day so far (YTD on 1 Jan)."""
+    start: datetime.date
+    end: datetime.date
+    period: bool = False
+
+ABSOLUTE_FORMATS = (
+    "%Y-%m-%d",
+    "%d-%b-%Y",
+    "%d-%B-%Y",
+    "%d %b %Y",
+    "%d %B %Y",
+    "%b %d %Y",
+    "%B %d %Y",
+    "%b %d, %Y",
+    "%B %d, %Y",
+    "%m/%d/%Y",
+    "%Y/%m/%d",
+    "%Y%m%d",
+)
+
+def _observed(day: datetime.date) -> datetime.date:
+    """Move a weekend holiday to the weekday it is observed on."""
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> datetime.date:
+    """The n-th given weekday of a month; n=-1 is the last one."""
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = _month_end(datetime.date(year, month, 1))
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+def _easter(year: int) -> datetime.date:
+    """Gregorian Easter Sunday (anonymous algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+class TradingCalendar:
+    """US equity market (NYSE) holiday calendar with business-day arithmetic."""
+
+    def __init__(self, extra_holidays: Iterable[datetime.date] = ()):
+        """
+        Args:
+            extra_holidays: Additional closures, e.g. national days of mourning
+        """
+        self.extra_holidays = frozenset(extra_holidays)
+        self._holidays = lru_cache(maxsize=None)(self._build_holidays)
+
+    def _build_holidays(self, year: int) -> Set[datetime.date]:
+        holidays = {
+            _nth_weekday(year, 1, 0, 3),        # Martin Luther King Jr. Day
+            _nth_weekday(year, 2, 0, 3),        # Washington's Birthday
+            _easter(year) - datetime.timedelta(days=2),  # Good Friday
+            _nth_weekday(year, 5, 0, -1),       # Memorial Day
+            _observed(datetime.date(year, 7, 4)),
+            _nth_weekday(year, 9, 0, 1),        # Labor Day
+            _nth_weekday(year, 11, 3, 4),       # Thanksgiving
+            _observed(datetime.date(year, 12, 25)),
+        }
+        # New Year's Day on a Saturday is not observed on the preceding Friday
+        new_year = datetime.date(year, 1, 1)
+        if new_year.weekday() != 5:
+            holidays.add(_observed(new_year))
+        if year >= 2022:
+            holidays.add(_observed(datetime.date(year, 6, 19)))
+        holidays.update(day for day in self.extra_holidays if day.year == year)
+        return holidays
+
+    def holidays(self, year: int) -> Set[datetime.date]:
+        """Market holidays falling in a calendar year."""
+        return self._holidays(year)
+
+    def is_business_day(self, day: datetime.date) -> bool:
+        return day.weekday() < 5 and day not in self._holidays(day.year)
+
+    def roll_back(self, day: datetime.date) -> datetime.date:
+        """The day itself if it is a business day, otherwise the previous one."""
+        while not self.is_business_day(day):
+            day -= datetime.timedelta(days=1)
+        return day
+
+    def roll_forward(self, day: datetime.date) -> datetime.date:
+        """The day itself if it is a business day, otherwise the next one."""
+        while not self.is_business_day(day):
+            day += datetime.timedelta(days=1)
+        return day
+
+    def add_business_days(self, day: datetime.date, n: int) -> datetime.date:
+        """Move n business days forward (or back when n is negative)."""
+        step = datetime.timedelta(days=1 if n >= 0 else -1)
+        for _ in range(abs(n)):
+            day += step
+            while not self.is_business_day(day):
+                day += step
+        return day
+
+NYSE_CALENDAR = TradingCalendar()
+
+def _month_end(day: datetime.date) -> datetime.date:
+    following = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return following - datetime.timedelta(days=1)
+
+def _quarter_start(day: datetime.date) -> datetime.date:
+    return datetime.date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+
+def _shift_months(day: datetime.date, months: int) -> datetime.date:
+    """Same day of month `months` away, clamped to the month's length."""
+    index = day.year * 12 + day.month - 1 + months
+    first = datetime.date(index // 12, index % 12 + 1, 1)
+    return first.replace(day=min(day.day, _month_end(first).day))
+
+def _period(unit: str, which: str, today: datetime.date) -> Tuple[datetime.date, datetime.date]:
+    """Calendar bounds of the current ("this") or previous ("last") month/quarter/year."""
+    if unit == "month":
+        start = today.replace(day=1)
+        if which == "last":
+            start = _shift_months(start, -1)
+        return start, _month_end(start)
+    if unit == "quarter":
+        start = _quarter_start(today)
+        if which == "last":
+            start = _shift_months(start, -3)
+        return start, _month_end(_shift_months(start, 2))
+    if unit == "week":
+        start = today - datetime.timedelta(days=today.weekday())
+        if which == "last":
+            start -= datetime.timedelta(days=7)
+        return start, start + datetime.timedelta(days=6)
+    year = today.year - (1 if which == "last" else 0)
+    return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+
+_TO_DATE = {"ytd": "year", "qtd": "quarter", "mtd": "month", "wtd": "week"}
+_UNITS = r"(week|month|quarter|year)"
+_PREVIOUS = r"(?:last|previous|prior)"
+
+_PATTERNS = [
+    (re.compile(r"(?:today|now|current|latest|cob|eod)"), "today"),
+    (re.compile(r"yesterday"), "yesterday"),
+    (re.compile(r"t\s*-\s*(\d+)"), "business_days_ago"),
+    (re.compile(r"(\d+) business days? ago"), "business_days_ago"),
+    (re.compile(rf"{_PREVIOUS} (?:business|trading) day"), "previous_business_day"),
+    (re.compile(r"(\d+) (day|week|month|year)s? ago"), "ago"),
+    (re.compile(r"(ytd|qtd|mtd|wtd)"), "to_date"),
+    (re.compile(rf"(?:end of (?:the )?{_PREVIOUS} {_UNITS}|{_PREVIOUS} {_UNITS}[- ]end)"), "previous_end"),
+    (re.compile(rf"(?:start|beginning) of (?:the )?{_PREVIOUS} {_UNITS}"), "previous_start"),
+    (re.compile(rf"(?:start|beginning) of (?:the |this )?{_UNITS}"), "current_start"),
+    (re.compile(rf"{_PREVIOUS} {_UNITS}"), "previous_period"),
+    (re.compile(rf"this {_UNITS}"), "to_date"),
+]
+
+def normalize_expression(expression: str) -> str:
+    """Lower-case, collapse whitespace and drop filler like "as of"."""
+    text = " ".join(expression.strip().lower().split())
+    text = re.sub(r"^(?:as of|as at|on|at|for)\s+", "", text)
+    return text.rstrip(".")
+
+@lru_cache(maxsize=4096)
+def _resolve(expression: str, today: datetime.date) -> Optional[Bounds]:
+    """Resolve a normalized expression to its Bounds; single dates have start == end."""
+    for fmt in ABSOLUTE_FORMATS:
+        try:
+            day = datetime.datetime.strptime(expression, fmt).date()
+            return Bounds(day, day)
+        except ValueError:
+            continue
+
+    for pattern, kind in _PATTERNS:
+        match = pattern.fullmatch(expression)
+        if not match:
+            continue
+        groups = match.groups()
+        unit = next((g for g in groups if g in ("week", "month", "quarter", "year")), None)
+        if kind == "today":
+            day = today
+        elif kind == "yesterday":
+            day = today - datetime.timedelta(days=1)
+        elif kind == "business_days_ago":
+            day = NYSE_CALENDAR.add_business_days(today, -int(groups[0]))
+        elif kind == "previous_business_day":
+            day = NYSE_CALENDAR.add_business_days(today, -1)
+        elif kind == "ago":
+            n, ago_unit = int(groups[0]), groups[1]
+            if ago_unit == "day":
+                day = today - datetime.timedelta(days=n)
+            elif ago_unit == "week":
+                day = today - datetime.timedelta(weeks=n)
+            else:
+                day = _shift_months(today, -n * (12 if ago_unit == "year" else 1))
+        elif kind == "to_date":
+            # Period to date runs through yesterday, the last complete day
+            start, _ = _period(_TO_DATE.get(groups[0], unit), "this", today)
+            return Bounds(start, max(start, today - datetime.timedelta(days=1)), True)
+        elif kind == "previous_end":
+            day = _period(unit, "last", today)[1]
+        elif kind == "previous_start":
+            day = _period(unit, "last", today)[0]
+        elif kind == "current_start":
+            day = _period(unit, "this", today)[0]
+        else:
+            return Bounds(*_period(unit, "last", today), True)
+        return Bounds(day, day)
+    return None
+
+def resolve_date(
+    expression: Optional[str],
+    today: Optional[datetime.date] = None,
+    roll: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Resolve a date expression to an ISO date.
+
+    Periods ("YTD", "last month") resolve to their first day. Unrecognized
+    expressions are returned unchanged so no information is lost.
+
+    Args:
+        expression: Date text as written in the query
+        today: Reference date, defaults to the system date
+        roll: "preceding" or "following" to move non-business days onto the trading calendar
+
+    Returns:
+        ISO date string, the original expression if it is not understood, or None
+    """
+    if expression is None:
+        return None
+    bounds = _resolve(normalize_expression(expression), today or datetime.date.today())
+    if bounds is None:
+        return expression
+    return _roll(bounds[0], roll).isoformat()
+
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def is_iso_date(value: Optional[str]) -> bool:
+    """Whether a (resolved) date is an ISO date rather than an expression the resolver left alone."""
+    if not value or not _ISO_DATE.fullmatch(value):
+        return False
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+class DateRangeError(ValueError):
+    """A query's dates cannot be looked up: one did not resolve to a date, or the range is inverted."""
+
+def check_date_range(start: Optional[str], end: Optional[str]):
+    """
+    Check resolved start/end dates before they reach a store.
+
+    Raises:
+        DateRangeError: with a message fit to show the user
+    """
+    for name, value in (("start", start), ("end", end)):
+        if value is not None and not is_iso_date(value):
+            raise DateRangeError(f"Could not understand the {name} date '{value}'; try a date such as 2024-03-28 or 'end of last quarter'")
+    if start and end and end < start:
+        raise DateRangeError(f"The end date {end} is before the start date {start}")
+
+def _roll(day: datetime.date, roll: Optional[str]) -> datetime.date:
+    if roll == "preceding":
+        return NYSE_CALENDAR.roll_back(day)
+    if roll == "following":
+        return NYSE_CALENDAR.roll_forward(day)
+    return day
+
+def resolve_date_range(
+    start: Optional[str],
+    end: Optional[str],
+    today: Optional[datetime.date] = None,
+    roll: Optional[str] = None,
+) -> DateRange:
+    """
+    Resolve a query's start/end date pair.
+
+    A missing start means today. A period in the start ("YTD", "last quarter")
+    also fills in the end unless one was given explicitly, even when the
+    period is a single day so far; a period in the end resolves to its last
+    day.
+
+    Args:
+        roll: Business-day convention ("preceding" or "following") for the
+            dates positions and NAVs are read on: the end date, or the start
+            when it is a lone as-of date. The start of a range is not rolled,
+            since a range already begins at the first trading day in it.
+
+    Returns:
+        (start, end) as ISO strings where understood
+    """
+    today = today or datetime.date.today()
+    start_bounds = _resolve(normalize_expression(start), today) if start is not None else Bounds(today, today)
+    end_bounds = _resolve(normalize_expression(end), today) if end is not None else None
+    is_period = start_bounds is not None and (start_bounds.period or start_bounds.start != start_bounds.end)
+    is_range = end is not None or is_period
+
+    if start_bounds is None:
+        resolved_start = start
+    else:
+        resolved_start = _roll(start_bounds[0], None if is_range else roll).isoformat()
+
+    if end_bounds is not None:
+        resolved_end = _roll(end_bounds[1], roll).isoformat()
+    elif end is not None:
+        resolved_end = end
+    elif is_period:
+        # Rolling back must not carry the end of a period before its start
+        resolved_end = max(start_bounds.start, _roll(start_bounds.end, roll)).isoformat()
+    else:
+        resolved_end = None
+    return resolved_start, resolved_end
+
+def resolve_many(
+    pairs: Sequence[Tuple[Optional[str], Optional[str]]],
+    today: Optional[datetime.date] = None,
+    roll: Optional[str] = None,
+) -> List[DateRange]:
+    """Resolve many (start, end) pairs against one reference date."""
+    today = today or datetime.date.today()
+    return [resolve_date_range(start, end, today, roll) for start, end in pairs]
@@ -0,0 +1,97 @@
+"""
+Few-shot example selection for P.O.M.S - Portfolio and OMS System
+
+A BM25 index over the example inputs, built once per route, picks the most
+similar examples for a query while keeping the prompt under a token budget.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens used for indexing and querying."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+class ExampleSelector:
+    """Lexical top-k example selector with a prompt token budget."""
+
+    def __init__(
+        self,
+        documents: Sequence[str],
+        costs: Sequence[int],
+        k: int = 3,
+        token_budget: int = 400,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        """
+        Args:
+            documents: Example input texts, one per example
+            costs: Estimated prompt tokens each example adds when selected
+            k: Maximum number of examples to select
+            token_budget: Maximum total cost of the selected examples
+            k1: BM25 term-frequency saturation
+            b: BM25 length normalization
+        """
+        self.costs = list(costs)
+        self.k = k
+        self.token_budget = token_budget
+        self.k1 = k1
+        self.b = b
+
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for doc_id, document in enumerate(documents):
+            terms = Counter(tokenize(document))
+            self._lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self._postings.setdefault(term, []).append((doc_id, tf))
+
+        n = len(self._lengths)
+        self._average_length = (sum(self._lengths) / n) if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every example sharing at least one term with the query."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / self._average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def select(self, query: str) -> List[int]:
+        """
+        Pick examples for a query.
+
+        Returns:
+            Indices of the selected examples, most similar first, at most `k`
+            of them and within the token budget
+        """
+        scores = self.scores(query)
+        ranked = heapq.nlargest(len(scores), scores.items(), key=lambda item: item[1])
+        selected: List[int] = []
+        spent = 0
+        for doc_id, _ in ranked:
+            if len(selected) >= self.k:
+                break
+            if spent + self.costs[doc_id] > self.token_budget:
+                continue
+            selected.append(doc_id)
+            spent += self.costs[doc_id]
+        return selected
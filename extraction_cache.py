@@ -0,0 +1,220 @@
+"""
+Extraction result cache for P.O.M.S - Portfolio and OMS System
+
+Validated extraction results are kept in an in-memory LRU backed by an
+on-disk SQLite store, keyed on the normalized query text, the route and a
+schema/prompt version hash. Date-relative queries expire at midnight.
+"""
+import datetime
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+# Words that make an extraction depend on the day it was resolved on
+RELATIVE_DATE_PATTERN = re.compile(
+    r"\b(today|tonight|yesterday|tomorrow|now|current|currently|latest|"
+    r"ytd|qtd|mtd|wtd|this|last|previous|prior|next)\b",
+    re.IGNORECASE,
+)
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry."""
+    return " ".join(text.lower().split())
+
+def is_date_relative(text: str) -> bool:
+    """Return True when the query mentions a date relative to today."""
+    return RELATIVE_DATE_PATTERN.search(text) is not None
+
+def _next_midnight(now: float) -> float:
+    """Epoch seconds of the next local midnight after `now`."""
+    tomorrow = datetime.date.fromtimestamp(now) + datetime.timedelta(days=1)
+    return time.mktime(tomorrow.timetuple())
+
+@dataclass
+class CacheStats:
+    """Counters describing cache effectiveness."""
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    writes: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    stale_hits: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+class ExtractionCache:
+    """
+    Two-level cache of extraction results.
+
+    The memory level holds validated Pydantic objects and hands out deep
+    copies, so a caller changing its result cannot change what later callers
+    get. The disk level stores the model JSON and re-validates it on load.
+    """
+
+    def __init__(
+        self,
+        models: Iterable[Type[BaseModel]],
+        path: Optional[str] = None,
+        max_entries: int = 1024,
+        ttl: float = 7 * 24 * 3600,
+        date_sensitive_routes: Iterable[str] = (),
+    ):
+        """
+        Args:
+            models: Result models that may be stored, looked up by class name on load
+            path: SQLite file for the persistent level, or None for memory only
+            max_entries: Maximum number of entries kept in memory
+            ttl: Lifetime in seconds of entries that do not depend on today's date
+            date_sensitive_routes: Routes whose results always resolve dates against today
+        """
+        self.models = {model.__name__: model for model in models}
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.date_sensitive_routes = set(date_sensitive_routes)
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[str, Tuple[float, BaseModel]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the SQLite store on first use."""
+        if self.path is None:
+            return None
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "key TEXT PRIMARY KEY, route TEXT, model TEXT, payload TEXT, "
+                "created REAL, expires REAL)"
+            )
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def make_key(text: str, route: str, version: str) -> str:
+        """Build the cache key for a query."""
+        raw = f"{version}\x1f{route}\x1f{normalize_query(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expiry(self, text: str, route: str, now: float) -> float:
+        """Compute when an entry for this query stops being valid."""
+        expires = now + self.ttl
+        if route in self.date_sensitive_routes or is_date_relative(text):
+            expires = min(expires, _next_midnight(now))
+        return expires
+
+    def _remember(self, key: str, expires: float, result: BaseModel):
+        """Insert into the memory level, evicting the least recently used entry."""
+        self._memory[key] = (expires, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get(self, text: str, route: str, version: str, stale: bool = False) -> Optional[BaseModel]:
+        """
+        Return the cached result for a query, or None on a miss.
+
+        Args:
+            stale: Also return an expired result (without evicting it), for
+                degraded answers while the LLM is unavailable
+        """
+        key = self.make_key(text, route, version)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, result = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.stats.hits += 1
+                    self.stats.memory_hits += 1
+                    return result.model_copy(deep=True)
+                if stale:
+                    self.stats.stale_hits += 1
+                    return result.model_copy(deep=True)
+                del self._memory[key]
+                self.stats.expirations += 1
+
+            connection = self._connect()
+            if connection is not None:
+                row = connection.execute(
+                    "SELECT model, payload, expires FROM extractions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    model_name, payload, expires = row
+                    model = self.models.get(model_name)
+                    if expires > now and model is not None:
+                        result = model.model_validate_json(payload)
+                        self._remember(key, expires, result.model_copy(deep=True))
+                        self.stats.hits += 1
+                        self.stats.disk_hits += 1
+                        return result
+                    if stale and model is not None:
+                        self.stats.stale_hits += 1
+                        return model.model_validate_json(payload)
+                    connection.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                    connection.commit()
+                    self.stats.expirations += 1
+
+            self.stats.misses += 1
+            return None
+
+    def put(self, text: str, route: str, version: str, result: BaseModel):
+        """Store a validated result for a query."""
+        if result is None or type(result).__name__ not in self.models:
+            return
+        key = self.make_key(text, route, version)
+        now = time.time()
+        expires = self._expiry(text, route, now)
+        with self._lock:
+            self._remember(key, expires, result.model_copy(deep=True))
+            connection = self._connect()
+            if connection is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, route, type(result).__name__, result.model_dump_json(), now, expires),
+                )
+                connection.commit()
+            self.stats.writes += 1
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from both levels and return how many were removed."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for key in [k for k, (expires, _) in self._memory.items() if expires <= now]:
+                del self._memory[key]
+                removed += 1
+            connection = self._connect()
+            if connection is not None:
+                cursor = connection.execute("DELETE FROM extractions WHERE expires <= ?", (now,))
+                connection.commit()
+                removed += cursor.rowcount
+            self.stats.expirations += removed
+        return removed
+
+    def clear(self):
+        """Remove every entry from both levels."""
+        with self._lock:
+            self._memory.clear()
+            connection = self._connect()
+            if connection is not None:
+                connection.execute("DELETE FROM extractions")
+                connection.commit()
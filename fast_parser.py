@@ -0,0 +1,178 @@
+"""
+Deterministic fast-path parser for P.O.M.S - Portfolio and OMS System
+
+Recognizes the common order and holdings phrasings (the same shapes as the
+few-shot examples in pots_models) without calling the LLM. Each parse comes
+with a confidence score; callers fall back to the LLM when it is too low, or
+when the names it read do not resolve against the reference data.
+"""
+import re
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+# Words that can follow "in"/"of"/"to" but are never tickers
+_NOT_TICKERS = {
+    "a", "all", "an", "account", "accounts", "and", "by", "my", "of", "shares",
+    "the", "to", "units", "in", "for", "across", "as", "between", "on",
+}
+
+# Words that end an account list: order terms and the clauses that can follow it
+_NOT_ACCOUNTS = _NOT_TICKERS | {
+    "at", "limit", "market", "price", "stop", "with", "from", "by", "please",
+    "today", "tomorrow", "now", "instead", "each", "per",
+}
+
+_NAME = r"(?!(?:%s)\b)[A-Za-z0-9_][\w.&-]*" % "|".join(sorted(_NOT_ACCOUNTS))
+_ACCOUNT_LIST = rf"{_NAME}(?:\s*,\s*(?:and\s+)?{_NAME}|\s+and\s+{_NAME})*"
+_TICKER = r"(?!(?:%s)\b)[A-Za-z][A-Za-z.]{0,5}" % "|".join(sorted(_NOT_TICKERS))
+_DATE = r"today|\d{1,2}-[A-Za-z]{3}-\d{4}|\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4}"
+_ACCOUNTS_CLAUSE = (
+    rf"\s+(?:in|for|across)\s+(?:(?P<all>all(?:\s+of)?\s+(?:my\s+)?accounts)"
+    rf"|(?:my\s+)?accounts?\s+(?P<accounts>{_ACCOUNT_LIST}))"
+)
+
+ORDER_QUANTITY_PATTERN = re.compile(
+    rf"\b(?P<action>buy|sell|roll)\s+(?P<quantity>\d[\d,]*)\s+(?:(?:shares|units)\s+of\s+)?"
+    rf"(?P<ticker>{_TICKER})\b(?:{_ACCOUNTS_CLAUSE})?",
+    re.IGNORECASE,
+)
+
+ORDER_WEIGHT_PATTERN = re.compile(
+    rf"\b(?P<action>increase|decrease)\s+(?:my\s+)?exposure\s+(?:to|in)\s+(?P<ticker>{_TICKER})"
+    rf"\s+by\s+(?P<weight>\d+(?:\.\d+)?)\s*%(?:{_ACCOUNTS_CLAUSE})?",
+    re.IGNORECASE,
+)
+
+HOLDING_PATTERN = re.compile(
+    rf"\b(?:what(?:'s|\s+is|\s+are)\s+my|show(?:\s+me)?(?:\s+my)?|list(?:\s+my)?|get(?:\s+my)?)\s+"
+    rf"(?:change\s+(?:of|in)\s+my\s+)?(?:holdings|positions|exposure)"
+    rf"(?:\s+(?:of|to|in)\s+(?P<ticker>{_TICKER})\b)?"
+    rf"(?:{_ACCOUNTS_CLAUSE})?"
+    rf"(?:\s+(?:as\s+of|on)\s+(?P<as_of>{_DATE})"
+    rf"|\s+(?:between|from)\s+(?P<start>{_DATE})\s+(?:to|and)\s+(?P<end>{_DATE}))?",
+    re.IGNORECASE,
+)
+
+# Fields requested by default, mirroring portfolio_holdings_examples
+DEFAULT_HOLDING_FIELDS = ['weight', 'price', 'mv', 'yield']
+
+@dataclass
+class ParseResult:
+    """A fast-path parse: payload shaped like the route's result model plus a confidence."""
+    route: str
+    payload: Dict[str, List[Dict[str, Any]]]
+    confidence: float
+
+@dataclass
+class FastPathStats:
+    """Counters describing how often the fast path answers a query."""
+    attempts: int = 0
+    hits: int = 0
+    low_confidence: int = 0
+    no_match: int = 0
+    unresolved: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.attempts if self.attempts else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+def _split_accounts(match: re.Match) -> Optional[List[str]]:
+    """Turn the accounts clause of a match into a list of account names."""
+    if match.group("all"):
+        return ["ALL"]
+    raw = match.group("accounts")
+    if not raw:
+        return None
+    return [name for name in re.split(r"\s*,\s*|\s+and\s+|\band\s+", raw) if name]
+
+def _coverage(match: re.Match, text: str) -> float:
+    """Share of the (non-punctuation) text explained by the match."""
+    significant = len(text.rstrip(" .?!"))
+    return min(1.0, (match.end() - match.start()) / significant) if significant else 0.0
+
+def parse_order(text: str) -> Optional[ParseResult]:
+    """Parse a single order instruction."""
+    match = ORDER_WEIGHT_PATTERN.search(text)
+    if match:
+        order = {
+            "action": "buy" if match.group("action").lower() == "increase" else "sell",
+            "ticker": match.group("ticker").lower(),
+            "quantity": None,
+            "weight": float(match.group("weight")),
+            "accounts": _split_accounts(match),
+        }
+    else:
+        match = ORDER_QUANTITY_PATTERN.search(text)
+        if not match:
+            return None
+        order = {
+            "action": match.group("action").lower(),
+            "ticker": match.group("ticker").lower(),
+            "quantity": int(match.group("quantity").replace(",", "")),
+            "weight": None,
+            "accounts": _split_accounts(match),
+        }
+    return ParseResult(route="orders", payload={"orders": [order]}, confidence=_coverage(match, text))
+
+def parse_holding(text: str) -> Optional[ParseResult]:
+    """Parse a single holdings/positions request."""
+    match = HOLDING_PATTERN.search(text)
+    if not match:
+        return None
+    holding = {
+        "ticker": match.group("ticker"),
+        "accounts": _split_accounts(match),
+        "start_date": match.group("as_of") or match.group("start"),
+        "end_date": match.group("end"),
+        "fields": list(DEFAULT_HOLDING_FIELDS),
+    }
+    return ParseResult(route="holdings", payload={"holdings": [holding]}, confidence=_coverage(match, text))
+
+PARSERS = {
+    "orders": parse_order,
+    "holdings": parse_holding,
+}
+
+class FastPathParser:
+    """Rule-based extractor used in front of the LLM runnables."""
+
+    def __init__(self, threshold: float = 1.0):
+        """
+        Args:
+            threshold: Minimum confidence for a parse to be used instead of the LLM;
+                the default requires the match to cover the whole text
+        """
+        self.threshold = threshold
+        self.stats = FastPathStats()
+
+    def parse(self, text: str, route: str, threshold: Optional[float] = None) -> Optional[ParseResult]:
+        """
+        Parse text for the given route.
+
+        Args:
+            threshold: Confidence required instead of the parser's own threshold
+
+        Returns:
+            The parse when its confidence clears the threshold, otherwise None
+        """
+        parser = PARSERS.get(route)
+        if parser is None:
+            return None
+        self.stats.attempts += 1
+        result = parser(text.strip())
+        if result is None:
+            self.stats.no_match += 1
+            return None
+        if result.confidence < (self.threshold if threshold is None else threshold):
+            self.stats.low_confidence += 1
+            return None
+        self.stats.hits += 1
+        return result
+
+    def reject(self):
+        """Count the last hit as unresolved: the caller could not use it and falls back to the LLM."""
+        self.stats.hits -= 1
+        self.stats.unresolved += 1
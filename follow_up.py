@@ -0,0 +1,310 @@
+"""
+Follow-up queries for P.O.M.S - Portfolio and OMS System
+
+Traders work in chains: "Buy 250 AAPL in capers", then "same for ushy and
+halifax", then "make it 300". A Conversation keeps the last extraction of a
+session and treats such messages as a delta to it rather than a new query:
+a local parser recognizes the common follow-up phrasings, and anything else
+that reads like a follow-up goes to the cheapest model with a compact
+prompt (the previous result plus the message) that asks only for the
+changed fields. The delta is applied to copies of the previous Pydantic
+objects with model_copy, then accounts and tickers are resolved as usual.
+Messages that stand on their own, and follow-ups the model fails on, are
+extracted from scratch.
+
+The extraction pipeline a Conversation falls back to, and the model, tracer
+and resilience it calls, are passed in (see pots_models.new_conversation).
+"""
+import json
+import re
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from date_resolver import is_iso_date, resolve_date_range
+from intent_classifier import IntentClassifier
+from llm_client import run_sync
+from reference_data import ReferenceIndex, resolve_references
+from resilience import Resilience
+from tracing import Tracer
+
+class FollowUpDelta(BaseModel):
+    """Fields a follow-up message changes in the previous extraction; leave everything it does not change null."""
+    action: Optional[str] = Field(default=None, description="new order action: buy or sell")
+    ticker: Optional[str] = Field(default=None, description="new ticker")
+    quantity: Optional[int] = Field(default=None, description="new number of units")
+    weight: Optional[float] = Field(default=None, description="new weight in percent")
+    accounts: Optional[List[str]] = Field(default=None, description="new list of accounts")
+    start_date: Optional[str] = Field(default=None, description="new start or as-of date")
+    end_date: Optional[str] = Field(default=None, description="new end date")
+    fields: Optional[List[str]] = Field(default=None, description="new list of holding fields to show")
+
+FOLLOW_UP_SYSTEM_PROMPT = (
+    "You update a previous extraction of a portfolio query. Given the previous "
+    "result as JSON and the user's follow-up message, call the tool with only the "
+    "fields the follow-up changes and leave every other field null."
+)
+
+_NAME = r"[A-Za-z0-9_][\w.&-]*"
+_LIST = rf"{_NAME}(?:\s*,\s*(?:and\s+)?{_NAME}|\s+and\s+{_NAME})*"
+_TARGETS = rf"(?:(?P<all>all(?:\s+of)?\s+(?:my\s+)?accounts)|(?:(?:my\s+)?accounts?\s+)?(?P<names>{_LIST}))"
+_LEAD = r"(?:(?:and|now|ok|okay|also|then)\s+)?"
+
+# Names that read as a ticker (or, bare, as a year) rather than an account
+_TICKER_SHAPED = re.compile(r"[A-Z]{1,5}(?:\.[A-Z])?")
+_BARE_YEAR = re.compile(rf"{_LEAD}(?:19|20)\d{{2}}", re.I)
+
+FOLLOW_UP_PATTERNS = [
+    re.compile(rf"{_LEAD}(?:do\s+)?(?:the\s+)?same\s+(?:thing\s+|again\s+)?(?:for|in|with)\s+{_TARGETS}(?:\s+too|\s+as\s+well)?", re.I),
+    re.compile(rf"{_LEAD}(?:what\s+about|how\s+about|for|in)\s+{_TARGETS}(?:\s+too|\s+as\s+well|\s+instead)?", re.I),
+    re.compile(rf"{_LEAD}(?:(?:make|change)\s+(?:it|that|the\s+quantity)\s+(?:to\s+)?)?(?P<quantity>\d[\d,]*)(?:\s+(?:shares|units))?(?:\s+instead)?", re.I),
+    re.compile(rf"{_LEAD}(?:(?:make|change)\s+(?:it|that|the\s+weight)\s+(?:to\s+)?)?(?P<weight>\d+(?:\.\d+)?)\s*%(?:\s+instead)?", re.I),
+    re.compile(rf"{_LEAD}(?:make\s+(?:it|that)\s+an?\s+|(?:change|switch)\s+(?:it\s+)?to\s+(?:an?\s+)?)?(?P<action>buy|sell)(?:\s+instead)?", re.I),
+    re.compile(rf"{_LEAD}(?:(?:the\s+)?same\s+)?(?:but\s+)?(?:as\s+of|on)\s+(?P<as_of>.+)", re.I),
+    re.compile(rf"{_LEAD}(?:(?:the\s+)?same\s+)?(?:but\s+)?(?:between|from)\s+(?P<start>.+?)\s+(?:to|and)\s+(?P<end>.+)", re.I),
+]
+
+# Openings that mark a message as a follow-up even when it also names an intent
+FOLLOW_UP_CUES = re.compile(
+    r"^(?:same|make\s+it|make\s+that|change\s+it|instead|also|and\s+for|what\s+about|how\s+about|but|now\s+for|switch)\b",
+    re.I,
+)
+
+@dataclass
+class FollowUpStats:
+    """How follow-up messages were answered."""
+    local: int = 0
+    llm: int = 0
+    cold: int = 0
+    # Model delta calls that failed, then answered from scratch
+    failed: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+def _split_names(names: str) -> List[str]:
+    return [name for name in re.split(r"\s*,\s*(?:and\s+)?|\s+and\s+", names.strip()) if name]
+
+def _targets(match: re.Match, index: Optional[ReferenceIndex]) -> Optional[Dict[str, Any]]:
+    """
+    Accounts, or a ticker when the name is a known security and not an account.
+
+    Returns:
+        The changed field, or None when the names may not be accounts (numbers;
+        a lone name neither the index knows; without an index, a lone name or
+        an upper-case ticker-shaped one), so the model reads the message
+    """
+    if match.group("all"):
+        return {"accounts": ["ALL"]}
+    names = _split_names(match.group("names"))
+    if any(name.isdigit() for name in names):
+        return None
+    if index is None:
+        if len(names) == 1 or any(_TICKER_SHAPED.fullmatch(name) for name in names):
+            return None
+    elif len(names) == 1 and index.resolve_account(names[0]) is None:
+        return {"ticker": names[0]} if index.resolve_ticker(names[0]) is not None else None
+    return {"accounts": names}
+
+def parse_delta(text: str, index: Optional[ReferenceIndex] = None) -> Optional[Dict[str, Any]]:
+    """
+    Parse a follow-up message into changed fields without the LLM.
+
+    Comma- or semicolon-separated clauses ("same for ushy, make it 300") are
+    parsed one by one and merged.
+
+    Returns:
+        Field -> new value, or None if the message is not a recognized follow-up
+    """
+    text = text.strip().rstrip(".!?").strip()
+    clauses = [text]
+    if not _parse_clause(text, index):
+        # A comma before three digits groups thousands ("1,000") rather than separating clauses
+        clauses = [clause for clause in re.split(r"\s*;\s*|\s*,(?!\d{3}\b)\s*", text) if clause]
+    delta: Dict[str, Any] = {}
+    for clause in clauses:
+        changes = _parse_clause(clause, index)
+        if not changes:
+            return None
+        delta.update(changes)
+    return delta or None
+
+def _parse_clause(clause: str, index: Optional[ReferenceIndex]) -> Optional[Dict[str, Any]]:
+    for pattern in FOLLOW_UP_PATTERNS:
+        match = pattern.fullmatch(clause)
+        if match is None:
+            continue
+        groups = match.groupdict()
+        if "names" in groups:
+            targets = _targets(match, index)
+            if targets is None:
+                continue
+            return targets
+        if groups.get("quantity"):
+            if _BARE_YEAR.fullmatch(clause):
+                # "2024" alone is more likely a year than a new quantity
+                continue
+            return {"quantity": int(groups["quantity"].replace(",", ""))}
+        if groups.get("weight"):
+            return {"weight": float(groups["weight"])}
+        if groups.get("action"):
+            return {"action": groups["action"].lower()}
+        start, end = (groups["as_of"], None) if groups.get("as_of") else (groups["start"], groups["end"])
+        return _dates(start.strip(), end.strip() if end else None)
+    return None
+
+def _dates(start: str, end: Optional[str]) -> Optional[Dict[str, Any]]:
+    """ISO start/end dates, or None unless every expression is understood."""
+    resolved_start, resolved_end = resolve_date_range(start, end)
+    if not is_iso_date(resolved_start) or (end is not None and not is_iso_date(resolved_end)):
+        return None
+    return {"start_date": resolved_start, "end_date": resolved_end}
+
+def apply_delta(previous: BaseModel, delta: Dict[str, Any]) -> BaseModel:
+    """
+    A copy of an extraction result with the delta applied to every item that has the changed fields.
+
+    Setting a quantity clears an order's weight and vice versa, and date
+    expressions are resolved to ISO dates first, as the models' validator
+    does (model_copy skips it).
+    """
+    delta = {name: value for name, value in delta.items() if value is not None}
+    if "start_date" in delta or "end_date" in delta:
+        # A new date replaces the whole range, so "as of" after "between" drops the old end
+        delta["start_date"], delta["end_date"] = resolve_date_range(delta.get("start_date"), delta.get("end_date"))
+    if "quantity" in delta:
+        delta.setdefault("weight", None)
+    elif "weight" in delta:
+        delta.setdefault("quantity", None)
+
+    updates = {}
+    for name in ("orders", "holdings", "performances"):
+        items = getattr(previous, name, None)
+        if not items:
+            continue
+        patched = []
+        for item in items:
+            fields = type(item).model_fields
+            changes = {key: value for key, value in delta.items() if key in fields}
+            # PortfolioPerformance keeps its accounts as one comma-joined string
+            if isinstance(changes.get("accounts"), list) and fields["accounts"].annotation == Optional[str]:
+                changes["accounts"] = ",".join(changes["accounts"])
+            patched.append(item.model_copy(update=changes))
+        updates[name] = patched
+    return previous.model_copy(update=updates)
+
+class Conversation:
+    """The last extraction of a session, and follow-up handling on top of it."""
+
+    def __init__(
+        self,
+        cold_extract: Callable[[str, bool, bool], Awaitable[Optional[BaseModel]]],
+        classifier: IntentClassifier,
+        delta_runnable: Callable[[], Any],
+        resilience: Resilience,
+        tracer: Tracer,
+        reference_index: Callable[[], Optional[ReferenceIndex]] = lambda: None,
+    ):
+        """
+        Args:
+            cold_extract: Extracts a message from scratch: (text, use_cache, use_fast_path) -> result
+            classifier: Tells messages that stand on their own from follow-ups
+            delta_runnable: Returns the runnable mapping {"previous", "text"} to a FollowUpDelta
+            resilience: Deadlines, retries and circuit breaker for the delta call
+            tracer: Records each follow-up's stages
+            reference_index: Returns the index names are resolved against, if any
+        """
+        self.cold_extract = cold_extract
+        self.classifier = classifier
+        self.delta_runnable = delta_runnable
+        self.resilience = resilience
+        self.tracer = tracer
+        self.reference_index = reference_index
+        self.last: Optional[BaseModel] = None
+        self.stats = FollowUpStats()
+
+    def reset(self):
+        self.last = None
+
+    def is_follow_up(self, text: str) -> bool:
+        """Whether a message should be read against the previous result rather than on its own."""
+        if self.last is None:
+            return False
+        if FOLLOW_UP_CUES.match(text.strip()):
+            return True
+        classification = self.classifier.classify(text)
+        return classification.route is None or classification.ambiguous
+
+    def _local_delta(self, text: str) -> Optional[Dict[str, Any]]:
+        if self.last is None:
+            return None
+        return parse_delta(text, self.reference_index())
+
+    def _apply(self, delta: Dict[str, Any]) -> BaseModel:
+        result = resolve_references(apply_delta(self.last, delta), self.reference_index())
+        self.last = result
+        return result
+
+    def _delta_inputs(self, text: str) -> Dict[str, Any]:
+        previous = json.dumps(self.last.model_dump(mode="json", exclude_none=True), separators=(",", ":"))
+        return {"previous": previous, "text": text}
+
+    def remember(self, result: Optional[BaseModel]) -> Optional[BaseModel]:
+        """Make a result the one later follow-ups patch."""
+        if result is not None:
+            self.last = result
+        return result
+
+    def _patch(self, changes: Dict[str, Any], outcome: str) -> Optional[BaseModel]:
+        """Apply a delta within the current trace, or None (an empty delta) to extract from scratch."""
+        if not changes:
+            self.tracer.annotate(outcome="empty_delta")
+            return None
+        with self.tracer.timed("patch"):
+            result = self._apply(changes)
+        self.tracer.annotate(outcome=outcome)
+        return result
+
+    async def _model_delta(self, text: str) -> Optional[BaseModel]:
+        """
+        Patch the previous result with the changes the cheapest model reads in a message.
+
+        Returns:
+            The patched result, or None to extract from scratch: the model found
+            no changes, or the call failed (the cold path has its own degraded
+            fallback for provider failures)
+        """
+        with self.tracer.trace(text) as trace:
+            self.tracer.annotate(route="follow_up")
+            try:
+                runnable, inputs = self.delta_runnable(), self._delta_inputs(text)
+                config = {"callbacks": [self.tracer.callback(trace)]}
+                with self.tracer.timed("extract"):
+                    delta = await self.resilience.acall("follow_up", lambda: runnable.ainvoke(inputs, config))
+            except Exception as e:
+                self.stats.failed += 1
+                self.tracer.annotate(outcome="delta_failed", error=type(e).__name__)
+                return None
+            return self._patch(delta.model_dump(exclude_none=True) if delta is not None else {}, "llm")
+
+    async def aextract(self, text: str, use_cache: bool = True, use_fast_path: bool = True) -> Optional[BaseModel]:
+        """Extract a message, as a delta to the previous result when it is a follow-up."""
+        delta = self._local_delta(text)
+        if delta:
+            with self.tracer.trace(text):
+                self.tracer.annotate(route="follow_up")
+                result = self._patch(delta, "local")
+            self.stats.local += 1
+            return result
+        if self.is_follow_up(text):
+            result = await self._model_delta(text)
+            if result is not None:
+                self.stats.llm += 1
+                return result
+        self.stats.cold += 1
+        return self.remember(await self.cold_extract(text, use_cache, use_fast_path))
+
+    def extract(self, text: str, use_cache: bool = True, use_fast_path: bool = True) -> Optional[BaseModel]:
+        """Sync wrapper of aextract, run on the shared event loop."""
+        return run_sync(self.aextract(text, use_cache, use_fast_path))
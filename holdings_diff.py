@@ -0,0 +1,276 @@
+"""
+Holdings snapshot diff for P.O.M.S - Portfolio and OMS System
+
+Answers "change of positions between dates" queries: which positions were
+added, removed or resized between two snapshots, with the start value, end
+value and change of every requested field.
+
+Snapshot rows are sorted by (account, ticker) codes, and the codes come from
+one append-only dictionary, so the two snapshots join with a sort-merge on a
+packed int64 key. The merge walks both memory-mapped snapshots in windows of
+at most `chunk_rows` rows per side, ending each window at the smaller of the
+two sides' last keys so that no key straddles two windows. Memory stays
+bounded by the window size whatever the size of the book, and each window's
+changes are yielded as soon as they are known, so callers can render or
+write them incrementally.
+
+Usage:
+    python holdings_diff.py 2024-01-02 2024-03-28 --fields quantity weight > changes.csv
+"""
+import argparse
+import csv
+import os
+import sys
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from date_resolver import check_date_range
+from holdings_store import Columns, HoldingsStore, default_root, filter_codes, resolve_fields
+
+# Rows per side read in one merge window
+DEFAULT_CHUNK_ROWS = int(os.getenv("POMS_DIFF_CHUNK_ROWS", "100000"))
+
+# Row statuses; windows carry the index into this array and decode only the rows they yield
+STATUSES = np.array(["added", "removed", "changed", "unchanged"], dtype=object)
+ADDED, REMOVED, CHANGED, UNCHANGED = range(len(STATUSES))
+
+# Columns that are zero, rather than unknown, for a position that does not exist
+ADDITIVE_COLUMNS = ("quantity", "market_value", "weight")
+
+@dataclass
+class DiffStats:
+    """Running totals of one diff."""
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    windows: int = 0
+    rows_scanned: int = 0
+    added: int = 0
+    removed: int = 0
+    changed: int = 0
+    unchanged: int = 0
+
+    def as_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+def pack_keys(accounts: np.ndarray, tickers: np.ndarray) -> np.ndarray:
+    """(account, ticker) code pairs as int64 keys with the same sort order."""
+    return (accounts.astype(np.int64) << 32) | tickers.astype(np.int64)
+
+def merge_windows(start: Columns, end: Columns, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[Tuple[slice, slice]]:
+    """
+    Split two (account, ticker)-sorted snapshots into aligned windows.
+
+    Yields:
+        (start rows, end rows) slices covering the same key range, at most chunk_rows each
+    """
+    n, m = len(start["account"]), len(end["account"])
+    i = j = 0
+    while i < n or j < m:
+        start_keys = pack_keys(start["account"][i:i + chunk_rows], start["ticker"][i:i + chunk_rows])
+        end_keys = pack_keys(end["account"][j:j + chunk_rows], end["ticker"][j:j + chunk_rows])
+        bound = min(keys[-1] for keys in (start_keys, end_keys) if len(keys))
+        i_next = i + int(np.searchsorted(start_keys, bound, side="right"))
+        j_next = j + int(np.searchsorted(end_keys, bound, side="right"))
+        yield slice(i, i_next), slice(j, j_next)
+        i, j = i_next, j_next
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in value.split(",") if part.strip()] if value else []
+
+def _empty_snapshot() -> Columns:
+    return {"account": np.array([], dtype=np.int32), "ticker": np.array([], dtype=np.int32)}
+
+def _diff_window(
+    start: Columns,
+    end: Columns,
+    rows: Tuple[slice, slice],
+    columns: Sequence[str],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+    """Join one window: (account codes, ticker codes, status codes, column -> (start values, end values)) in key order."""
+    start_rows, end_rows = rows
+    start_accounts, start_tickers = np.asarray(start["account"][start_rows]), np.asarray(start["ticker"][start_rows])
+    end_accounts, end_tickers = np.asarray(end["account"][end_rows]), np.asarray(end["ticker"][end_rows])
+    start_keys = pack_keys(start_accounts, start_tickers)
+    end_keys = pack_keys(end_accounts, end_tickers)
+    # Both key runs are sorted and unique, so a binary search finds every match
+    positions = np.minimum(np.searchsorted(end_keys, start_keys), max(len(end_keys) - 1, 0))
+    matched = end_keys[positions] == start_keys if len(end_keys) else np.zeros(len(start_keys), dtype=bool)
+    both_start = np.flatnonzero(matched)
+    both_end = positions[both_start]
+    removed = np.ones(len(start_keys), dtype=bool)
+    removed[both_start] = False
+    added = np.ones(len(end_keys), dtype=bool)
+    added[both_end] = False
+    only_start, only_end = np.flatnonzero(removed), np.flatnonzero(added)
+
+    keys = np.concatenate([end_keys[both_end], start_keys[only_start], end_keys[only_end]])
+    order = np.argsort(keys, kind="stable")
+    accounts = np.concatenate([end_accounts[both_end], start_accounts[only_start], end_accounts[only_end]])[order]
+    tickers = np.concatenate([end_tickers[both_end], start_tickers[only_start], end_tickers[only_end]])[order]
+    status = np.repeat(
+        np.array([CHANGED, REMOVED, ADDED], dtype=np.int8),
+        [len(both_end), len(only_start), len(only_end)],
+    )[order]
+
+    values = {}
+    for column in columns:
+        absent = 0.0 if column in ADDITIVE_COLUMNS else np.nan
+        before = np.asarray(start[column][start_rows], dtype=np.float64)
+        after = np.asarray(end[column][end_rows], dtype=np.float64)
+        values[column] = (
+            np.concatenate([before[both_start], before[only_start], np.full(len(only_end), absent)])[order],
+            np.concatenate([after[both_end], np.full(len(only_start), absent), after[only_end]])[order],
+        )
+    return accounts, tickers, status, values
+
+def iter_diff(
+    store: HoldingsStore,
+    start_date: str,
+    end_date: str,
+    accounts: Optional[Sequence[str]] = None,
+    tickers: Optional[Sequence[str]] = None,
+    fields: Optional[Sequence[str]] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    include_unchanged: bool = False,
+    stats: Optional[DiffStats] = None,
+) -> Iterator[Columns]:
+    """
+    Diff the as-of snapshots of two dates, one merge window at a time.
+
+    A position is added or removed when it is in only one snapshot, and
+    changed when any diffed field differs (a field unknown on both dates is
+    the same); unchanged positions are left out unless include_unchanged is
+    set.
+
+    Args:
+        store: Holdings store to read the snapshots from
+        start_date: Date of the earlier snapshot (the latest one on or before it)
+        end_date: Date of the later snapshot
+        accounts: Accounts to keep, matched ignoring case; None or 'ALL' for every account
+        tickers: Tickers to keep, matched ignoring case; None for every ticker
+        fields: Requested fields; quantity is always diffed
+        chunk_rows: Rows per side read in one window
+        include_unchanged: Also yield positions none of whose fields changed
+        stats: Running totals, updated as windows are merged
+
+    Yields:
+        Columns per window with rows: account, ticker, status, and <field>_start,
+        <field>_end and <field>_change for quantity and each requested field
+
+    Raises:
+        DateRangeError: if a date did not resolve or the range is inverted
+        UnresolvedReferenceError: if an account or ticker is not in the store
+    """
+    check_date_range(start_date, end_date)
+    stats = stats if stats is not None else DiffStats()
+    columns = list(dict.fromkeys(["quantity", *resolve_fields(fields)]))
+    account_codes = filter_codes(store.accounts, accounts, "accounts")
+    ticker_codes = filter_codes(store.tickers, tickers, "tickers")
+
+    snapshots = []
+    for name, date in (("start_date", start_date), ("end_date", end_date)):
+        as_of = store.as_of(date)
+        setattr(stats, name, str(as_of) if as_of is not None else None)
+        # Before the first snapshot nothing was held
+        snapshot = dict(store.load(as_of)) if as_of is not None else _empty_snapshot()
+        for column in columns:
+            snapshot.setdefault(column, np.array([], dtype=np.float64))
+        snapshots.append(snapshot)
+
+    for start, end in _account_slices(*snapshots, account_codes):
+        yield from _diff_slices(store, start, end, columns, ticker_codes, chunk_rows, include_unchanged, stats)
+
+def _account_slices(start: Columns, end: Columns, account_codes: Optional[np.ndarray]) -> Iterator[Tuple[Columns, Columns]]:
+    """Both snapshots whole, or the contiguous rows of each requested account (rows are sorted by account)."""
+    if account_codes is None:
+        yield start, end
+        return
+    for code in np.unique(account_codes):
+        sliced = []
+        for snapshot in (start, end):
+            lo, hi = np.searchsorted(snapshot["account"], [code, code + 1])
+            sliced.append({name: values[lo:hi] for name, values in snapshot.items()})
+        yield sliced[0], sliced[1]
+
+def _diff_slices(
+    store: HoldingsStore,
+    start: Columns,
+    end: Columns,
+    columns: Sequence[str],
+    ticker_codes: Optional[np.ndarray],
+    chunk_rows: int,
+    include_unchanged: bool,
+    stats: DiffStats,
+) -> Iterator[Columns]:
+    for rows in merge_windows(start, end, chunk_rows):
+        stats.windows += 1
+        stats.rows_scanned += (rows[0].stop - rows[0].start) + (rows[1].stop - rows[1].start)
+        account_column, ticker_column, status, values = _diff_window(start, end, rows, columns)
+
+        keep = np.ones(len(status), dtype=bool)
+        if ticker_codes is not None:
+            keep &= np.isin(ticker_column, ticker_codes)
+        same = np.ones(len(status), dtype=bool)
+        for before, after in values.values():
+            same &= (before == after) | (np.isnan(before) & np.isnan(after))
+        status[(status == CHANGED) & same] = UNCHANGED
+        counts = np.bincount(status[keep], minlength=len(STATUSES))
+        for name, count in zip(STATUSES, counts):
+            setattr(stats, name, getattr(stats, name) + int(count))
+        if not include_unchanged:
+            keep &= status != UNCHANGED
+
+        rows_kept = np.flatnonzero(keep)
+        if not len(rows_kept):
+            continue
+        out: Columns = {
+            "account": store.accounts.decode(account_column[rows_kept]),
+            "ticker": store.tickers.decode(ticker_column[rows_kept]),
+            "status": STATUSES[status[rows_kept]],
+        }
+        for column, (before, after) in values.items():
+            out[f"{column}_start"] = before[rows_kept]
+            out[f"{column}_end"] = after[rows_kept]
+            out[f"{column}_change"] = after[rows_kept] - before[rows_kept]
+        yield out
+
+def iter_holding_diff(store: HoldingsStore, holding, **kwargs) -> Iterator[Columns]:
+    """Diff the snapshots at a PortfolioHolding's start and end dates, for its accounts, tickers and fields."""
+    return iter_diff(
+        store,
+        holding.start_date,
+        holding.end_date,
+        accounts=holding.accounts,
+        tickers=_split(holding.ticker),
+        fields=holding.fields,
+        **kwargs,
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff two holdings snapshots as CSV on stdout")
+    parser.add_argument("start_date")
+    parser.add_argument("end_date")
+    parser.add_argument("--accounts", nargs="*")
+    parser.add_argument("--tickers", nargs="*")
+    parser.add_argument("--fields", nargs="*")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--include-unchanged", action="store_true")
+    parser.add_argument("--root", default=default_root())
+    args = parser.parse_args(argv)
+
+    stats = DiffStats()
+    writer = None
+    for chunk in iter_diff(
+        HoldingsStore(args.root), args.start_date, args.end_date, args.accounts, args.tickers, args.fields,
+        chunk_rows=args.chunk_rows, include_unchanged=args.include_unchanged, stats=stats,
+    ):
+        if writer is None:
+            writer = csv.writer(sys.stdout)
+            writer.writerow(chunk.keys())
+        writer.writerows(zip(*chunk.values()))
+    print(stats.as_dict(), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
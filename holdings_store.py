@@ -0,0 +1,386 @@
+"""
+Columnar holdings store for P.O.M.S - Portfolio and OMS System
+
+Daily position snapshots are stored one directory per date, one .npy file per
+column, and opened as memory maps, so only the pages a query touches are read
+no matter how much history is on disk. Account and ticker columns are
+dictionary-encoded int32 codes; rows are sorted by (account, ticker).
+Queries match account and ticker names ignoring case and reject names the
+store has never seen, rather than answering with an empty frame.
+
+Usage:
+    python holdings_store.py seed --days 60    # write demo snapshots
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from date_resolver import NYSE_CALENDAR, check_date_range
+from reference_data import UnresolvedReferenceError
+
+# Numeric columns of a snapshot, besides the encoded account/ticker codes
+VALUE_COLUMNS = ("quantity", "price", "market_value", "weight", "yield", "duration")
+
+# Field names used in queries -> stored column
+FIELD_ALIASES = {
+    "quantity": "quantity",
+    "position": "quantity",
+    "positions": "quantity",
+    "shares": "quantity",
+    "price": "price",
+    "mv": "market_value",
+    "market value": "market_value",
+    "market_value": "market_value",
+    "weight": "weight",
+    "exposure": "weight",
+    "yield": "yield",
+    "duration": "duration",
+}
+
+Columns = Dict[str, np.ndarray]
+
+_PARTITION_NAME = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def resolve_fields(fields: Optional[Sequence[str]]) -> List[str]:
+    """Map requested field names to stored columns, keeping order; None means all columns."""
+    if not fields:
+        return list(VALUE_COLUMNS)
+    columns: List[str] = []
+    for name in fields:
+        column = FIELD_ALIASES.get(name.strip().lower())
+        if column and column not in columns:
+            columns.append(column)
+    return columns
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in value.split(",") if part.strip()] if value else []
+
+def filter_codes(dictionary: "Dictionary", names: Optional[Sequence[str]], kind: str) -> Optional[np.ndarray]:
+    """
+    Codes of the accounts or tickers a query filters on, or None for no filter.
+
+    Names match ignoring case; 'ALL' (or no names) means no filter.
+
+    Raises:
+        UnresolvedReferenceError: if a name was never stored; `kind` ("accounts" or "tickers") says which
+    """
+    if not names or any(name.strip().upper() == "ALL" for name in names):
+        return None
+    codes, unknown = dictionary.lookup(list(names))
+    if unknown:
+        raise UnresolvedReferenceError(**{kind: unknown})
+    return codes
+
+class Dictionary:
+    """Append-only string <-> int32 code mapping persisted as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._folded: Optional[Dict[str, int]] = None
+        self._array: Optional[np.ndarray] = None
+        self._mtime: Optional[float] = None
+        self.reload()
+
+    def reload(self):
+        """Pick up codes appended by another writer since the file was last read."""
+        if not os.path.exists(self.path):
+            return
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return
+        with open(self.path) as f:
+            self.values = json.load(f)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+        self._folded = None
+        self._array = None
+        self._mtime = mtime
+
+    def encode(self, values: Sequence[str], add: bool = True) -> np.ndarray:
+        """Codes for values; unknown values get new codes, or -1 when add is False."""
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            code = self._codes.get(value)
+            if code is None:
+                if not add:
+                    code = -1
+                else:
+                    code = len(self.values)
+                    self.values.append(value)
+                    self._codes[value] = code
+                    self._folded = None
+                    self._array = None
+            codes[i] = code
+        return codes
+
+    def lookup(self, values: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+        """
+        Codes of existing values, matched exactly or else ignoring case, without adding any.
+
+        Returns:
+            (codes of the values found, values with no code)
+        """
+        if self._folded is None:
+            # The first code wins when two stored values differ only in case
+            self._folded = {}
+            for code, value in enumerate(self.values):
+                self._folded.setdefault(value.casefold(), code)
+        codes, unknown = [], []
+        for value in values:
+            code = self._codes.get(value)
+            if code is None:
+                code = self._folded.get(value.strip().casefold())
+            if code is None:
+                unknown.append(value)
+            else:
+                codes.append(code)
+        return np.asarray(codes, dtype=np.int32), unknown
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        if self._array is None:
+            self._array = np.asarray(self.values, dtype=object)
+        return self._array[codes]
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.values, f)
+        os.replace(tmp, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+class HoldingsStore:
+    """Date-partitioned, memory-mapped store of position snapshots."""
+
+    def __init__(self, root: str, max_open_partitions: int = 32):
+        """
+        Args:
+            root: Store directory
+            max_open_partitions: How many snapshots to keep mapped at once
+        """
+        self.root = root
+        self.max_open_partitions = max_open_partitions
+        os.makedirs(os.path.join(root, "dictionary"), exist_ok=True)
+        self.accounts = Dictionary(os.path.join(root, "dictionary", "accounts.json"))
+        self.tickers = Dictionary(os.path.join(root, "dictionary", "tickers.json"))
+        self._open: "OrderedDict[str, Columns]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Rescan the partitions and dictionaries on disk."""
+        self.accounts.reload()
+        self.tickers.reload()
+        names = sorted(
+            name for name in os.listdir(self.root)
+            if _PARTITION_NAME.fullmatch(name) and os.path.isdir(os.path.join(self.root, name))
+        )
+        self.dates = np.array(names, dtype="datetime64[D]")
+
+    def write_snapshot(
+        self,
+        date: str,
+        accounts: Sequence[str],
+        tickers: Sequence[str],
+        quantity: Sequence[float],
+        price: Sequence[float],
+        yields: Optional[Sequence[float]] = None,
+        duration: Optional[Sequence[float]] = None,
+    ):
+        """
+        Write (or replace) the snapshot for a date.
+
+        Market value is quantity * price and weight is each position's share
+        of its account's market value, in percent.
+        """
+        account_codes = self.accounts.encode(list(accounts))
+        ticker_codes = self.tickers.encode(list(tickers))
+        quantity = np.asarray(quantity, dtype=np.float64)
+        price = np.asarray(price, dtype=np.float64)
+        market_value = quantity * price
+        account_totals = np.bincount(account_codes, weights=market_value)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(account_totals[account_codes] != 0,
+                              market_value / account_totals[account_codes] * 100, 0.0)
+        columns = {
+            "account": account_codes,
+            "ticker": ticker_codes,
+            "quantity": quantity,
+            "price": price,
+            "market_value": market_value,
+            "weight": weight,
+            "yield": np.asarray(yields if yields is not None else np.full(len(quantity), np.nan), dtype=np.float64),
+            "duration": np.asarray(duration if duration is not None else np.full(len(quantity), np.nan), dtype=np.float64),
+        }
+        order = np.lexsort((ticker_codes, account_codes))
+
+        partition = os.path.join(self.root, str(np.datetime64(date, "D")))
+        staging = partition + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name, values in columns.items():
+            np.save(os.path.join(staging, f"{name}.npy"), values[order])
+        self.accounts.save()
+        self.tickers.save()
+        shutil.rmtree(partition, ignore_errors=True)
+        os.replace(staging, partition)
+        with self._lock:
+            self._open.pop(os.path.basename(partition), None)
+        self.refresh()
+
+    def load(self, date: np.datetime64) -> Columns:
+        """Memory-mapped columns of the snapshot taken on a date."""
+        name = str(date)
+        with self._lock:
+            columns = self._open.get(name)
+            if columns is None:
+                directory = os.path.join(self.root, name)
+                columns = {
+                    column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+                    for column in ("account", "ticker", *VALUE_COLUMNS)
+                }
+                self._open[name] = columns
+                while len(self._open) > self.max_open_partitions:
+                    self._open.popitem(last=False)
+            else:
+                self._open.move_to_end(name)
+            return columns
+
+    def as_of(self, date: str) -> Optional[np.datetime64]:
+        """The latest snapshot date on or before a date."""
+        i = np.searchsorted(self.dates, np.datetime64(date, "D"), side="right")
+        return self.dates[i - 1] if i else None
+
+    def partitions(self, start: Optional[str], end: Optional[str]) -> np.ndarray:
+        """Snapshot dates a query covers: the as-of snapshot for start alone, else every date in range."""
+        if start is None:
+            return self.dates[-1:]
+        if end is None:
+            date = self.as_of(start)
+            return np.array([date], dtype="datetime64[D]") if date is not None else self.dates[:0]
+        lo = np.searchsorted(self.dates, np.datetime64(start, "D"), side="left")
+        hi = np.searchsorted(self.dates, np.datetime64(end, "D"), side="right")
+        return self.dates[lo:hi]
+
+
+    def iter_query(
+        self,
+        tickers: Optional[Sequence[str]] = None,
+        accounts: Optional[Sequence[str]] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Iterator[Columns]:
+        """
+        Filter snapshots one partition at a time.
+
+        Yields:
+            Columns per snapshot date: date, account, ticker and the requested fields
+
+        Raises:
+            UnresolvedReferenceError: if an account or ticker is not in the store
+        """
+        account_codes = filter_codes(self.accounts, accounts, "accounts")
+        ticker_codes = filter_codes(self.tickers, tickers, "tickers")
+        projection = resolve_fields(fields)
+        for date in self.partitions(start_date, end_date):
+            columns = self.load(date)
+            mask = np.ones(len(columns["account"]), dtype=bool)
+            if account_codes is not None:
+                mask &= np.isin(columns["account"], account_codes)
+            if ticker_codes is not None:
+                mask &= np.isin(columns["ticker"], ticker_codes)
+            rows = np.flatnonzero(mask)
+            out: Columns = {
+                "date": np.full(len(rows), date),
+                "account": self.accounts.decode(columns["account"][rows]),
+                "ticker": self.tickers.decode(columns["ticker"][rows]),
+            }
+            for column in projection:
+                out[column] = np.asarray(columns[column][rows])
+            yield out
+
+    def query_holding(self, holding) -> Columns:
+        """
+        Answer one PortfolioHolding: ticker filter, accounts, date range and field projection.
+
+        Raises:
+            DateRangeError: if a date did not resolve or the range is inverted
+            UnresolvedReferenceError: if an account or ticker is not in the store
+        """
+        check_date_range(holding.start_date, holding.end_date)
+        parts = list(self.iter_query(
+            tickers=_split(holding.ticker),
+            accounts=holding.accounts,
+            start_date=holding.start_date,
+            end_date=holding.end_date,
+            fields=holding.fields,
+        ))
+        if not parts:
+            projection = resolve_fields(holding.fields)
+            return {
+                "date": np.array([], dtype="datetime64[D]"),
+                "account": np.array([], dtype=object),
+                "ticker": np.array([], dtype=object),
+                **{column: np.array([], dtype=np.float64) for column in projection},
+            }
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def query(self, holdings) -> List[Columns]:
+        """Answer every request of a Holdings result."""
+        return [self.query_holding(holding) for holding in holdings.holdings]
+
+def seed_demo(store: HoldingsStore, accounts: Sequence[str], tickers: Sequence[str], days: int, seed: int = 0):
+    """Write `days` business days of random-walk demo snapshots ending today."""
+    rng = np.random.default_rng(seed)
+    n = len(accounts) * len(tickers)
+    account_column = np.repeat(np.asarray(accounts, dtype=object), len(tickers))
+    ticker_column = np.tile(np.asarray(tickers, dtype=object), len(accounts))
+    quantity = rng.integers(0, 5000, n).astype(np.float64) // 100 * 100
+    prices = rng.uniform(10, 500, len(tickers))
+    today = datetime.date.today()
+    holidays = [day for year in (today.year - 1, today.year) for day in NYSE_CALENDAR.holidays(year)]
+    dates = np.busday_offset(np.datetime64(today, "D"), np.arange(-days + 1, 1), roll="backward", holidays=holidays)
+    for date in np.unique(dates):
+        prices = prices * np.exp(rng.normal(0, 0.01, len(tickers)))
+        quantity = np.maximum(0, quantity + rng.integers(-2, 3, n) * 100 * (rng.random(n) < 0.05))
+        held = quantity > 0
+        store.write_snapshot(
+            str(date),
+            account_column[held],
+            ticker_column[held],
+            quantity[held],
+            np.tile(prices, len(accounts))[held],
+            yields=np.tile(rng.uniform(0, 5, len(tickers)), len(accounts))[held],
+            duration=np.zeros(held.sum()),
+        )
+
+def default_root() -> str:
+    return os.getenv("POMS_HOLDINGS_DIR", os.path.join(".poms_data", "holdings"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="P.O.M.S holdings store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed = commands.add_parser("seed", help="write demo snapshots for the reference accounts and tickers")
+    seed.add_argument("--days", type=int, default=60)
+    seed.add_argument("--root", default=default_root())
+    args = parser.parse_args(argv)
+
+    from reference_data import DEMO_REFERENCE_DIR, load_configured_index, load_index
+
+    index = load_configured_index() or load_index(DEMO_REFERENCE_DIR)
+    if index is None:
+        parser.error("reference data not found; see POMS_REFERENCE_DIR")
+    seed_demo(HoldingsStore(args.root), index.accounts, index.tickers, args.days)
+    print(f"Wrote {args.days} business days of snapshots to {args.root}")
+
+if __name__ == "__main__":
+    main()
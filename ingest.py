@@ -0,0 +1,260 @@
+"""
+Bulk ingestion for P.O.M.S - Portfolio and OMS System
+
+Streams a file of free-text instructions (one per line, or a CSV column)
+through the extraction pipeline with bounded concurrency. Each finished line
+is appended to a JSONL or CSV results file straight away, and that file is
+the checkpoint: running again with the same output skips lines that already
+have a result, so a crashed or rate-limited run only retries what failed or
+never ran.
+
+Usage:
+    python ingest.py instructions.txt --output results.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from reference_data import UnresolvedReferenceError
+
+# Columns that may hold the instruction in a CSV file; otherwise the first column is used
+TEXT_COLUMNS = ("text", "instruction", "query", "order")
+RESULT_FIELDS = ("line", "text", "status", "type", "result", "error", "elapsed")
+
+Item = Tuple[int, str]
+
+# IngestStats counter per record status
+_STATUS_COUNTERS = {"ok": "ok", "unrouted": "unrouted", "rejected": "rejected", "error": "errors"}
+
+@dataclass
+class IngestStats:
+    """Outcome of an ingestion run."""
+    total: int = 0
+    skipped: int = 0
+    ok: int = 0
+    unrouted: int = 0
+    rejected: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.skipped + self.ok + self.unrouted + self.rejected + self.errors
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+def read_instructions(lines: Iterable[str], csv_format: bool = False) -> Iterator[Item]:
+    """
+    (line number, text) of each non-empty instruction.
+
+    Line numbers are 1-based positions in the file (data rows for CSV), so
+    they stay stable between runs and identify lines in the checkpoint.
+    """
+    if not csv_format:
+        for number, line in enumerate(lines, 1):
+            if line.strip():
+                yield number, line.strip()
+        return
+    rows = csv.reader(lines)
+    header = next(rows, None)
+    if header is None:
+        return
+    names = [name.strip().lower() for name in header]
+    column = next((names.index(name) for name in TEXT_COLUMNS if name in names), None)
+    first = 2
+    if column is None:
+        # No recognized header: every row is data and the first column holds the text
+        rows = itertools.chain([header], rows)
+        column, first = 0, 1
+    for number, row in enumerate(rows, first):
+        if column < len(row) and row[column].strip():
+            yield number, row[column].strip()
+
+def open_instructions(path: str) -> List[Item]:
+    """Instructions of a .txt or .csv file."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(read_instructions(f, csv_format=path.lower().endswith(".csv")))
+
+def _is_csv(path: str) -> bool:
+    return path.lower().endswith(".csv")
+
+def load_results(path: str) -> List[Dict[str, Any]]:
+    """Records of an existing results file, ignoring a torn last line."""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        if _is_csv(path):
+            return [dict(row, line=int(row["line"])) for row in csv.DictReader(f) if row.get("line")]
+        records = []
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+        return records
+
+class ResultWriter:
+    """Appends result records to a JSONL or CSV file, flushing each one."""
+
+    def __init__(self, path: str, records: Iterable[Dict[str, Any]] = ()):
+        """
+        Args:
+            path: Results file; rewritten with `records` before appending
+            records: Earlier results to keep
+        """
+        self.path = path
+        self.csv = _is_csv(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            if self.csv:
+                writer = csv.DictWriter(f, RESULT_FIELDS)
+                writer.writeheader()
+                writer.writerows(records)
+            else:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+        os.replace(tmp, path)
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._csv_writer = csv.DictWriter(self._file, RESULT_FIELDS) if self.csv else None
+
+    def write(self, record: Dict[str, Any]):
+        if self._csv_writer is not None:
+            row = dict(record)
+            if row.get("result") is not None:
+                row["result"] = json.dumps(row["result"])
+            self._csv_writer.writerow(row)
+        else:
+            self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def checkpoint(path: str, items: List[Item], restart: bool = False) -> Tuple[List[Dict[str, Any]], List[Item]]:
+    """
+    Split instructions into those already done and those still to run.
+
+    A line counts as done when the results file has a non-error record for
+    the same line number and text; failed lines are dropped so they run again.
+
+    Returns:
+        (records to keep, items to process)
+    """
+    if restart:
+        return [], list(items)
+    texts = dict(items)
+    kept = {
+        int(record["line"]): record
+        for record in load_results(path)
+        if record.get("status") != "error" and texts.get(int(record["line"])) == record.get("text")
+    }
+    return sorted(kept.values(), key=lambda record: int(record["line"])), [item for item in items if item[0] not in kept]
+
+async def _extract(number: int, text: str, use_cache: bool, use_fast_path: bool) -> Dict[str, Any]:
+    from pots_models import aroute_input_and_extract
+
+    record: Dict[str, Any] = {"line": number, "text": text, "status": "ok", "type": None, "result": None, "error": None}
+    start = time.perf_counter()
+    try:
+        result = await aroute_input_and_extract(text, use_cache=use_cache, use_fast_path=use_fast_path)
+    except UnresolvedReferenceError as e:
+        record.update(status="rejected", error=str(e))
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    else:
+        if result is None:
+            record["status"] = "unrouted"
+        else:
+            record.update(type=type(result).__name__, result=result.model_dump(mode="json"))
+    record["elapsed"] = round(time.perf_counter() - start, 4)
+    return record
+
+async def ingest(
+    items: List[Item],
+    output: str,
+    concurrency: int = 8,
+    restart: bool = False,
+    on_record: Optional[Callable[[Dict[str, Any], IngestStats], None]] = None,
+    use_cache: bool = True,
+    use_fast_path: bool = True,
+) -> IngestStats:
+    """
+    Extract every instruction not already in `output`, appending results as they finish.
+
+    Args:
+        items: (line number, text) pairs, e.g. from open_instructions
+        output: Results file (.jsonl or .csv), also the checkpoint
+        concurrency: Extractions in flight at once
+        restart: Ignore existing results and start over
+        on_record: Called after each line with its record and the running stats
+        use_cache: Whether to read and write the extraction cache
+        use_fast_path: Whether to try the rule-based parser first
+
+    Returns:
+        Counts per outcome; `skipped` lines were already done
+    """
+    kept, todo = checkpoint(output, items, restart)
+    stats = IngestStats(total=len(items), skipped=len(kept))
+    writer = ResultWriter(output, kept)
+    start = time.perf_counter()
+    pending = iter(todo)
+
+    async def worker():
+        for number, text in pending:
+            record = await _extract(number, text, use_cache, use_fast_path)
+            writer.write(record)
+            counter = _STATUS_COUNTERS[record["status"]]
+            setattr(stats, counter, getattr(stats, counter) + 1)
+            stats.elapsed = time.perf_counter() - start
+            if on_record is not None:
+                on_record(record, stats)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(todo))))))
+    finally:
+        writer.close()
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+def default_output(path: str) -> str:
+    return os.path.splitext(path)[0] + ".results.jsonl"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="P.O.M.S bulk ingestion")
+    parser.add_argument("input", help="text file (one instruction per line) or CSV file")
+    parser.add_argument("--output", help="results file, .jsonl or .csv (default: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=8, help="extractions in flight at once")
+    parser.add_argument("--restart", action="store_true", help="ignore earlier results and start over")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the extraction cache")
+    parser.add_argument("--no-fast-path", action="store_true", help="always call the LLM")
+    args = parser.parse_args(argv)
+
+    items = open_instructions(args.input)
+    output = args.output or default_output(args.input)
+
+    def progress(record: Dict[str, Any], stats: IngestStats):
+        line = f"\r{stats.done}/{stats.total} done, {stats.errors} errors, {stats.rejected} rejected"
+        sys.stderr.write(line)
+        sys.stderr.flush()
+
+    stats = asyncio.run(ingest(
+        items, output, args.concurrency, args.restart, progress,
+        use_cache=not args.no_cache, use_fast_path=not args.no_fast_path,
+    ))
+    sys.stderr.write("\n")
+    print(json.dumps(stats.as_dict()))
+    print(f"Results in {output}" + (f"; rerun to retry {stats.errors} failed lines" if stats.errors else ""))
+    return 1 if stats.errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
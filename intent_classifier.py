@@ -0,0 +1,152 @@
+"""
+Intent classification for P.O.M.S - Portfolio and OMS System
+
+Routes a query to the orders, holdings or performance extractor (or the
+multi-intent one) without calling the LLM. The lexicon of words and phrases,
+each with a weight towards one intent, is compiled once into a table keyed
+by first token. Classifying then takes one pass over the query's tokens,
+matching the longest phrase at each position, so "increase exposure" counts
+as an order rather than an order plus a holdings request, and whole-word
+matching keeps "hold" out of "threshold" and "return" out of "returned".
+The same longest match lets an order verb take its object, so "sell my
+position" is an order and not an order plus a holdings request.
+
+Each intent gets a score. An intent with a score of at least the threshold
+is present. A query with only weak evidence (some score, none at the
+threshold) is ambiguous: it goes to the single route of its leading intent,
+the cheapest likely one, and only a tie goes to the configurable fallback
+route (none by default, leaving the query unrouted).
+
+Usage:
+    python intent_classifier.py "what are my returns in account capers"
+"""
+import json
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+INTENTS = ("orders", "holdings", "performance")
+
+# Route for queries asking for more than one intent
+MULTI_ROUTE = "multi"
+
+# Verbs that trade a position ("sell my position in AAPL", "close out the positions")
+POSITION_VERBS = (
+    "buy", "sell", "increase", "decrease", "reduce", "trim", "add to", "close", "close out", "exit", "liquidate",
+)
+POSITION_OBJECTS = (
+    "position", "positions", "my position", "my positions", "the position", "the positions",
+    "our position", "our positions", "this position", "that position", "my entire position", "the entire position",
+    "my whole position", "the whole position",
+)
+
+# phrase -> (intent, weight); a weight of 1.0 settles the intent on its own
+LEXICON: Dict[str, Tuple[str, float]] = {
+    # Orders
+    **{word: ("orders", 1.0) for word in (
+        "buy", "buying", "bought", "sell", "selling", "sold", "purchase", "roll", "rolls",
+        "increase", "decrease", "reduce", "trim",
+    )},
+    **{phrase: ("orders", 1.0) for phrase in (
+        "increase exposure", "increase my exposure", "decrease exposure", "decrease my exposure",
+        "reduce exposure", "reduce my exposure", "add exposure",
+    )},
+    **{f"{verb} {target}": ("orders", 1.0) for verb in POSITION_VERBS for target in POSITION_OBJECTS},
+    **{word: ("orders", 0.5) for word in ("order", "orders", "trade", "trades", "shares", "units")},
+    # Holdings
+    **{word: ("holdings", 1.0) for word in (
+        "hold", "holds", "holding", "holdings", "held", "position", "positions",
+        "exposure", "exposures", "yield", "duration",
+    )},
+    **{word: ("holdings", 0.5) for word in ("portfolio", "allocation", "weights", "mv")},
+    # Performance
+    **{word: ("performance", 1.0) for word in (
+        "performance", "performing", "performed", "return", "returns",
+    )},
+    **{word: ("performance", 0.5) for word in (
+        "nav", "pnl", "p&l", "gain", "gains", "loss", "losses", "ytd", "mtd", "qtd", "compare",
+    )},
+}
+
+_TOKEN = re.compile(r"[a-z0-9&]+")
+
+@dataclass(frozen=True)
+class Classification:
+    """Routing decision for one query."""
+    route: Optional[str]
+    intents: Tuple[str, ...]
+    scores: Dict[str, float]
+    ambiguous: bool = False
+
+def compile_lexicon(lexicon: Dict[str, Tuple[str, float]]) -> Dict[str, List[Tuple[Tuple[str, ...], str, float]]]:
+    """First token -> (phrase tokens, intent, weight) entries, longest phrase first."""
+    table: Dict[str, List[Tuple[Tuple[str, ...], str, float]]] = {}
+    for phrase, (intent, weight) in lexicon.items():
+        tokens = tuple(_TOKEN.findall(phrase.lower()))
+        table.setdefault(tokens[0], []).append((tokens, intent, weight))
+    for entries in table.values():
+        entries.sort(key=lambda entry: -len(entry[0]))
+    return table
+
+class IntentClassifier:
+    """Scores a query's intents in one pass over its tokens."""
+
+    def __init__(
+        self,
+        lexicon: Dict[str, Tuple[str, float]] = LEXICON,
+        threshold: float = 1.0,
+        fallback: Optional[str] = None,
+    ):
+        """
+        Args:
+            lexicon: Phrase -> (intent, weight)
+            threshold: Score at which an intent counts as asked for
+            fallback: Route for ambiguous queries whose weak evidence is tied
+                between intents, or None to leave them unrouted
+        """
+        self.table = compile_lexicon(lexicon)
+        self.threshold = threshold
+        self.fallback = fallback
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Summed phrase weights per intent."""
+        scores = dict.fromkeys(INTENTS, 0.0)
+        tokens = _TOKEN.findall(text.lower())
+        i, n = 0, len(tokens)
+        while i < n:
+            entries = self.table.get(tokens[i])
+            step = 1
+            if entries is not None:
+                for phrase, intent, weight in entries:
+                    if len(phrase) == 1 or tuple(tokens[i:i + len(phrase)]) == phrase:
+                        scores[intent] += weight
+                        step = len(phrase)
+                        break
+            i += step
+        return scores
+
+    def classify(self, text: str) -> Classification:
+        scores = self.scores(text)
+        intents = tuple(intent for intent in INTENTS if scores[intent] >= self.threshold)
+        if len(intents) == 1:
+            return Classification(intents[0], intents, scores)
+        if intents:
+            return Classification(MULTI_ROUTE, intents, scores)
+        if any(scores.values()):
+            best = max(scores.values())
+            leaders = [intent for intent in INTENTS if scores[intent] == best]
+            route = leaders[0] if len(leaders) == 1 else self.fallback
+            return Classification(route, intents, scores, ambiguous=True)
+        return Classification(None, intents, scores)
+
+def main(argv=None):
+    from pots_models import intent_classifier
+
+    for text in (sys.argv[1:] if argv is None else argv):
+        result = intent_classifier.classify(text)
+        print(json.dumps({"text": text, "route": result.route, "intents": result.intents,
+                          "scores": result.scores, "ambiguous": result.ambiguous}))
+
+if __name__ == "__main__":
+    main()
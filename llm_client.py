@@ -0,0 +1,304 @@
+"""
+Shared LLM client layer for P.O.M.S - Portfolio and OMS System
+
+Every chat model in a process shares one pair of keep-alive HTTP connection
+pools, and every model call first takes capacity from a process-wide rate
+limiter with two token buckets: requests per minute and tokens per minute
+(prompt estimate plus the completion budget, which is how the provider
+counts them). Callers wait in priority lanes, so order extraction goes ahead
+of holdings and performance queries when the buckets run dry at the open.
+The time each call spent queued is returned to the caller and reported per
+lane.
+
+Sync callers run their model calls on one shared event loop (run_sync),
+the one the async pool is bound to, rather than on loops of their own.
+
+StubOpenAIServer in stub_llm enforces the same kind of limits locally, so
+the limiter can be checked end to end without the real API.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+# Lane per route; lower lanes are served first
+LANES = {"orders": 0, "multi": 1, "holdings": 1, "performance": 2}
+DEFAULT_LANE = 1
+
+class TokenBucket:
+    """Refills `limit` units evenly over every `period` seconds, holding at most `burst` of the limit."""
+
+    def __init__(self, limit: float, period: float = 60.0, burst: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(limit) * burst
+        self.rate = float(limit) / period
+        self.clock = clock
+        self.level = self.capacity
+        self._updated = clock()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units (at most the capacity) are available."""
+        self._refill(self.clock())
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self._refill(self.clock())
+        self.level -= min(amount, self.capacity)
+
+@dataclass
+class LaneStats:
+    """Queueing of one priority lane."""
+    calls: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def as_dict(self) -> Dict[str, float]:
+        recent = sorted(self.recent)
+        p95 = recent[min(len(recent) - 1, int(0.95 * len(recent)))] if recent else 0.0
+        return {
+            "calls": self.calls,
+            "mean_wait_ms": self.total_wait / self.calls * 1000 if self.calls else 0.0,
+            "p95_wait_ms": p95 * 1000,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter with priority lanes.
+
+    Waiting calls form one queue ordered by (lane, arrival); only the head
+    of the queue may take capacity, so a large request cannot be starved by
+    a stream of small ones and lower lanes wait while higher ones are queued.
+    Whenever the head leaves, the new head is woken: a blocked thread through
+    the condition, an async caller through its event on its own loop.
+    """
+
+    def __init__(
+        self,
+        rpm: float = 0,
+        tpm: float = 0,
+        period: float = 60.0,
+        burst: float = 0.8,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            rpm: Requests per period, 0 for no limit
+            tpm: Tokens per period, 0 for no limit
+            period: Length of the rate window in seconds (a minute, shorter in tests)
+            burst: Share of a period's limit that may be spent at once; below 1 it leaves
+                headroom for requests that reach the provider late (slow connects, retries)
+            clock: Monotonic time source
+        """
+        self._requests = TokenBucket(rpm, period, burst, clock) if rpm else None
+        self._tokens = TokenBucket(tpm, period, burst, clock) if tpm else None
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []
+        # Ticket of each async caller -> its loop and the event that wakes it
+        self._events: Dict[Tuple[int, int], Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
+        self._arrivals = itertools.count()
+        self.lanes: Dict[int, LaneStats] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    def _try_take(self, ticket: Tuple[int, int], tokens: int) -> Optional[float]:
+        """Under the lock: 0 once capacity is taken, else seconds to wait (None: not at the head)."""
+        if self._queue[0] != ticket:
+            return None
+        delay = max(
+            self._requests.wait_time(1) if self._requests else 0.0,
+            self._tokens.wait_time(tokens) if self._tokens else 0.0,
+        )
+        if delay > 0:
+            return delay
+        if self._requests:
+            self._requests.take(1)
+        if self._tokens:
+            self._tokens.take(tokens)
+        heapq.heappop(self._queue)
+        self._wake()
+        return 0.0
+
+    def _leave(self, ticket: Tuple[int, int]):
+        """Under the lock: drop an abandoned (cancelled) ticket from the queue."""
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._wake()
+
+    def _wake(self):
+        """Under the lock: the head of the queue changed, so let its caller try to take capacity."""
+        self._cond.notify_all()
+        waiter = self._events.get(self._queue[0]) if self._queue else None
+        if waiter is not None:
+            loop, event = waiter
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The caller's loop has closed; its ticket is dropped as it unwinds
+                pass
+
+    def _record(self, lane: int, waited: float):
+        with self._cond:
+            stats = self.lanes.setdefault(lane, LaneStats())
+            stats.calls += 1
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+            stats.recent.append(waited)
+
+    def acquire(self, tokens: int = 0, lane: int = DEFAULT_LANE) -> float:
+        """Block until the call may go ahead; returns the seconds spent waiting."""
+        if not self.enabled:
+            return 0.0
+        start = time.perf_counter()
+        with self._cond:
+            ticket = (lane, next(self._arrivals))
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    delay = self._try_take(ticket, tokens)
+                    if delay == 0:
+                        break
+                    self._cond.wait(timeout=delay)
+            except BaseException:
+                self._leave(ticket)
+                raise
+        waited = time.perf_counter() - start
+        self._record(lane, waited)
+        return waited
+
+    async def aacquire(self, tokens: int = 0, lane: int = DEFAULT_LANE) -> float:
+        """
+        Async twin of acquire, waiting without blocking the loop: behind other
+        calls until woken as the head of the queue, then for the buckets to refill.
+        """
+        if not self.enabled:
+            return 0.0
+        start = time.perf_counter()
+        event = asyncio.Event()
+        with self._cond:
+            ticket = (lane, next(self._arrivals))
+            heapq.heappush(self._queue, ticket)
+            self._events[ticket] = (asyncio.get_running_loop(), event)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_take(ticket, tokens)
+                if delay == 0:
+                    break
+                if delay is None:
+                    await event.wait()
+                    event.clear()
+                else:
+                    await asyncio.sleep(delay)
+        except BaseException:
+            with self._cond:
+                self._leave(ticket)
+            raise
+        finally:
+            with self._cond:
+                self._events.pop(ticket, None)
+        waited = time.perf_counter() - start
+        self._record(lane, waited)
+        return waited
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "requests_available": round(self._requests.level, 1) if self._requests else None,
+                "tokens_available": round(self._tokens.level) if self._tokens else None,
+                "lanes": {str(lane): stats.as_dict() for lane, stats in sorted(self.lanes.items())},
+            }
+
+    def as_runnable(
+        self,
+        lane: int = DEFAULT_LANE,
+        completion_tokens: int = 256,
+        on_wait: Optional[Callable[[float], None]] = None,
+    ):
+        """
+        A pass-through runnable to put in front of a model: waits for capacity for the prompt it receives.
+
+        Args:
+            lane: Priority lane of the calls
+            completion_tokens: Completion budget counted against tokens per minute
+            on_wait: Called with the seconds each call spent queued
+        """
+        from langchain_core.runnables import RunnableLambda
+
+        from example_selector import estimate_tokens
+
+        def cost(prompt) -> int:
+            text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+            return estimate_tokens(text) + completion_tokens
+
+        def gate(prompt):
+            waited = self.acquire(cost(prompt), lane)
+            if on_wait is not None:
+                on_wait(waited)
+            return prompt
+
+        async def agate(prompt):
+            waited = await self.aacquire(cost(prompt), lane)
+            if on_wait is not None:
+                on_wait(waited)
+            return prompt
+
+        return RunnableLambda(gate, afunc=agate, name="rate_limit")
+
+def make_http_clients(
+    max_connections: int = 50,
+    max_keepalive: int = 20,
+    keepalive_expiry: float = 60.0,
+    timeout: float = 60.0,
+):
+    """
+    Sync and async httpx clients with a shared keep-alive pool, for ChatOpenAI's http_client/http_async_client.
+
+    Returns:
+        (httpx.Client, httpx.AsyncClient)
+    """
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+    )
+    timeouts = httpx.Timeout(timeout, connect=10.0)
+    return httpx.Client(limits=limits, timeout=timeouts), httpx.AsyncClient(limits=limits, timeout=timeouts)
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the process-wide event loop that runs model calls made from sync code.
+
+    The loop runs in a daemon thread and is shared by every caller (and every
+    Streamlit session): the async HTTP pool is bound to the loop it is first
+    used on, and pending calls wait on sockets instead of holding threads.
+    """
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="poms-event-loop", daemon=True).start()
+            _event_loop = loop
+    return _event_loop
+
+def run_sync(coroutine) -> Any:
+    """Run a coroutine on the shared event loop and wait for its result; never call it from that loop."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
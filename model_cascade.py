@@ -0,0 +1,250 @@
+"""
+Model cascade for P.O.M.S - Portfolio and OMS System
+
+Each extraction runnable tries a list of model tiers, cheapest first, and
+only escalates to the next tier when the cheaper model's answer is unusable:
+its structured output does not parse, it fails Pydantic validation, a
+required field (e.g. an order's ticker) is empty, or its dates did not
+resolve. Tiers are plain chat models, so local stand-ins such as
+StubChatModel can replace them offline.
+Per-tier call counts, acceptance rates, provider errors and latencies are
+kept in CascadeStats; an answer of the last tier that still fails the check
+is returned but counted as rejected_final, not accepted.
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+
+from date_resolver import is_iso_date
+
+# Fields that must be filled in for an extracted item to be usable; a tuple means any one of them
+REQUIRED_FIELDS: Dict[str, Sequence[Any]] = {
+    "Order": ("action", "ticker", ("quantity", "weight")),
+    "PortfolioHolding": (),
+    "PortfolioPerformance": (),
+}
+
+def date_problem(item: Any) -> Optional[str]:
+    """
+    Why an item's dates are unusable, or None.
+
+    The models' validator fills in and resolves the dates, so a missing start
+    never reaches here; what can still be wrong is an expression the resolver
+    did not understand ("Q1 2024") or a range that ends before it starts.
+    """
+    start, end = getattr(item, "start_date", None), getattr(item, "end_date", None)
+    for name, value in (("start_date", start), ("end_date", end)):
+        if value is not None and not is_iso_date(value):
+            return f"unresolved {name}"
+    if start and end and end < start:
+        return "inverted dates"
+    return None
+
+# Checks beyond required fields, per item model
+ITEM_CHECKS: Dict[str, Callable[[Any], Optional[str]]] = {
+    "PortfolioHolding": date_problem,
+    "PortfolioPerformance": date_problem,
+}
+
+@dataclass(frozen=True)
+class ModelTier:
+    """One model of the cascade."""
+    name: str
+    llm: Any
+
+def parse_tier_spec(spec: str) -> List[Tuple[str, Optional[int]]]:
+    """Parse "model[:max_tokens],..." into (model, max_tokens) pairs, cheapest first."""
+    tiers = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, max_tokens = part.partition(":")
+        tiers.append((name.strip(), int(max_tokens) if max_tokens.strip() else None))
+    return tiers
+
+def find_problem(result: Any) -> Optional[str]:
+    """
+    Why an extraction result should be escalated, or None if it is usable.
+
+    Returns:
+        "parse" for a missing result, "empty" for a result without items,
+        "missing <field>" for an item lacking a required field, or what an
+        ITEM_CHECKS check found wrong with an item
+    """
+    if result is None:
+        return "parse"
+    items = [
+        item
+        for name in ("orders", "holdings", "performances")
+        for item in (getattr(result, name, None) or [])
+    ]
+    if not items:
+        return "empty"
+    for item in items:
+        for required in REQUIRED_FIELDS.get(type(item).__name__, ()):
+            names = required if isinstance(required, tuple) else (required,)
+            if all(getattr(item, name, None) in (None, "", []) for name in names):
+                return f"missing {'/'.join(names)}"
+        check = ITEM_CHECKS.get(type(item).__name__)
+        problem = check(item) if check is not None else None
+        if problem is not None:
+            return problem
+    return None
+
+@dataclass
+class TierStats:
+    """Counters of one tier."""
+    calls: int = 0
+    accepted: int = 0
+    escalated: int = 0
+    rejected_final: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    reasons: Dict[str, int] = field(default_factory=dict)
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of this tier's calls whose answer was used."""
+        return self.accepted / self.calls if self.calls else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+
+        def pick(q):
+            return recent[min(len(recent) - 1, int(q * len(recent)))] * 1000 if recent else 0.0
+
+        return {
+            "calls": self.calls,
+            "accepted": self.accepted,
+            "escalated": self.escalated,
+            "rejected_final": self.rejected_final,
+            "errors": self.errors,
+            "hit_rate": self.hit_rate,
+            "mean_ms": self.total_seconds / self.calls * 1000 if self.calls else 0.0,
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+            "escalation_reasons": dict(self.reasons),
+        }
+
+class CascadeStats:
+    """Per-tier statistics shared by every route's cascade."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tiers: Dict[str, TierStats] = {}
+
+    def record(self, tier: str, seconds: float, outcome: str, reason: Optional[str] = None):
+        """Count one call; outcome is "accepted", "escalated", "rejected_final" or "error"."""
+        with self._lock:
+            stats = self.tiers.setdefault(tier, TierStats())
+            stats.calls += 1
+            stats.total_seconds += seconds
+            stats.recent.append(seconds)
+            if outcome == "accepted":
+                stats.accepted += 1
+            elif outcome == "escalated":
+                stats.escalated += 1
+                stats.reasons[reason] = stats.reasons.get(reason, 0) + 1
+            elif outcome == "rejected_final":
+                stats.rejected_final += 1
+            else:
+                stats.errors += 1
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self.tiers.items()}
+
+    def reset(self):
+        with self._lock:
+            self.tiers.clear()
+
+def _escalating_errors() -> Tuple[type, ...]:
+    """Errors of a cheaper tier that mean "try the next tier"."""
+    from langchain_core.exceptions import OutputParserException
+
+    return (OutputParserException, ValidationError)
+
+class Cascade:
+    """Runs tier runnables in order until one gives a usable result."""
+
+    def __init__(
+        self,
+        tiers: Sequence[Tuple[str, Any]],
+        stats: CascadeStats,
+        check: Callable[[Any], Optional[str]] = find_problem,
+    ):
+        """
+        Args:
+            tiers: (tier name, runnable producing the result model), cheapest first
+            stats: Where to record per-tier outcomes
+            check: Returns why a result is unusable, or None to accept it
+        """
+        self.tiers = list(tiers)
+        self.stats = stats
+        self.check = check
+
+    def _judge(self, name: str, start: float, result: Any, error: Optional[Exception], last: bool) -> bool:
+        """Record a tier's outcome and return whether its result is final."""
+        seconds = time.perf_counter() - start
+        if error is not None:
+            reason = "validation" if isinstance(error, ValidationError) else "parse"
+        else:
+            reason = self.check(result)
+        if reason is None:
+            self.stats.record(name, seconds, "accepted")
+            return True
+        if not last:
+            self.stats.record(name, seconds, "escalated", reason)
+            return False
+        # The strongest tier's answer is final, whatever it is, but it only counts as accepted if it passed
+        self.stats.record(name, seconds, "error" if error is not None else "rejected_final")
+        return True
+
+    def invoke(self, input: Any, config: Optional[dict] = None) -> Any:
+        errors = _escalating_errors()
+        for i, (name, runnable) in enumerate(self.tiers):
+            last = i == len(self.tiers) - 1
+            start = time.perf_counter()
+            try:
+                result, error = runnable.invoke(input, config), None
+            except errors as e:
+                if last:
+                    self._judge(name, start, None, e, last)
+                    raise
+                result, error = None, e
+            except Exception:
+                # A provider error: no tier is tried after it, but it counts against this one
+                self.stats.record(name, time.perf_counter() - start, "error")
+                raise
+            if self._judge(name, start, result, error, last):
+                return result
+
+    async def ainvoke(self, input: Any, config: Optional[dict] = None) -> Any:
+        errors = _escalating_errors()
+        for i, (name, runnable) in enumerate(self.tiers):
+            last = i == len(self.tiers) - 1
+            start = time.perf_counter()
+            try:
+                result, error = await runnable.ainvoke(input, config), None
+            except errors as e:
+                if last:
+                    self._judge(name, start, None, e, last)
+                    raise
+                result, error = None, e
+            except Exception:
+                self.stats.record(name, time.perf_counter() - start, "error")
+                raise
+            if self._judge(name, start, result, error, last):
+                return result
+
+    def as_runnable(self):
+        """The cascade as a LangChain runnable, so it supports invoke/ainvoke/batch and callbacks."""
+        from langchain_core.runnables import RunnableLambda
+
+        return RunnableLambda(self.invoke, afunc=self.ainvoke, name="cascade")
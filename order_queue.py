@@ -0,0 +1,444 @@
+"""
+Order intake queue for P.O.M.S - Portfolio and OMS System
+
+Extracted orders are appended to a write-ahead log before anyone sees them.
+Concurrent submitters share fsyncs (group commit): a writer thread collects
+whatever arrived while the previous batch was syncing and makes it durable
+with one write and one fsync. Durable orders feed an in-memory queue for
+downstream consumers, which acknowledge them once handled. Submitters block
+when too many orders are unacknowledged (backpressure), and every order
+carries an idempotency key derived from its normalized content and the
+submission it belongs to, so resubmitting the same submission is a no-op. On restart the log is replayed and
+unacknowledged orders are queued again.
+
+Usage:
+    python order_queue.py pending    # list unacknowledged orders
+    python order_queue.py compact    # rewrite the log without acknowledged orders
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+class QueueFullError(RuntimeError):
+    """Raised when an order cannot be accepted before the submit timeout."""
+
+class QueueClosedError(RuntimeError):
+    """Raised when submitting to, or acknowledging on, a closed queue."""
+
+def normalize_order(order) -> Dict[str, Any]:
+    """Canonical dict of an Order (or its dict): case-folded, accounts sorted."""
+    data = order.model_dump() if hasattr(order, "model_dump") else dict(order)
+    accounts = data.get("accounts")
+    return {
+        "action": (data.get("action") or "").lower() or None,
+        "ticker": (data.get("ticker") or "").upper() or None,
+        "quantity": data.get("quantity"),
+        "weight": data.get("weight"),
+        "accounts": sorted(a.upper() for a in accounts) if accounts else None,
+    }
+
+def idempotency_key(order, scope: str = "") -> str:
+    """
+    Key identifying an order within a scope.
+
+    The scope distinguishes legitimately repeated orders, e.g. the id of
+    the processed query an order was extracted from; the same order
+    submitted twice in one scope (a double click) gets the same key.
+    """
+    payload = json.dumps([scope, normalize_order(order)], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+@dataclass
+class QueuedOrder:
+    """A durable order waiting for a consumer."""
+    key: str
+    sequence: int
+    order: Dict[str, Any]
+    scope: str = ""
+    submitted_at: float = 0.0
+
+@dataclass
+class SubmitResult:
+    key: str
+    duplicate: bool
+
+@dataclass
+class QueueStats:
+    """Counters since the queue was opened."""
+    submitted: int = 0
+    duplicates: int = 0
+    committed: int = 0
+    acked: int = 0
+    batches: int = 0
+    replayed: int = 0
+    max_batch: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+@dataclass
+class _Pending:
+    records: List[Dict[str, Any]]
+    done: threading.Event = field(default_factory=threading.Event)
+    error: Optional[BaseException] = None
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    body = json.dumps(record, separators=(",", ":")).encode()
+    return b"%08x %s\n" % (zlib.crc32(body), body)
+
+def read_log(path: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Records of a log file and the byte length of its valid prefix.
+
+    Reading stops at the first torn or corrupt line, which can only be the
+    tail of a write interrupted by a crash.
+    """
+    records: List[Dict[str, Any]] = []
+    valid = 0
+    if not os.path.exists(path):
+        return records, valid
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n") or len(line) < 10:
+                break
+            checksum, body = line[:8], line[9:-1]
+            try:
+                if int(checksum, 16) != zlib.crc32(body):
+                    break
+                records.append(json.loads(body))
+            except ValueError:
+                break
+            valid += len(line)
+    return records, valid
+
+class OrderQueue:
+    """Write-ahead-logged order queue with group commit and idempotency keys."""
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = 10000,
+        max_batch: int = 1024,
+        max_delay: float = 0.002,
+        fsync: bool = True,
+    ):
+        """
+        Args:
+            path: Log file, created if missing
+            capacity: Most unacknowledged orders before submitters block
+            max_batch: Most records written per group commit
+            max_delay: Seconds the writer waits for more records before committing a batch
+            fsync: Whether commits are fsynced (turn off only for tests and benchmarks)
+        """
+        self.path = path
+        self.capacity = capacity
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self.stats = QueueStats()
+        self._ready: "queue.Queue[QueuedOrder]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._work = threading.Condition(self._lock)
+        self._batch: List[_Pending] = []
+        self._keys: Set[str] = set()
+        self._unacked: Dict[str, QueuedOrder] = {}
+        # Orders accepted but not yet acknowledged, including ones still being committed
+        self._outstanding = 0
+        self._sequence = 0
+        self._closed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._file = open(path, "ab")
+        # Length of the log up to its last complete batch, and whether a failed write left more after it
+        self._end = os.path.getsize(path)
+        self._torn = False
+        self._writer = threading.Thread(target=self._run, name="poms-order-wal", daemon=True)
+        self._writer.start()
+
+    def _replay(self):
+        """Rebuild keys and unacknowledged orders from the log, dropping a torn tail."""
+        records, valid = read_log(self.path)
+        if os.path.exists(self.path) and os.path.getsize(self.path) != valid:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+        for record in records:
+            if record["op"] == "put":
+                item = QueuedOrder(record["key"], record["seq"], record["order"], record.get("scope", ""), record.get("ts", 0.0))
+                self._keys.add(item.key)
+                self._unacked[item.key] = item
+                self._sequence = max(self._sequence, item.sequence)
+            elif record["op"] == "ack":
+                self._unacked.pop(record["key"], None)
+            elif record["op"] == "seen":
+                self._keys.add(record["key"])
+        for item in sorted(self._unacked.values(), key=lambda item: item.sequence):
+            self._ready.put(item)
+        self.stats.replayed = self._outstanding = len(self._unacked)
+
+    def _run(self):
+        """Writer thread: commit whatever has accumulated, one write and fsync per batch."""
+        while True:
+            with self._lock:
+                while not self._batch and not self._closed:
+                    self._work.wait()
+                if not self._batch and self._closed:
+                    return
+            # Let concurrent submitters join this commit
+            if self.max_delay:
+                time.sleep(self.max_delay)
+            with self._lock:
+                batch, records = [], 0
+                while self._batch and records < self.max_batch:
+                    pending = self._batch.pop(0)
+                    batch.append(pending)
+                    records += len(pending.records)
+            self._commit(batch)
+
+    def _commit(self, batch: List[_Pending]):
+        error = None
+        data = b"".join(_encode(r) for pending in batch for r in pending.records)
+        with self._io_lock:
+            try:
+                if self._torn:
+                    self._truncate()
+                self._file.write(data)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                self._end += len(data)
+            except OSError as e:
+                error = e
+                self._torn = True
+                try:
+                    self._truncate()
+                except OSError:
+                    # Retried before the next write
+                    pass
+            self._publish(batch, error)
+
+    def _truncate(self):
+        """
+        Cut a partly written batch off the log.
+
+        Replay stops at the first torn line, so anything appended after one
+        would be lost; later batches must follow the last complete one.
+        """
+        try:
+            self._file.close()
+        except OSError:
+            # Closing flushes the failed batch's buffered bytes; drop them
+            pass
+        with open(self.path, "r+b") as f:
+            f.truncate(self._end)
+        self._file = open(self.path, "ab")
+        self._torn = False
+
+    def _publish(self, batch: List[_Pending], error: Optional[BaseException]):
+        """Queue the committed orders and wake their submitters."""
+        with self._lock:
+            count = sum(len(pending.records) for pending in batch)
+            self.stats.batches += 1
+            self.stats.max_batch = max(self.stats.max_batch, count)
+            for pending in batch:
+                for record in pending.records:
+                    if record["op"] == "ack":
+                        if error is None and self._unacked.pop(record["key"], None) is not None:
+                            self._outstanding -= 1
+                            self.stats.acked += 1
+                            self._space.notify_all()
+                        continue
+                    if record["op"] != "put":
+                        continue
+                    if error is None:
+                        item = QueuedOrder(record["key"], record["seq"], record["order"], record["scope"], record["ts"])
+                        self._unacked[item.key] = item
+                        self._ready.put(item)
+                        self.stats.committed += 1
+                    else:
+                        self._keys.discard(record["key"])
+                        self._outstanding -= 1
+                        self._space.notify_all()
+                pending.error = error
+                pending.done.set()
+
+    def _append(self, records: List[Dict[str, Any]]) -> _Pending:
+        pending = _Pending(records)
+        self._batch.append(pending)
+        self._work.notify()
+        return pending
+
+    def submit_many(self, orders: Sequence, scope: str = "", timeout: Optional[float] = None) -> List[SubmitResult]:
+        """
+        Durably enqueue orders, skipping ones already submitted in the scope.
+
+        Returns once the new orders are on disk, so a crash after the return
+        cannot lose them.
+
+        Raises:
+            QueueFullError: If capacity does not free up within `timeout` seconds
+            QueueClosedError: If the queue has been closed
+            OSError: If the log could not be written; nothing was enqueued
+        """
+        keys = [idempotency_key(order, scope) for order in orders]
+        results: List[SubmitResult] = []
+        records: List[Dict[str, Any]] = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            if self._closed:
+                raise QueueClosedError("order queue is closed")
+            fresh = [(key, order) for key, order in zip(keys, orders) if key not in self._keys]
+            fresh = list(dict(fresh).items())
+            while fresh and self._outstanding and self._outstanding + len(fresh) > self.capacity:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise QueueFullError(f"{self._outstanding} orders awaiting acknowledgement")
+                self._space.wait(remaining)
+                # close() wakes blocked submitters; the writer may already be gone
+                if self._closed:
+                    raise QueueClosedError("order queue is closed")
+                fresh = [(key, order) for key, order in fresh if key not in self._keys]
+            new_keys = set()
+            for key, order in fresh:
+                self._sequence += 1
+                self._keys.add(key)
+                new_keys.add(key)
+                records.append({
+                    "op": "put",
+                    "key": key,
+                    "seq": self._sequence,
+                    "scope": scope,
+                    "ts": time.time(),
+                    "order": normalize_order(order),
+                })
+            self._outstanding += len(records)
+            self.stats.submitted += len(records)
+            self.stats.duplicates += len(keys) - len(records)
+            pending = self._append(records) if records else None
+        for key in keys:
+            duplicate = key not in new_keys
+            new_keys.discard(key)
+            results.append(SubmitResult(key, duplicate))
+        if pending is not None:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+        return results
+
+    def submit(self, order, scope: str = "", timeout: Optional[float] = None) -> SubmitResult:
+        """Durably enqueue one order; see submit_many."""
+        return self.submit_many([order], scope, timeout)[0]
+
+    def get(self, timeout: Optional[float] = None) -> Optional[QueuedOrder]:
+        """Next durable order, or None if none arrives within `timeout` seconds."""
+        try:
+            return self._ready.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, *keys: str):
+        """
+        Mark orders as handled so they are not replayed; waits until the acks are durable.
+
+        The orders leave the unacknowledged set only once their acks are on
+        disk, so a failed write leaves memory agreeing with the log.
+
+        Raises:
+            QueueClosedError: If the queue has been closed
+            OSError: If the log could not be written; the orders stay unacknowledged
+        """
+        with self._lock:
+            if self._closed:
+                raise QueueClosedError("order queue is closed")
+            records = [{"op": "ack", "key": key} for key in dict.fromkeys(keys) if key in self._unacked]
+            pending = self._append(records) if records else None
+        if pending is not None:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+
+    def pending(self) -> List[QueuedOrder]:
+        """Unacknowledged orders in submission order."""
+        with self._lock:
+            return sorted(self._unacked.values(), key=lambda item: item.sequence)
+
+    def compact(self):
+        """
+        Rewrite the log as seen keys plus unacknowledged orders.
+
+        Submitters and the writer are held off while the new log replaces the
+        old one atomically; batches not yet written go to the new log.
+        """
+        with self._io_lock, self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                for key in self._keys.difference(self._unacked):
+                    f.write(_encode({"op": "seen", "key": key}))
+                for item in sorted(self._unacked.values(), key=lambda item: item.sequence):
+                    f.write(_encode({
+                        "op": "put", "key": item.key, "seq": item.sequence,
+                        "scope": item.scope, "ts": item.submitted_at, "order": item.order,
+                    }))
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp, self.path)
+            self._file = open(self.path, "ab")
+            self._end = os.path.getsize(self.path)
+            self._torn = False
+
+    def close(self):
+        """Commit what is pending, stop the writer and fail submitters blocked on capacity."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._work.notify_all()
+            self._space.notify_all()
+        self._writer.join()
+        self._file.close()
+
+    def __iter__(self) -> Iterator[QueuedOrder]:
+        """Drain the orders currently queued, without waiting for new ones."""
+        while True:
+            item = self.get(timeout=0)
+            if item is None:
+                return
+            yield item
+
+def default_path() -> str:
+    return os.getenv("POMS_ORDER_WAL", os.path.join(".poms_data", "orders.wal"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="P.O.M.S order queue")
+    parser.add_argument("--path", default=default_path())
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("pending", help="list unacknowledged orders")
+    commands.add_parser("compact", help="drop acknowledged orders from the log")
+    args = parser.parse_args(argv)
+
+    order_queue = OrderQueue(args.path)
+    try:
+        if args.command == "pending":
+            for item in order_queue.pending():
+                print(item.sequence, item.key, json.dumps(item.order))
+        else:
+            before = os.path.getsize(args.path)
+            order_queue.compact()
+            print(f"Compacted {args.path}: {before} -> {os.path.getsize(args.path)} bytes")
+    finally:
+        order_queue.close()
+
+if __name__ == "__main__":
+    main()
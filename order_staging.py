@@ -0,0 +1,242 @@
+"""
+Order staging for P.O.M.S - Portfolio and OMS System
+
+Turns extracted orders into executable child orders. Weight orders
+("increase exposure to AAPL by 0.5%") are sized per account from its NAV and
+the security's price; quantity orders spread over several accounts are
+allocated pro rata. Quantities are rounded to lots and sells are capped at
+the position held. Every order is sized across all of its accounts with one
+set of array operations, and the result is a flat blotter.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from holdings_store import Columns, HoldingsStore
+
+BLOTTER_COLUMNS = (
+    "parent", "action", "account", "ticker", "quantity", "price",
+    "notional", "weight_pct", "position", "target_position",
+)
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip().upper() for part in value.split(",") if part.strip()] if value else []
+
+def _name_index(names: Sequence[str]) -> Dict[str, int]:
+    """Position of each name, also under its case-folded form (the first name wins a clash)."""
+    index: Dict[str, int] = {}
+    for i, name in enumerate(names):
+        index.setdefault(name.casefold(), i)
+    index.update((name, i) for i, name in enumerate(names))
+    return index
+
+def _lookup(index: Dict[str, int], name: str) -> int:
+    """Position of a name, matched exactly or else ignoring case, or -1."""
+    i = index.get(name)
+    return i if i is not None else index.get(name.strip().casefold(), -1)
+
+@dataclass
+class StagingResult:
+    """Child orders of staged orders, plus why any order was left out."""
+    blotter: Columns
+    warnings: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.blotter["account"])
+
+class MarketState:
+    """
+    Account NAVs, positions and prices from one holdings snapshot.
+
+    Positions stay in the snapshot's sparse (account, ticker) rows; looking
+    up one ticker across every account is a single masked scatter.
+    """
+
+    def __init__(
+        self,
+        accounts: Sequence[str],
+        account_codes: np.ndarray,
+        ticker_codes: np.ndarray,
+        quantity: np.ndarray,
+        prices: Dict[str, float],
+        navs: Optional[np.ndarray] = None,
+        date: Optional[np.datetime64] = None,
+    ):
+        """
+        Args:
+            accounts: Account name of each code
+            account_codes: Account code of each position row
+            ticker_codes: Code of each position row's ticker, indexing `prices` order
+            quantity: Shares held per position row
+            prices: Price per ticker, in ticker code order
+            navs: NAV per account code; defaults to the positions' market value
+            date: Snapshot date, for display
+        """
+        self.accounts = np.asarray(accounts, dtype=object)
+        self._account_index = _name_index(accounts)
+        self.tickers = list(prices)
+        self._ticker_index = _name_index(self.tickers)
+        self.prices = np.fromiter(prices.values(), dtype=np.float64, count=len(prices))
+        self.account_codes = np.asarray(account_codes)
+        self.ticker_codes = np.asarray(ticker_codes)
+        self.quantity = np.asarray(quantity, dtype=np.float64)
+        if navs is None:
+            navs = np.bincount(
+                self.account_codes,
+                weights=self.quantity * self.prices[self.ticker_codes],
+                minlength=len(self.accounts),
+            )
+        self.navs = np.asarray(navs, dtype=np.float64)
+        self.date = date
+
+    @classmethod
+    def from_store(cls, store: HoldingsStore, date: Optional[str] = None) -> Optional["MarketState"]:
+        """Market state as of the latest snapshot on or before `date` (default: the latest one)."""
+        snapshot = store.as_of(date) if date else (store.dates[-1] if len(store.dates) else None)
+        if snapshot is None:
+            return None
+        columns = store.load(snapshot)
+        ticker_codes = np.asarray(columns["ticker"])
+        names = list(store.tickers.values)
+        prices = np.full(len(names), np.nan)
+        prices[ticker_codes] = columns["price"]
+        return cls(
+            accounts=list(store.accounts.values),
+            account_codes=np.asarray(columns["account"]),
+            ticker_codes=ticker_codes,
+            quantity=np.asarray(columns["quantity"]),
+            prices=dict(zip(names, prices)),
+            date=snapshot,
+        )
+
+    def account_codes_for(self, accounts: Optional[Sequence[str]]) -> np.ndarray:
+        """
+        Codes of the named accounts, matched ignoring case, -1 for unknown ones;
+        None or 'ALL' means every account with a NAV.
+        """
+        if not accounts or any(name.strip().upper() == "ALL" for name in accounts):
+            return np.flatnonzero(self.navs > 0)
+        return np.array([_lookup(self._account_index, name) for name in accounts], dtype=np.int64)
+
+    def price(self, ticker: str) -> float:
+        i = _lookup(self._ticker_index, ticker)
+        return float(self.prices[i]) if i >= 0 else float("nan")
+
+    def positions(self, ticker: str) -> np.ndarray:
+        """Shares of a ticker held by every account code."""
+        held = np.zeros(len(self.accounts))
+        i = _lookup(self._ticker_index, ticker)
+        if i >= 0:
+            rows = self.ticker_codes == i
+            held[self.account_codes[rows]] = self.quantity[rows]
+        return held
+
+def allocate(total: int, weights: np.ndarray, lot: int = 1) -> np.ndarray:
+    """
+    Split `total` shares across accounts in proportion to `weights`, in whole lots.
+
+    Uses largest remainders, so the allocations add up to `total` rounded
+    down to a whole number of lots.
+    """
+    lots = total // lot
+    weight_sum = weights.sum()
+    if lots <= 0 or weight_sum <= 0:
+        return np.zeros(len(weights), dtype=np.int64)
+    exact = lots * weights / weight_sum
+    allocated = np.floor(exact).astype(np.int64)
+    remaining = lots - allocated.sum()
+    if remaining:
+        allocated[np.argsort(allocated - exact, kind="stable")[:remaining]] += 1
+    return allocated * lot
+
+def _round_lots(shares: np.ndarray, lot: int) -> np.ndarray:
+    return (np.rint(shares / lot) * lot).astype(np.int64)
+
+class OrderStager:
+    """Sizes orders against a MarketState."""
+
+    def __init__(self, market: MarketState, lot_sizes: Optional[Dict[str, int]] = None, default_lot: int = 1):
+        """
+        Args:
+            market: NAVs, positions and prices to size against
+            lot_sizes: Trading lot per ticker
+            default_lot: Lot for tickers not in `lot_sizes`
+        """
+        self.market = market
+        self.lot_sizes = lot_sizes or {}
+        self.default_lot = default_lot
+
+    def _size(self, order, ticker: str, codes: np.ndarray) -> np.ndarray:
+        """Signed share quantity per account code for one order and ticker."""
+        market = self.market
+        lot = self.lot_sizes.get(ticker, self.default_lot)
+        sign = 1 if order.action == "buy" else -1
+        held = market.positions(ticker)[codes]
+        if order.quantity is not None:
+            if len(codes) == 1:
+                shares = np.array([order.quantity // lot * lot])
+            else:
+                # Buys follow account size; sells follow what each account holds
+                shares = allocate(order.quantity, market.navs[codes] if sign > 0 else held, lot)
+        else:
+            shares = _round_lots(market.navs[codes] * order.weight / 100 / market.price(ticker), lot)
+        if sign < 0:
+            shares = np.minimum(shares, held.astype(np.int64))
+        return sign * shares
+
+    def stage(self, orders: Sequence) -> StagingResult:
+        """Child orders for every buy/sell Order in `orders`."""
+        market = self.market
+        parts: List[Columns] = []
+        warnings: List[str] = []
+        for parent, order in enumerate(orders, 1):
+            if order.action not in ("buy", "sell"):
+                warnings.append(f"Order {parent}: '{order.action}' orders are not staged")
+                continue
+            if order.quantity is None and order.weight is None:
+                warnings.append(f"Order {parent}: no quantity or weight")
+                continue
+            codes = market.account_codes_for(order.accounts)
+            unknown = [name for name, code in zip(order.accounts or [], codes) if code < 0]
+            if unknown:
+                warnings.append(f"Order {parent}: unknown account(s) {', '.join(unknown)}")
+                codes = codes[codes >= 0]
+            for ticker in _split(order.ticker):
+                price = market.price(ticker)
+                if not np.isfinite(price):
+                    warnings.append(f"Order {parent}: no price for {ticker}")
+                    continue
+                signed = self._size(order, ticker, codes)
+                keep = signed != 0
+                held = market.positions(ticker)[codes[keep]]
+                quantity = np.abs(signed[keep])
+                notional = quantity * price
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    weight = np.where(market.navs[codes[keep]] > 0, notional / market.navs[codes[keep]] * 100, np.nan)
+                parts.append({
+                    "parent": np.full(len(quantity), parent),
+                    "action": np.full(len(quantity), order.action, dtype=object),
+                    "account": market.accounts[codes[keep]],
+                    "ticker": np.full(len(quantity), ticker, dtype=object),
+                    "quantity": quantity,
+                    "price": np.full(len(quantity), price),
+                    "notional": notional,
+                    "weight_pct": weight,
+                    "position": held,
+                    "target_position": held + signed[keep],
+                })
+        if not parts:
+            empty: Columns = {name: np.array([], dtype=object) for name in BLOTTER_COLUMNS}
+            return StagingResult(empty, warnings)
+        blotter = {name: np.concatenate([part[name] for part in parts]) for name in BLOTTER_COLUMNS}
+        return StagingResult(blotter, warnings)
+
+def stage_orders(
+    orders: Sequence,
+    market: MarketState,
+    lot_sizes: Optional[Dict[str, int]] = None,
+    default_lot: int = 1,
+) -> StagingResult:
+    """Stage a list of Order against a market state."""
+    return OrderStager(market, lot_sizes, default_lot).stage(orders)
@@ -0,0 +1,304 @@
+"""
+Performance engine for P.O.M.S - Portfolio and OMS System
+
+Keeps a per-account cumulative time-weighted return index (and NAV series)
+in NumPy arrays, so the return between any two dates is a ratio of two index
+values rather than a compounding loop, for any number of accounts at once.
+New daily returns are appended in place.
+
+Usage:
+    python performance_engine.py seed --days 500    # write a demo history
+"""
+import argparse
+import datetime
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from date_resolver import NYSE_CALENDAR, DateRangeError, check_date_range
+from reference_data import UnresolvedReferenceError
+
+Columns = Dict[str, np.ndarray]
+DateLike = Union[str, datetime.date, np.datetime64]
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in value.split(",") if part.strip()] if value else []
+
+class PerformanceEngine:
+    """
+    Cumulative return index per account.
+
+    Row 0 of the index is the base value 1.0; row i + 1 holds the index after
+    the i-th date, so the return from date a to date b inclusive is
+    index[pos(b) + 1] / index[pos(a)] - 1.
+    """
+
+    def __init__(self, accounts: Sequence[str] = (), capacity: int = 256):
+        self.accounts: List[str] = []
+        self._columns: Dict[str, int] = {}
+        self._size = 0
+        self._dates = np.empty(capacity, dtype="datetime64[D]")
+        self._index = np.ones((capacity + 1, max(len(accounts), 1)), dtype=np.float64)
+        self._nav = np.full((capacity, max(len(accounts), 1)), np.nan, dtype=np.float64)
+        self._lock = threading.RLock()
+        self.path: Optional[str] = None
+        self._mtime: Optional[float] = None
+        for account in accounts:
+            self._add_account(account)
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._dates[: self._size]
+
+    def _add_account(self, account: str) -> int:
+        """Add a column for a new account; its index is flat (1.0) before it appears."""
+        column = len(self.accounts)
+        if column >= self._index.shape[1]:
+            extra = max(column, 1)
+            self._index = np.hstack([self._index, np.ones((self._index.shape[0], extra))])
+            self._nav = np.hstack([self._nav, np.full((self._nav.shape[0], extra), np.nan)])
+        self.accounts.append(account)
+        self._columns[account] = column
+        return column
+
+    def _reserve(self, rows: int):
+        """Make room for `rows` more dates, doubling capacity as needed."""
+        capacity = len(self._dates)
+        if self._size + rows <= capacity:
+            return
+        new_capacity = max(capacity * 2, self._size + rows)
+        dates = np.empty(new_capacity, dtype="datetime64[D]")
+        dates[: self._size] = self._dates[: self._size]
+        index = np.ones((new_capacity + 1, self._index.shape[1]))
+        index[: self._size + 1] = self._index[: self._size + 1]
+        nav = np.full((new_capacity, self._nav.shape[1]), np.nan)
+        nav[: self._size] = self._nav[: self._size]
+        self._dates, self._index, self._nav = dates, index, nav
+
+    def extend(
+        self,
+        dates: Sequence[DateLike],
+        accounts: Sequence[str],
+        returns: np.ndarray,
+        navs: Optional[np.ndarray] = None,
+    ):
+        """
+        Append daily returns for several new dates at once.
+
+        Args:
+            dates: Increasing dates, all after the last stored date
+            accounts: Account of each column of `returns`
+            returns: (len(dates), len(accounts)) daily returns as fractions; NaN means no return
+            navs: Optional NAVs with the same shape
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        returns = np.nan_to_num(np.atleast_2d(np.asarray(returns, dtype=np.float64)), nan=0.0)
+        if len(dates) == 0:
+            return
+        with self._lock:
+            if np.any(np.diff(dates) <= np.timedelta64(0, "D")) or (
+                self._size and dates[0] <= self._dates[self._size - 1]
+            ):
+                raise ValueError("dates must be increasing and after the last stored date")
+            columns = np.array([self._columns.get(a, -1) for a in accounts])
+            for i in np.flatnonzero(columns < 0):
+                columns[i] = self._add_account(accounts[i])
+            self._reserve(len(dates))
+
+            start, stop = self._size, self._size + len(dates)
+            self._dates[start:stop] = dates
+            # Accounts not reported on a date keep a flat index
+            growth = np.ones((len(dates), self._index.shape[1]))
+            growth[:, columns] = 1.0 + returns
+            self._index[start + 1: stop + 1] = self._index[start] * np.cumprod(growth, axis=0)
+            if navs is not None:
+                self._nav[start:stop, columns] = navs
+            self._size = stop
+
+    def append(self, date: DateLike, returns: Dict[str, float], navs: Optional[Dict[str, float]] = None):
+        """Append one day of returns (and optionally NAVs) keyed by account."""
+        accounts = list(returns)
+        self.extend(
+            [date],
+            accounts,
+            np.array([[returns[a] for a in accounts]]),
+            None if navs is None else np.array([[navs.get(a, np.nan) for a in accounts]]),
+        )
+
+    def _positions(self, starts: np.ndarray, ends: np.ndarray):
+        """Index rows bounding each [start, end] period."""
+        dates = self.dates
+        end_rows = np.searchsorted(dates, ends, side="right")
+        start_rows = np.searchsorted(dates, starts, side="left")
+        # No date inside the period (e.g. today before the close): use the latest day up to end
+        start_rows = np.where(start_rows >= end_rows, np.maximum(end_rows - 1, 0), start_rows)
+        return start_rows, end_rows
+
+    def period_returns(
+        self,
+        accounts: Sequence[str],
+        start: Union[DateLike, Sequence[DateLike]],
+        end: Union[DateLike, Sequence[DateLike]],
+    ) -> np.ndarray:
+        """
+        Time-weighted returns of many accounts, one O(1) lookup each.
+
+        `start`/`end` may be single dates or one per account. Unknown accounts give NaN.
+        """
+        with self._lock:
+            columns = np.array([self._columns.get(a, -1) for a in accounts])
+            count = len(columns)
+            starts = np.broadcast_to(np.asarray(start, dtype="datetime64[D]"), (count,))
+            ends = np.broadcast_to(np.asarray(end, dtype="datetime64[D]"), (count,))
+            start_rows, end_rows = self._positions(starts, ends)
+            safe = np.maximum(columns, 0)
+            values = self._index[end_rows, safe] / self._index[start_rows, safe] - 1.0
+            values[(columns < 0) | (end_rows == 0)] = np.nan
+            return values
+
+    def navs(self, accounts: Sequence[str], date: DateLike) -> np.ndarray:
+        """NAV of each account on the latest date on or before `date`."""
+        with self._lock:
+            row = np.searchsorted(self.dates, np.datetime64(date, "D"), side="right") - 1
+            columns = np.array([self._columns.get(a, -1) for a in accounts])
+            if row < 0:
+                return np.full(len(columns), np.nan)
+            values = self._nav[row, np.maximum(columns, 0)].copy()
+            values[columns < 0] = np.nan
+            return values
+
+    def resolve_accounts(self, names: Sequence[str]) -> Tuple[List[str], List[str]]:
+        """
+        Stored account names for requested ones, matched exactly or else ignoring case.
+
+        Returns:
+            (stored names of the accounts found, names with no history)
+        """
+        with self._lock:
+            folded: Dict[str, str] = {}
+            for account in self.accounts:
+                folded.setdefault(account.casefold(), account)
+            found, unknown = [], []
+            for name in names:
+                account = name if name in self._columns else folded.get(name.strip().casefold())
+                if account is None:
+                    unknown.append(name)
+                else:
+                    found.append(account)
+            return found, unknown
+
+    def evaluate(self, performance) -> Columns:
+        """
+        Answer one PortfolioPerformance.
+
+        Without an end date the period runs to the latest stored date. With
+        several accounts the result also carries each account's excess over
+        the first one, for comparisons.
+
+        Raises:
+            DateRangeError: if there is no start date, a date did not resolve, or the range is inverted
+            UnresolvedReferenceError: if an account (matched ignoring case) has no history
+        """
+        if not performance.start_date:
+            raise DateRangeError("No start date to measure performance from")
+        check_date_range(performance.start_date, performance.end_date)
+        accounts = _split(performance.accounts)
+        if not accounts or any(a.upper() == "ALL" for a in accounts):
+            accounts = list(self.accounts)
+        else:
+            accounts, unknown = self.resolve_accounts(accounts)
+            if unknown:
+                raise UnresolvedReferenceError(accounts=unknown)
+        start = np.datetime64(performance.start_date, "D")
+        if performance.end_date:
+            end = np.datetime64(performance.end_date, "D")
+        else:
+            dates = self.dates
+            end = max(dates[-1], start) if len(dates) else start
+        returns = self.period_returns(accounts, start, end)
+        result = {
+            "account": np.asarray(accounts, dtype=object),
+            "start_date": np.full(len(accounts), start),
+            "end_date": np.full(len(accounts), end),
+            "return_pct": returns * 100,
+            "start_nav": self.navs(accounts, start),
+            "end_nav": self.navs(accounts, end),
+        }
+        if len(accounts) > 1:
+            result["excess_vs_first_pct"] = (returns - returns[0]) * 100
+        return result
+
+    def save(self, path: str):
+        """Persist the engine as a compressed .npz file."""
+        with self._lock:
+            tmp = path + ".tmp.npz"
+            np.savez_compressed(
+                tmp,
+                accounts=np.asarray(self.accounts, dtype=str),
+                dates=self.dates,
+                index=self._index[: self._size + 1, : len(self.accounts)],
+                nav=self._nav[: self._size, : len(self.accounts)],
+            )
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PerformanceEngine":
+        with np.load(path) as data:
+            accounts = [str(a) for a in data["accounts"]]
+            engine = cls(accounts, capacity=max(len(data["dates"]), 1))
+            size = len(data["dates"])
+            engine._dates[:size] = data["dates"]
+            engine._index[: size + 1, : len(accounts)] = data["index"]
+            engine._nav[:size, : len(accounts)] = data["nav"]
+            engine._size = size
+        engine.path = path
+        engine._mtime = os.path.getmtime(path)
+        return engine
+
+    def refresh(self):
+        """Reload from disk when another process has saved a newer history."""
+        if self.path is None or not os.path.exists(self.path):
+            return
+        if os.path.getmtime(self.path) != self._mtime:
+            fresh = PerformanceEngine.load(self.path)
+            with self._lock:
+                self.__dict__.update({k: v for k, v in fresh.__dict__.items() if k != "_lock"})
+
+def seed_demo(accounts: Sequence[str], days: int, seed: int = 0) -> PerformanceEngine:
+    """Random daily returns and NAVs for the `days` business days before today."""
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    holidays = [d for year in range(today.year - days // 250 - 1, today.year + 1) for d in NYSE_CALENDAR.holidays(year)]
+    dates = np.busday_offset(np.datetime64(today, "D"), np.arange(-days, 0), roll="backward", holidays=holidays)
+    returns = rng.normal(0.0003, 0.01, (len(dates), len(accounts)))
+    navs = rng.uniform(1e7, 5e8, len(accounts)) * np.cumprod(1 + returns, axis=0)
+    engine = PerformanceEngine(accounts)
+    engine.extend(dates, accounts, returns, navs)
+    return engine
+
+def default_path() -> str:
+    return os.getenv("POMS_PERFORMANCE_PATH", os.path.join(".poms_data", "performance.npz"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="P.O.M.S performance engine")
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed = commands.add_parser("seed", help="write a demo return history for the reference accounts")
+    seed.add_argument("--days", type=int, default=500)
+    seed.add_argument("--path", default=default_path())
+    args = parser.parse_args(argv)
+
+    from reference_data import DEMO_REFERENCE_DIR, load_configured_index, load_index
+
+    index = load_configured_index() or load_index(DEMO_REFERENCE_DIR)
+    if index is None:
+        parser.error("reference data not found; see POMS_REFERENCE_DIR")
+    directory = os.path.dirname(args.path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    seed_demo(index.accounts, args.days).save(args.path)
+    print(f"Wrote {args.days} business days of returns to {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,55 @@
 """
 P.O.T.S - Portfolio, OMS and Transactions System
 Pydantic models and LangChain setup for portfolio management
+
+The LLM client, few-shot messages, prompts and runnables are built lazily on
+first use and kept in a process-wide resource registry, so importing the
+models does not construct an LLM client or import the OpenAI SDK.
 """
 import os
-import datetime
+import functools
+import hashlib
+import json
+import threading
 import uuid
-from typing import List, Optional, Dict, TypedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Dict, Type, TypedDict, TYPE_CHECKING
 
 from pydantic import BaseModel, Field, model_validator
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import (
-    AIMessage,
-    BaseMessage,
-    HumanMessage,
-    SystemMessage,
-    ToolMessage,
-)
-from langchain_openai import ChatOpenAI
 from dotenv import find_dotenv, load_dotenv
 
+from date_resolver import resolve_date_range
+from example_selector import ExampleSelector, estimate_tokens
+from extraction_cache import ExtractionCache
+from fast_parser import FastPathParser
+from follow_up import FOLLOW_UP_SYSTEM_PROMPT, Conversation, FollowUpDelta
+from intent_classifier import IntentClassifier
+from llm_client import DEFAULT_LANE, LANES, RateLimiter, make_http_clients, run_sync
+from model_cascade import Cascade, CascadeStats, ModelTier, parse_tier_spec
+from reference_data import ReferenceIndex, UnresolvedReferenceError, load_default_index, resolve_references
+from resilience import CircuitBreaker, Resilience, ResiliencePolicy, is_retryable, parse_deadlines
+from tracing import Tracer
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
 # Load environment variables
 load_dotenv(find_dotenv())
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Initialize LLM
-llm = ChatOpenAI(api_key=OPENAI_API_KEY)
+def resolve_query_dates(values):
+    """
+    Shared before-validator of the query models: resolve start/end date expressions to ISO dates.
+
+    Dates are kept as written; the stores read the latest snapshot or NAV on
+    or before each date, so "as of today" on a Saturday reads Friday's.
+    """
+    if isinstance(values, dict):
+        values['start_date'], values['end_date'] = resolve_date_range(
+            values.get('start_date'), values.get('end_date')
+        )
+    return values
 
 # Pydantic Models
 class PortfolioHolding(BaseModel):
@@ -36,22 +61,7 @@ class PortfolioHolding(BaseModel):
 
     @model_validator(mode='before')
     def process_dates(cls, values):
-        if isinstance(values, dict):
-            start_date = values.get('start_date')
-            end_date = values.get('end_date')
-            
-            if start_date == None:
-                values['start_date'] = datetime.date.today().isoformat()
-
-            if start_date == 'today':
-                values['start_date'] = datetime.date.today().isoformat()
-            if end_date == 'today':
-                values['end_date'] = datetime.date.today().isoformat()
-                
-            if start_date == 'YTD':
-                values['start_date'] = f'{datetime.date.today().year}-01-01'
-                values['end_date'] = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
-        return values
+        return resolve_query_dates(values)
 
 class PortfolioPerformance(BaseModel):
     start_date: Optional[str] = Field(default=None, description="start date to evaluate the performace of accounts")
@@ -60,22 +70,7 @@ class PortfolioPerformance(BaseModel):
     
     @model_validator(mode='before')
     def process_dates(cls, values):
-        if isinstance(values, dict):
-            start_date = values.get('start_date')
-            end_date = values.get('end_date')
-            
-            if start_date == None:
-                values['start_date'] = datetime.date.today().isoformat()
-
-            if start_date == 'today':
-                values['start_date'] = datetime.date.today().isoformat()
-            if end_date == 'today':
-                values['end_date'] = datetime.date.today().isoformat()
-                
-            if start_date == 'YTD':
-                values['start_date'] = f'{datetime.date.today().year}-01-01'
-                values['end_date'] = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
-        return values
+        return resolve_query_dates(values)
 
 class Order(BaseModel):
     """Information about a trading order."""
@@ -98,15 +93,35 @@ class Performances(BaseModel):
     """Extracted data about performance."""
     performances: List[PortfolioPerformance]
 
+class Extraction(BaseModel):
+    """Extracted data for a query that mixes orders, holdings and performance requests."""
+    orders: List[Order] = Field(default_factory=list)
+    holdings: List[PortfolioHolding] = Field(default_factory=list)
+    performances: List[PortfolioPerformance] = Field(default_factory=list)
+
+def merge_tool_results(results: List[BaseModel]) -> Extraction:
+    """Merge the Orders/Holdings/Performances tool calls of one response into an Extraction."""
+    merged = Extraction()
+    for result in results:
+        if isinstance(result, Orders):
+            merged.orders.extend(result.orders)
+        elif isinstance(result, Holdings):
+            merged.holdings.extend(result.holdings)
+        elif isinstance(result, Performances):
+            merged.performances.extend(result.performances)
+    return merged
+
 # Example handling
 class Example(TypedDict):
     """A representation of an example consisting of text input and expected tool calls."""
     input: str
     tool_calls: List[BaseModel]
 
-def tool_example_to_messages(example: Example) -> List[BaseMessage]:
+def tool_example_to_messages(example: Example) -> List["BaseMessage"]:
     """Convert an example into a list of messages that can be fed into an LLM."""
-    messages: List[BaseMessage] = [HumanMessage(content=example["input"])]
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+    messages: List["BaseMessage"] = [HumanMessage(content=example["input"])]
     openai_tool_calls = []
     for tool_call in example["tool_calls"]:
         openai_tool_calls.append(
@@ -175,97 +190,538 @@ portfolio_holdings_examples = [
 portfolio_performance_examples = [
     (
         "what are my returns in account capers, ushy",
-        PortfolioPerformance(accounts='capers,ushy', start_date='05-May-2024', end_date='02-May-2024'),
+        PortfolioPerformance(accounts='capers,ushy', start_date='02-May-2024', end_date='05-May-2024'),
     )
 ]
 
-# Convert examples to messages
-order_messages = []
-holding_messages = []
-performance_messages = []
+multi_intent_examples = [
+    (
+        "Buy 100 AAPL in account capers and show my holdings in account capers",
+        [
+            Orders(orders=[Order(action="buy", ticker="aapl", quantity=100, accounts=["capers"])]),
+            Holdings(holdings=[PortfolioHolding(ticker=None, accounts=['capers'], start_date='today', end_date=None, fields=['weight', 'price', 'mv', 'yield'])]),
+        ],
+    ),
+    (
+        "Sell 500 TSLA in account ushy and what are my returns in account ushy",
+        [
+            Orders(orders=[Order(action="sell", ticker="tsla", quantity=500, accounts=["ushy"])]),
+            Performances(performances=[PortfolioPerformance(accounts='ushy')]),
+        ],
+    ),
+]
+
+# System prompts per route
+HOLDING_SYSTEM_PROMPT = (
+    "You are an expert extraction algorithm. "
+    "Only extract relevant information from the text. "
+    "Extract portfolio holdings information from the given text "
+    "If you do not know the value of an attribute asked to extract, "
+    "return null for the attribute's value."
+)
+
+ORDER_SYSTEM_PROMPT = (
+    "You are an expert extraction algorithm. "
+    "Only extract relevant information from the text. "
+    "Extract order details information from the given text "
+    "If you do not know the value of an attribute asked to extract, "
+    "return null for the attribute's value."
+)
+
+PERFORMANCE_SYSTEM_PROMPT = (
+    "You are an expert extraction algorithm. "
+    "Only extract relevant information from the text. "
+    "Extract portfolio performance information from the given text "
+    "If you do not know the value of an attribute asked to extract, "
+    "return null for the attribute's value."
+)
+
+MULTI_INTENT_SYSTEM_PROMPT = (
+    "You are an expert extraction algorithm. "
+    "Only extract relevant information from the text. "
+    "The text may contain trading orders, portfolio holdings requests and "
+    "portfolio performance requests; call the matching tool once for each kind present "
+    "If you do not know the value of an attribute asked to extract, "
+    "return null for the attribute's value."
+)
+
+@dataclass(frozen=True)
+class RouteSpec:
+    """
+    Everything needed to build an extraction route on demand.
+
+    Routes with `tools` bind all of them in one request and merge the tool
+    calls into `schema`; other routes use structured output for `schema`.
+    """
+    examples_key: str
+    system_prompt: str
+    schema: Type[BaseModel]
+    examples: list
+    tools: tuple = ()
+
+# Route name -> specification
+ROUTES: Dict[str, RouteSpec] = {
+    "orders": RouteSpec("order_examples", ORDER_SYSTEM_PROMPT, Orders, order_examples),
+    "holdings": RouteSpec("portfolio_holdings_examples", HOLDING_SYSTEM_PROMPT, Holdings, portfolio_holdings_examples),
+    "performance": RouteSpec("portfolio_performance_examples", PERFORMANCE_SYSTEM_PROMPT, Performances, portfolio_performance_examples),
+    "multi": RouteSpec("multi_intent_examples", MULTI_INTENT_SYSTEM_PROMPT, Extraction, multi_intent_examples,
+                       tools=(Orders, Holdings, Performances)),
+}
 
-for text, tool_call in order_examples:
-    order_messages.extend(
-        tool_example_to_messages({"input": text, "tool_calls": [tool_call]})
+# Few-shot selection: examples per prompt and their total token budget
+FEW_SHOT_K = int(os.getenv("POMS_FEW_SHOT_K", "3"))
+FEW_SHOT_TOKEN_BUDGET = int(os.getenv("POMS_FEW_SHOT_TOKEN_BUDGET", "400"))
+
+# Process-wide resource registry
+_resources: Dict[tuple, Any] = {}
+_resources_lock = threading.RLock()
+
+def cached_resource(builder: Callable) -> Callable:
+    """
+    Build a resource once per process on first use.
+
+    Streamlit re-runs the app script on every interaction but keeps imported
+    modules, so resources held here are shared by all reruns and sessions.
+    """
+    @functools.wraps(builder)
+    def get(*args):
+        key = (builder.__name__,) + args
+        try:
+            return _resources[key]
+        except KeyError:
+            pass
+        with _resources_lock:
+            if key not in _resources:
+                _resources[key] = builder(*args)
+            return _resources[key]
+    return get
+
+def register_resource(getter: Callable, value: Any, *args):
+    """Install a resource up front, e.g. a stand-in LLM, instead of building it."""
+    with _resources_lock:
+        _resources[(getter.__name__,) + args] = value
+
+def reset_resources():
+    """Drop every cached resource so it is rebuilt on next use."""
+    with _resources_lock:
+        _resources.clear()
+
+@cached_resource
+def get_http_clients():
+    """Keep-alive HTTP connection pools shared by every OpenAI model in the process."""
+    return make_http_clients(
+        max_connections=int(os.getenv("POMS_HTTP_MAX_CONNECTIONS", "50")),
+        max_keepalive=int(os.getenv("POMS_HTTP_MAX_KEEPALIVE", "20")),
     )
-    
-for text, tool_call in portfolio_holdings_examples:
-    holding_messages.extend(
-        tool_example_to_messages({"input": text, "tool_calls": [tool_call]})
+
+@cached_resource
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide requests/tokens per minute limiter in front of every model call (0 disables a limit)."""
+    return RateLimiter(rpm=float(os.getenv("POMS_RPM", "500")), tpm=float(os.getenv("POMS_TPM", "200000")))
+
+def _chat_openai(**kwargs):
+    from langchain_openai import ChatOpenAI
+
+    http_client, http_async_client = get_http_clients()
+    return ChatOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, http_async_client=http_async_client, **kwargs)
+
+@cached_resource
+def get_llm():
+    """Initialize LLM."""
+    return _chat_openai()
+
+# Cascade of models, cheapest first: "model[:max_tokens],..."; "default" is get_llm().
+# The last tier should be the strongest model, since escalation only ever moves down the list
+MODEL_TIERS = os.getenv("POMS_MODEL_TIERS", "gpt-4o-mini:512,gpt-4o")
+
+@cached_resource
+def get_model_tiers() -> List[ModelTier]:
+    """Build the models of the extraction cascade."""
+    tiers = []
+    for name, max_tokens in parse_tier_spec(MODEL_TIERS):
+        if name == "default":
+            tiers.append(ModelTier(name, get_llm()))
+        else:
+            tiers.append(ModelTier(name, _chat_openai(model=name, max_tokens=max_tokens)))
+    return tiers or [ModelTier("default", get_llm())]
+
+@cached_resource
+def get_reference_index() -> Optional[ReferenceIndex]:
+    """Load the account and security reference data, if present."""
+    return load_default_index()
+
+@cached_resource
+def get_example_message_groups(route: str) -> List[List["BaseMessage"]]:
+    """Convert each of a route's examples to its own list of few-shot messages."""
+    spec = ROUTES[route]
+    groups = []
+    for text, tool_calls in spec.examples:
+        if not isinstance(tool_calls, list):
+            # Single-intent routes call their collection schema, so show the example wrapped in it
+            collection_field = next(iter(spec.schema.model_fields))
+            tool_calls = [spec.schema.model_validate({collection_field: [tool_calls]})]
+        groups.append(
+            tool_example_to_messages({"input": text, "tool_calls": tool_calls})
+        )
+    return groups
+
+@cached_resource
+def get_example_messages(route: str) -> List["BaseMessage"]:
+    """Convert all of a route's examples to few-shot messages."""
+    return [message for group in get_example_message_groups(route) for message in group]
+
+@cached_resource
+def get_example_selector(route: str) -> ExampleSelector:
+    """Index a route's example inputs for few-shot selection."""
+    costs = [
+        sum(estimate_tokens(str(message.content) + json.dumps(message.additional_kwargs)) for message in group)
+        for group in get_example_message_groups(route)
+    ]
+    return ExampleSelector(
+        [text for text, _ in ROUTES[route].examples],
+        costs,
+        k=FEW_SHOT_K,
+        token_budget=FEW_SHOT_TOKEN_BUDGET,
     )
 
-for text, tool_call in portfolio_performance_examples:
-    performance_messages.extend(
-        tool_example_to_messages({"input": text, "tool_calls": [tool_call]})
+def select_example_messages(route: str, text: str) -> List["BaseMessage"]:
+    """Few-shot messages of the examples most similar to the query, within the token budget."""
+    groups = get_example_message_groups(route)
+    return [message for i in get_example_selector(route).select(text) for message in groups[i]]
+
+def route_inputs(route: str, text: str) -> Dict[str, Any]:
+    """Prompt variables for a route: the query and its selected few-shot examples."""
+    return {ROUTES[route].examples_key: select_example_messages(route, text), "text": text}
+
+@cached_resource
+def get_prompt(route: str):
+    """Create the prompt for a route."""
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    spec = ROUTES[route]
+    return ChatPromptTemplate.from_messages([
+        ("system", spec.system_prompt),
+        MessagesPlaceholder(spec.examples_key),
+        ("human", "{text}"),
+    ])
+
+def build_runnable(route: str, llm):
+    """Create the structured-output runnable for a route on one model, behind the rate limiter."""
+    spec = ROUTES[route]
+    gate = get_rate_limiter().as_runnable(
+        lane=LANES.get(route, DEFAULT_LANE),
+        completion_tokens=getattr(llm, "max_tokens", None) or 256,
+        on_wait=lambda seconds: tracer.observe("queue", seconds),
     )
+    if spec.tools:
+        from langchain_core.output_parsers.openai_tools import PydanticToolsParser
 
-# Create prompts
-holding_prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        "You are an expert extraction algorithm. "
-        "Only extract relevant information from the text. "
-        "When user inputs today, convert it to system date "
-        "Extract portfolio holdings information from the given text "
-        "If you do not know the value of an attribute asked to extract, "
-        "return null for the attribute's value.",
-    ),
-    MessagesPlaceholder('portfolio_holdings_examples'),
-    ("human", "{text}"),
-])
+        tools = list(spec.tools)
+        return (
+            get_prompt(route)
+            | gate
+            | llm.bind_tools(tools, tool_choice="required")
+            | PydanticToolsParser(tools=tools)
+            | merge_tool_results
+        )
+    return get_prompt(route) | gate | llm.with_structured_output(
+        schema=spec.schema,
+        method='function_calling',
+        include_raw=False
+    )
 
-order_prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        "You are an expert extraction algorithm. "
-        "Only extract relevant information from the text. "
-        "Extract order details information from the given text "
-        "If you do not know the value of an attribute asked to extract, "
-        "return null for the attribute's value.",
-    ),
-    MessagesPlaceholder('order_examples'),
-    ("human", "{text}"),
-])
+@cached_resource
+def get_runnable(route: str):
+    """Create the runnable for a route: the model cascade over build_runnable per tier."""
+    return Cascade(
+        [(tier.name, build_runnable(route, tier.llm)) for tier in get_model_tiers()],
+        cascade_stats,
+    ).as_runnable()
 
-performance_prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        "You are an expert extraction algorithm. "
-        "Only extract relevant information from the text. "
-        "Extract portfolio performance information from the given text "
-        "If you do not know the value of an attribute asked to extract, "
-        "return null for the attribute's value.",
-    ),
-    MessagesPlaceholder('portfolio_performance_examples'),
-    ("human", "{text}"),
-])
-
-# Create runnables
-order_runnable = order_prompt | llm.with_structured_output(
-    schema=Orders,
-    method='function_calling',
-    include_raw=False
-)
+@cached_resource
+def get_delta_runnable():
+    """Create the follow-up runnable: previous result + message -> FollowUpDelta, on the cheapest model."""
+    from langchain_core.prompts import ChatPromptTemplate
 
-portfolio_holding_runnable = holding_prompt | llm.with_structured_output(
-    schema=Holdings,
-    method='function_calling',
-    include_raw=False
+    llm = get_model_tiers()[0].llm
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", FOLLOW_UP_SYSTEM_PROMPT),
+        ("human", "Previous result: {previous}\nFollow-up: {text}"),
+    ])
+    gate = get_rate_limiter().as_runnable(
+        lane=LANES.get("follow_up", DEFAULT_LANE),
+        completion_tokens=getattr(llm, "max_tokens", None) or 256,
+        on_wait=lambda seconds: tracer.observe("queue", seconds),
+    )
+    return prompt | gate | llm.with_structured_output(schema=FollowUpDelta, method='function_calling', include_raw=False)
+
+# Module attributes kept for callers of the former eagerly-built objects
+_LAZY_ATTRIBUTES = {
+    "llm": get_llm,
+    "order_messages": functools.partial(get_example_messages, "orders"),
+    "holding_messages": functools.partial(get_example_messages, "holdings"),
+    "performance_messages": functools.partial(get_example_messages, "performance"),
+    "order_prompt": functools.partial(get_prompt, "orders"),
+    "holding_prompt": functools.partial(get_prompt, "holdings"),
+    "performance_prompt": functools.partial(get_prompt, "performance"),
+    "order_runnable": functools.partial(get_runnable, "orders"),
+    "portfolio_holding_runnable": functools.partial(get_runnable, "holdings"),
+    "portfolio_performance_runnable": functools.partial(get_runnable, "performance"),
+    "multi_intent_runnable": functools.partial(get_runnable, "multi"),
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Extraction cache
+extraction_cache = ExtractionCache(
+    models=(Orders, Holdings, Performances, Extraction),
+    path=os.getenv("POMS_CACHE_PATH", os.path.join(".poms_cache", "extractions.sqlite3")) or None,
+    max_entries=int(os.getenv("POMS_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("POMS_CACHE_TTL", str(7 * 24 * 3600))),
+    # Missing start dates default to today, so these results age with the calendar
+    date_sensitive_routes=("holdings", "performance", "multi"),
 )
 
-portfolio_performance_runnable = performance_prompt | llm.with_structured_output(
-    schema=Performances,
-    method='function_calling',
-    include_raw=False
+# Rule-based extractor tried before the LLM
+fast_path = FastPathParser(threshold=float(os.getenv("POMS_FAST_PATH_THRESHOLD", "1.0")))
+
+cascade_stats = CascadeStats()
+
+# Deadlines ("route=seconds,..." overrides), hedging, retries and the circuit breaker around LLM calls
+resilience = Resilience(
+    ResiliencePolicy(
+        deadline=float(os.getenv("POMS_DEADLINE", "20")),
+        route_deadlines=parse_deadlines(os.getenv("POMS_ROUTE_DEADLINES", "")),
+        hedge_percentile=float(os.getenv("POMS_HEDGE_PERCENTILE", "0.95")),
+        retries=int(os.getenv("POMS_RETRIES", "2")),
+    ),
+    CircuitBreaker(
+        error_rate=float(os.getenv("POMS_BREAKER_ERROR_RATE", "0.5")),
+        cooldown=float(os.getenv("POMS_BREAKER_COOLDOWN", "30")),
+    ),
 )
 
-def route_input_and_extract(text):
-    """Route input text to appropriate extraction pipeline."""
-    if "buy" in text.lower() or "sell" in text.lower() or ("increase" in text.lower() or "decrease" in text.lower()):
-        return order_runnable.invoke({"order_examples": [], "text": text})
-    elif any(keyword in text.lower() for keyword in ["hold", "position", "exposure", "yield", "duration"]):
-        return portfolio_holding_runnable.invoke({"portfolio_holdings_examples": [], "text": text})
-    elif any(keyword in text.lower() for keyword in ["performance", "return"]):
-        return portfolio_performance_runnable.invoke({"portfolio_performance_examples": [], "text": text})
-    else:
+# Per-stage timings of every extraction, appended to a JSONL file (empty path: memory only)
+tracer = Tracer(os.getenv("POMS_TRACE_PATH", os.path.join(".poms_data", "traces.jsonl")) or None)
+
+@cached_resource
+def route_version(route: str) -> str:
+    """
+    Hash of the models, prompt and schema behind a route, used to invalidate cached results.
+
+    Built from the POMS_MODEL_TIERS spec rather than the model clients, so
+    cache and fast-path hits never need an LLM client (or credentials).
+    """
+    fingerprint = json.dumps(
+        [
+            parse_tier_spec(MODEL_TIERS),
+            get_prompt(route).pretty_repr(),
+            ROUTES[route].schema.model_json_schema(),
+            [text for text, _ in ROUTES[route].examples],
+            [FEW_SHOT_K, FEW_SHOT_TOKEN_BUDGET],
+            getattr(get_reference_index(), "version", None),
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+# Compiled intent lexicon; ambiguous queries go to their leading intent, ties to POMS_ROUTE_FALLBACK (unset or "none" leaves them unrouted)
+_route_fallback = os.getenv("POMS_ROUTE_FALLBACK", "").strip()
+intent_classifier = IntentClassifier(fallback=None if _route_fallback.lower() in ("", "none") else _route_fallback)
+
+def classify_intents(text):
+    """Return every single-intent route the input text asks for, in ROUTES order."""
+    return list(intent_classifier.classify(text).intents)
+
+def classify_route(text):
+    """
+    Return the name of the extraction route for the input text, or None.
+
+    Queries with more than one intent go to the "multi" route, which extracts
+    every part in a single LLM call; ambiguous ones go to the route of their
+    leading intent, or the fallback route when intents tie.
+    """
+    return intent_classifier.classify(text).route
+
+def _local_result(text, route, use_cache, use_fast_path):
+    """Answer a query from the cache or the fast-path parser, without calling the LLM."""
+    if use_cache:
+        with tracer.timed("cache"):
+            cached = extraction_cache.get(text, route, route_version(route))
+        if cached is not None:
+            tracer.annotate(outcome="cache")
+            return cached
+
+    if use_fast_path:
+        with tracer.timed("fast_path"):
+            result = _fast_path_result(text, route)
+        if result is not None:
+            tracer.annotate(outcome="fast_path")
+            return result
+    return None
+
+def _fast_path_result(text, route, threshold=None):
+    """
+    A fast-path parse validated and resolved against the reference data, or None.
+
+    A parse whose names do not resolve ("in account capers and msft" read as
+    two accounts) is rejected rather than raised, so the model gets the query.
+    Without reference data such names cannot be checked, so a parse listing
+    several accounts is rejected too.
+    """
+    parsed = fast_path.parse(text, route, threshold=threshold)
+    if parsed is None:
+        return None
+    index = get_reference_index()
+    if index is None and any(len(item.get("accounts") or []) > 1 for items in parsed.payload.values() for item in items):
+        fast_path.reject()
+        return None
+    try:
+        return resolve_references(ROUTES[route].schema.model_validate(parsed.payload), index)
+    except UnresolvedReferenceError:
+        fast_path.reject()
         return None
+
+def _degraded_result(text, route, error, use_cache, use_fast_path):
+    """
+    Answer without the LLM after a provider failure: a stale cached result,
+    else a fast-path parse at any confidence. Re-raises the error when
+    neither is available or the failure was unusable model output.
+    """
+    if not is_retryable(error):
+        raise error
+    result = None
+    if use_cache:
+        result = extraction_cache.get(text, route, route_version(route), stale=True)
+    if result is None and use_fast_path:
+        result = _fast_path_result(text, route, threshold=0.0)
+    if result is None:
+        raise error
+    resilience.count(degraded=1)
+    tracer.annotate(outcome="degraded", error=type(error).__name__)
+    return result
+
+def _finish(text, route, result, use_cache):
+    """Post-extraction stages for an LLM result: reference resolution, then caching."""
+    with tracer.timed("finish"):
+        result = resolve_references(result, get_reference_index())
+        if use_cache:
+            extraction_cache.put(text, route, route_version(route), result)
+    tracer.annotate(outcome="llm")
+    return result
+
+def _classify(text):
+    """classify_route, timed and recorded on the current trace."""
+    with tracer.timed("route"):
+        route = classify_route(text)
+    tracer.annotate(route=route, outcome=None if route else "unrouted")
+    return route
+
+async def aroute_input_and_extract(text, use_cache=True, use_fast_path=True):
+    """Route input text to the appropriate extraction pipeline, awaiting the runnables' ainvoke."""
+    with tracer.trace(text) as trace:
+        route = _classify(text)
+        if route is None:
+            return None
+
+        result = _local_result(text, route, use_cache, use_fast_path)
+        if result is not None:
+            return result
+
+        runnable, inputs = get_runnable(route), route_inputs(route, text)
+        config = {"callbacks": [tracer.callback(trace)]}
+        try:
+            with tracer.timed("extract"):
+                result = await resilience.acall(route, lambda: runnable.ainvoke(inputs, config))
+        except Exception as e:
+            return _degraded_result(text, route, e, use_cache, use_fast_path)
+        return _finish(text, route, result, use_cache)
+
+def route_input_and_extract(text, use_cache=True, use_fast_path=True):
+    """Sync wrapper of aroute_input_and_extract, run on the shared event loop."""
+    return run_sync(aroute_input_and_extract(text, use_cache, use_fast_path))
+
+def new_conversation() -> Conversation:
+    """A session's follow-up state, extracting from scratch with aroute_input_and_extract."""
+    return Conversation(
+        aroute_input_and_extract,
+        intent_classifier,
+        get_delta_runnable,
+        resilience,
+        tracer,
+        reference_index=get_reference_index,
+    )
+
+@dataclass
+class BatchResult:
+    """Outcome of route_many: one slot per input text, in input order."""
+    results: List[Optional[BaseModel]]
+    errors: Dict[int, Exception] = field(default_factory=dict)
+
+    @property
+    def successes(self) -> Dict[int, BaseModel]:
+        """Results that were extracted, keyed by input index."""
+        return {i: result for i, result in enumerate(self.results) if result is not None}
+
+def _extract_blocking(text, use_cache, use_fast_path):
+    """aroute_input_and_extract for a worker thread: the same stages and trace, with a blocking invoke."""
+    with tracer.trace(text) as trace:
+        route = _classify(text)
+        if route is None:
+            return None
+
+        result = _local_result(text, route, use_cache, use_fast_path)
+        if result is not None:
+            return result
+
+        runnable, inputs = get_runnable(route), route_inputs(route, text)
+        config = {"callbacks": [tracer.callback(trace)]}
+        try:
+            with tracer.timed("extract"):
+                result = resilience.call(route, lambda: runnable.invoke(inputs, config))
+        except Exception as e:
+            return _degraded_result(text, route, e, use_cache, use_fast_path)
+        return _finish(text, route, result, use_cache)
+
+def route_many(texts, max_concurrency=8, use_cache=True, use_fast_path=True):
+    """
+    Route and extract many texts at once.
+
+    Every text, whatever its route, goes through one pool of max_concurrency
+    workers in input order, so routes progress in proportion to their size and
+    the limit on LLM calls in flight holds across all of them (hedged requests
+    aside). Each text is traced and extracted as route_input_and_extract
+    would: answered locally where possible, otherwise through the resilience
+    layer's deadline, retries and hedging, falling back to the degraded path
+    on provider failures.
+
+    Args:
+        texts: Query texts to extract
+        max_concurrency: Upper bound on LLM calls in flight
+        use_cache: Whether to read and write the extraction cache
+        use_fast_path: Whether to try the rule-based parser first
+
+    Returns:
+        BatchResult with results in input order and per-item errors by index
+
+    Raises:
+        ValueError: If max_concurrency is less than 1
+    """
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+    batch = BatchResult(results=[None] * len(texts))
+    if not texts:
+        return batch
+
+    def run_item(i):
+        try:
+            batch.results[i] = _extract_blocking(texts[i], use_cache, use_fast_path)
+        except Exception as e:
+            batch.errors[i] = e
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(texts))) as executor:
+        list(executor.map(run_item, range(len(texts))))
+    return batch
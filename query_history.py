@@ -0,0 +1,89 @@
+"""
+Query history for P.O.M.S - Portfolio and OMS System
+
+Keeps each session's processed results, with their timings and the data
+fetched for them, so the app can re-render them on every Streamlit rerun
+and let users browse earlier results without extracting or fetching again.
+The history is bounded both by entry count and by the approximate size of
+the stored results and data.
+"""
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from extraction_cache import normalize_query
+
+@dataclass
+class HistoryEntry:
+    """One processed query."""
+    query: str
+    result: Any
+    elapsed: float
+    error: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+    size: int = 0
+    # Data fetched for the result (e.g. utils.ResultData), shown without fetching again
+    data: Any = None
+    # Identifies this run of the query; scopes the idempotency keys of its orders
+    submission_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+def estimate_size(result: Any) -> int:
+    """Approximate memory held by a result, measured as its JSON length."""
+    if result is None:
+        return 0
+    if hasattr(result, "model_dump_json"):
+        return len(result.model_dump_json())
+    return len(repr(result))
+
+class QueryHistory:
+    """Most recent results keyed by normalized query text, evicting the oldest first."""
+
+    def __init__(self, max_entries: int = 50, max_bytes: int = 5_000_000):
+        """
+        Args:
+            max_entries: Most queries kept
+            max_bytes: Most result and data bytes (as estimated by estimate_size and nbytes) kept
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries: "OrderedDict[str, HistoryEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, query: str) -> bool:
+        return normalize_query(query) in self._entries
+
+    def add(self, query: str, result: Any, elapsed: float, error: Optional[str] = None, data: Any = None) -> HistoryEntry:
+        """
+        Record a processed query, replacing an earlier entry for the same text.
+
+        Fetched data counts towards the byte budget by its nbytes, if it has one.
+        """
+        key = normalize_query(query)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old.size
+        size = estimate_size(result) + getattr(data, "nbytes", 0)
+        entry = HistoryEntry(query, result, elapsed, error, size=size, data=data)
+        self._entries[key] = entry
+        self.nbytes += entry.size
+        # Always keep the newest entry, even if it alone exceeds the byte budget
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.size
+        return entry
+
+    def get(self, query: str) -> Optional[HistoryEntry]:
+        return self._entries.get(normalize_query(query))
+
+    def entries(self) -> List[HistoryEntry]:
+        """Entries, newest first."""
+        return list(reversed(self._entries.values()))
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
@@ -0,0 +1,382 @@
+"""
+Account and ticker reference data for P.O.M.S - Portfolio and OMS System
+
+Loads the account and security masters from local CSV/Parquet files into
+tries, so extracted names can be canonicalized in O(length) per token,
+'ALL' expanded to the real account list and tickers validated before results
+reach downstream consumers. Accounts must match a code or name exactly;
+near misses are reported as suggestions rather than silently corrected.
+
+The masters in POMS_REFERENCE_DIR are used when it is set. Otherwise the
+master is built from the book itself: the accounts in the holdings store and
+performance history, and the tickers held. Such a master only knows the
+securities already held, so it canonicalizes tickers but does not reject new
+ones. The small demo master in data/ is used for seeding demo data only.
+"""
+import csv
+import hashlib
+import json
+import os
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+class UnresolvedReferenceError(ValueError):
+    """Raised when extracted accounts or tickers are not in the reference data."""
+
+    def __init__(
+        self,
+        accounts: Sequence[str] = (),
+        tickers: Sequence[str] = (),
+        suggestions: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.accounts = list(accounts)
+        self.tickers = list(tickers)
+        self.suggestions = dict(suggestions or {})
+        parts = []
+        if self.accounts:
+            names = [
+                f"{name} (did you mean {' or '.join(self.suggestions[name])}?)" if self.suggestions.get(name) else name
+                for name in self.accounts
+            ]
+            parts.append(f"unknown account(s): {', '.join(names)}")
+        if self.tickers:
+            parts.append(f"unknown ticker(s): {', '.join(self.tickers)}")
+        super().__init__("; ".join(parts))
+
+def normalize_name(name: str) -> str:
+    """Lookup key for a name: lower case, single spaces, no surrounding quotes or punctuation."""
+    return " ".join(name.lower().strip(" \t'\".,;").split())
+
+class Trie:
+    """
+    Character trie with values held in a compact int array.
+
+    Node i's children are in `_edges[i]` and its value (an index into the
+    caller's name table, or -1) in `_values[i]`.
+    """
+
+    def __init__(self):
+        self._edges: List[Dict[str, int]] = [{}]
+        self._values = array("i", [-1])
+
+    def insert(self, key: str, value: int):
+        node = 0
+        for char in key:
+            child = self._edges[node].get(char)
+            if child is None:
+                child = len(self._edges)
+                self._edges[node][char] = child
+                self._edges.append({})
+                self._values.append(-1)
+            node = child
+        self._values[node] = value
+
+    def _walk(self, key: str) -> int:
+        node = 0
+        for char in key:
+            node = self._edges[node].get(char, -1)
+            if node < 0:
+                return -1
+        return node
+
+    def get(self, key: str) -> int:
+        """Value stored for key, or -1."""
+        node = self._walk(key)
+        return self._values[node] if node >= 0 else -1
+
+    def completions(self, prefix: str, limit: int = 2) -> List[int]:
+        """Up to `limit` distinct values stored under a prefix."""
+        start = self._walk(prefix)
+        if start < 0:
+            return []
+        found: List[int] = []
+        stack = [start]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            value = self._values[node]
+            if value >= 0 and value not in found:
+                found.append(value)
+            stack.extend(self._edges[node].values())
+        return found
+
+    def fuzzy(self, key: str, max_distance: int) -> List[Tuple[int, int]]:
+        """(distance, value) pairs within a Levenshtein distance, closest first."""
+        results: List[Tuple[int, int]] = []
+        first_row = list(range(len(key) + 1))
+
+        def search(node: int, char: str, previous_row: List[int]):
+            row = [previous_row[0] + 1]
+            for column in range(1, len(key) + 1):
+                row.append(min(
+                    row[column - 1] + 1,
+                    previous_row[column] + 1,
+                    previous_row[column - 1] + (key[column - 1] != char),
+                ))
+            if row[-1] <= max_distance and self._values[node] >= 0:
+                results.append((row[-1], self._values[node]))
+            if min(row) <= max_distance:
+                for next_char, child in self._edges[node].items():
+                    search(child, next_char, row)
+
+        for char, child in self._edges[0].items():
+            search(child, char, first_row)
+        return sorted(results)
+
+def _read_rows(path: str) -> List[Dict[str, str]]:
+    """Rows of a CSV or Parquet reference file."""
+    if path.endswith(".parquet"):
+        import pandas as pd
+
+        return pd.read_parquet(path).fillna("").astype(str).to_dict("records")
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+def _fuzzy_distance(key: str) -> int:
+    """Edit distance allowed for a token; short codes must match exactly."""
+    if len(key) <= 3:
+        return 0
+    return 1 if len(key) <= 6 else 2
+
+class ReferenceIndex:
+    """In-memory index of accounts and securities."""
+
+    def __init__(
+        self,
+        accounts: Sequence[str],
+        tickers: Sequence[str],
+        account_names: Optional[Dict[str, str]] = None,
+        security_names: Optional[Dict[str, str]] = None,
+        version: str = "",
+        validate_tickers: bool = True,
+    ):
+        """
+        Args:
+            accounts: Canonical account codes
+            tickers: Canonical tickers
+            account_names: Descriptive name per account code, also accepted as input
+            security_names: Issuer name per ticker, also accepted as input
+            version: Fingerprint of the source data
+            validate_tickers: Whether tickers outside `tickers` are errors; when False
+                they pass through upper-cased
+        """
+        self.accounts = tuple(accounts)
+        self.tickers = tuple(tickers)
+        self.version = version
+        self.validate_tickers = validate_tickers
+        self._account_trie = Trie()
+        self._ticker_trie = Trie()
+        self._security_name_trie = Trie()
+        for i, account in enumerate(self.accounts):
+            self._account_trie.insert(normalize_name(account), i)
+        for account, name in (account_names or {}).items():
+            if name and account in self.accounts:
+                self._account_trie.insert(normalize_name(name), self.accounts.index(account))
+        for i, ticker in enumerate(self.tickers):
+            self._ticker_trie.insert(normalize_name(ticker), i)
+        for ticker, name in (security_names or {}).items():
+            if name and ticker in self.tickers:
+                self._security_name_trie.insert(normalize_name(name), self.tickers.index(ticker))
+
+    @classmethod
+    def from_files(cls, accounts_path: str, securities_path: str) -> "ReferenceIndex":
+        """Load the account master (account,name) and security master (ticker,name)."""
+        account_rows = _read_rows(accounts_path)
+        security_rows = _read_rows(securities_path)
+        digest = hashlib.sha256()
+        for path in (accounts_path, securities_path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        return cls(
+            accounts=[row["account"].strip() for row in account_rows],
+            tickers=[row["ticker"].strip().upper() for row in security_rows],
+            account_names={row["account"].strip(): row.get("name", "") for row in account_rows},
+            security_names={row["ticker"].strip().upper(): row.get("name", "") for row in security_rows},
+            version=digest.hexdigest()[:16],
+        )
+
+    @classmethod
+    def from_book(cls, accounts: Iterable[str], tickers: Iterable[str]) -> "ReferenceIndex":
+        """A master of the accounts and tickers found in the book; new tickers are let through."""
+        accounts = list(dict.fromkeys(accounts))
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        digest = hashlib.sha256(json.dumps([accounts, tickers]).encode())
+        return cls(accounts, tickers, version="book-" + digest.hexdigest()[:16], validate_tickers=False)
+
+    @staticmethod
+    def _match(trie: Trie, key: str, allow_fuzzy: bool = True) -> int:
+        """Exact, then unique-prefix, then unique closest fuzzy match."""
+        value = trie.get(key)
+        if value >= 0 or not key:
+            return value
+        if len(key) >= 3:
+            completions = trie.completions(key)
+            if len(completions) == 1:
+                return completions[0]
+        max_distance = _fuzzy_distance(key)
+        if allow_fuzzy and max_distance:
+            matches = trie.fuzzy(key, max_distance)
+            if matches and (len(matches) == 1 or matches[0][0] < matches[1][0]):
+                return matches[0][1]
+        return -1
+
+    def resolve_account(self, name: str) -> Optional[str]:
+        """Canonical account code for an exact code or name, or None."""
+        i = self._account_trie.get(normalize_name(name))
+        return self.accounts[i] if i >= 0 else None
+
+    def suggest_accounts(self, name: str, limit: int = 3) -> List[str]:
+        """Account codes close to an unknown name (prefix or small edit distance), closest first."""
+        key = normalize_name(name)
+        if not key:
+            return []
+        found: List[int] = []
+        max_distance = _fuzzy_distance(key)
+        if max_distance:
+            found.extend(i for _, i in self._account_trie.fuzzy(key, max_distance))
+        if len(key) >= 3:
+            found.extend(self._account_trie.completions(key, limit))
+        return [self.accounts[i] for i in dict.fromkeys(found)][:limit]
+
+    def resolve_accounts(self, names: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """
+        Canonicalize a list of account names, expanding 'ALL'.
+
+        Returns:
+            (resolved account codes without duplicates, names that did not resolve)
+        """
+        resolved: List[str] = []
+        unresolved: List[str] = []
+        for name in names:
+            if normalize_name(name) in ("all", "all accounts"):
+                candidates = list(self.accounts)
+            else:
+                account = self.resolve_account(name)
+                if account is None:
+                    unresolved.append(name)
+                    continue
+                candidates = [account]
+            resolved.extend(account for account in candidates if account not in resolved)
+        return resolved, unresolved
+
+    def resolve_ticker(self, ticker: str) -> Optional[str]:
+        """Canonical ticker for a ticker or issuer name, or None."""
+        key = normalize_name(ticker)
+        i = self._ticker_trie.get(key)
+        if i < 0:
+            i = self._match(self._security_name_trie, key)
+        return self.tickers[i] if i >= 0 else None
+
+def _split(value: str) -> List[str]:
+    return [part for part in re.split(r"\s*,\s*|\s+and\s+", value.strip()) if part]
+
+def resolve_references(result, index: Optional[ReferenceIndex]):
+    """
+    Canonicalize accounts and tickers of an extraction result in place.
+
+    Works on Orders, Holdings, Performances and multi-intent results alike.
+    None accounts (meaning all accounts) are left as they are, and without an
+    index (no master configured) the whole result is.
+
+    Raises:
+        UnresolvedReferenceError: If any account or ticker is not in the reference data
+    """
+    if index is None or result is None:
+        return result
+    unknown_accounts: List[str] = []
+    unknown_tickers: List[str] = []
+    suggestions: Dict[str, List[str]] = {}
+    items = [
+        *(getattr(result, "orders", None) or []),
+        *(getattr(result, "holdings", None) or []),
+        *(getattr(result, "performances", None) or []),
+    ]
+    for item in items:
+        accounts = getattr(item, "accounts", None)
+        if accounts:
+            # PortfolioPerformance.accounts is a comma-joined string
+            names = _split(accounts) if isinstance(accounts, str) else accounts
+            resolved, unresolved = index.resolve_accounts(names)
+            unknown_accounts.extend(unresolved)
+            for name in unresolved:
+                suggestions[name] = index.suggest_accounts(name)
+            item.accounts = ",".join(resolved) if isinstance(accounts, str) else resolved
+
+        ticker = getattr(item, "ticker", None)
+        if ticker:
+            tickers = []
+            for part in _split(ticker):
+                canonical = index.resolve_ticker(part)
+                if canonical is None and not index.validate_tickers:
+                    canonical = part.upper()
+                if canonical is None:
+                    unknown_tickers.append(part)
+                else:
+                    tickers.append(canonical)
+            item.ticker = ",".join(tickers)
+
+    if unknown_accounts or unknown_tickers:
+        raise UnresolvedReferenceError(unknown_accounts, unknown_tickers, suggestions)
+    return result
+
+# Demo masters shipped with the repo, for seeding demo holdings and returns
+DEMO_REFERENCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+def load_default_index() -> Optional[ReferenceIndex]:
+    """
+    Load the masters in POMS_REFERENCE_DIR, or else build one from the book.
+
+    Returns:
+        The index, or None when no master is configured and the book is empty
+        (names are then not validated)
+    """
+    if os.getenv("POMS_REFERENCE_DIR", "").strip():
+        return load_configured_index()
+    return load_book_index()
+
+def load_configured_index() -> Optional[ReferenceIndex]:
+    """Load the masters in POMS_REFERENCE_DIR, or None when it is not set."""
+    directory = os.getenv("POMS_REFERENCE_DIR", "").strip()
+    return load_index(directory) if directory else None
+
+def load_book_index(
+    holdings_root: Optional[str] = None, performance_path: Optional[str] = None
+) -> Optional[ReferenceIndex]:
+    """
+    Build a master from the accounts and tickers of the holdings store and the performance history.
+
+    Args:
+        holdings_root: Holdings store directory (default: holdings_store.default_root())
+        performance_path: Performance history file (default: performance_engine.default_path())
+
+    Returns:
+        The index, or None when neither holds any account
+    """
+    from holdings_store import Dictionary, default_root
+    from performance_engine import default_path
+
+    holdings_root = default_root() if holdings_root is None else holdings_root
+    performance_path = default_path() if performance_path is None else performance_path
+    accounts: List[str] = []
+    tickers: List[str] = []
+    dictionaries = os.path.join(holdings_root, "dictionary") if holdings_root else ""
+    if dictionaries and os.path.isdir(dictionaries):
+        accounts.extend(Dictionary(os.path.join(dictionaries, "accounts.json")).values)
+        tickers.extend(Dictionary(os.path.join(dictionaries, "tickers.json")).values)
+    if performance_path and os.path.exists(performance_path):
+        import numpy as np
+
+        with np.load(performance_path) as data:
+            accounts.extend(str(account) for account in data["accounts"])
+    if not accounts:
+        return None
+    return ReferenceIndex.from_book(accounts, tickers)
+
+def load_index(directory: str) -> Optional[ReferenceIndex]:
+    """Load accounts/securities .parquet or .csv masters from a directory, or None if they are missing."""
+    for accounts_file, securities_file in (("accounts.parquet", "securities.parquet"), ("accounts.csv", "securities.csv")):
+        accounts_path = os.path.join(directory, accounts_file)
+        securities_path = os.path.join(directory, securities_file)
+        if os.path.exists(accounts_path) and os.path.exists(securities_path):
+            return ReferenceIndex.from_files(accounts_path, securities_path)
+    return None
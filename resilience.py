@@ -0,0 +1,421 @@
+"""
+Resilient LLM calls for P.O.M.S - Portfolio and OMS System
+
+Every extraction call runs under a per-route deadline. When a call is still
+running after a high percentile of the route's recent latencies, a duplicate
+(hedged) request is started and whichever answers first is used. Provider
+errors are retried with jittered exponential backoff while the deadline
+allows, and a circuit breaker opens when the recent error rate spikes so
+that, during a provider brownout, calls fail fast with CircuitOpenError and
+callers can fall back to a degraded answer (a stale cached result or a
+low-confidence fast-path parse) instead of waiting out every timeout.
+
+Only transient provider failures (dropped connections, timeouts, rate limits
+and 5xx answers) are retried and counted against the breaker. Anything else,
+such as unusable model output, a request the provider rejected or a bug in
+the caller, fails at once. StubChatModel's failure_rate and slow_rate options inject provider
+errors and slow responses to exercise all of this offline.
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import openai
+
+class DeadlineExceeded(TimeoutError):
+    """A call did not finish within its route's deadline."""
+
+class CircuitOpenError(RuntimeError):
+    """The circuit breaker is open, so the call was not attempted."""
+
+# HTTP statuses of a provider answer worth another attempt, besides 5xx
+RETRYABLE_STATUSES = frozenset({408, 429})
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether an error is a transient provider failure: a dropped connection, a
+    timeout, a rate limit or server error, or an open circuit breaker.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError, openai.APIConnectionError, CircuitOpenError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+def parse_deadlines(spec: str) -> Dict[str, float]:
+    """Parse "route=seconds,..." into per-route deadlines."""
+    deadlines = {}
+    for part in spec.split(","):
+        route, _, seconds = part.partition("=")
+        if route.strip() and seconds.strip():
+            deadlines[route.strip()] = float(seconds)
+    return deadlines
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker over a sliding window of call outcomes.
+
+    Closed: calls pass and outcomes are recorded. Once the window holds at
+    least `min_calls` outcomes and the failure share reaches `error_rate`,
+    the breaker opens and rejects calls for `cooldown` seconds. It then lets
+    a single probe through (half-open); the probe's outcome closes or reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        error_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        cooldown: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            error_rate: Failure share of the window that opens the breaker
+            window: Most recent outcomes considered
+            min_calls: Outcomes needed before the breaker may open
+            cooldown: Seconds the breaker stays open before probing
+            clock: Monotonic time source, replaceable in tests
+        """
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self.trips = 0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are currently being rejected."""
+        with self._lock:
+            return self.state == self.OPEN and self.clock() - self._opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead; in half-open state only one probe is let through."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.cooldown:
+                    return False
+                self.state, self._probing = self.HALF_OPEN, False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok: bool):
+        """Record one call outcome."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                self._trip()
+
+    def _trip(self):
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+        self.trips += 1
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._outcomes.clear()
+            self._probing = False
+            self.trips = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = len(self._outcomes)
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "recent_calls": recent,
+                "recent_error_rate": self._outcomes.count(False) / recent if recent else 0.0,
+            }
+
+class LatencyTracker:
+    """Recent successful call latencies per route."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Args:
+            window: Latencies kept per route
+            min_samples: Latencies needed before percentiles are reported
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, route: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(route, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, route: str, q: float) -> Optional[float]:
+        """The q-quantile (0..1) of a route's recent latencies, or None with too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(route, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+@dataclass
+class ResiliencePolicy:
+    """Deadlines, hedging and retry settings."""
+    deadline: float = 20.0
+    """Seconds allowed per call, including retries, unless the route has its own."""
+    route_deadlines: Dict[str, float] = field(default_factory=dict)
+    hedge_percentile: float = 0.95
+    """Recent-latency quantile after which a duplicate request is sent; 0 disables hedging."""
+    hedge_min_delay: float = 0.5
+    """Never hedge earlier than this many seconds."""
+    hedge_default_delay: float = 5.0
+    """Hedge delay until enough latencies have been seen."""
+    hedge_budget: float = 0.1
+    """Most hedges as a share of calls, so a general slowdown does not double the load."""
+    retries: int = 2
+    backoff_base: float = 0.25
+    backoff_max: float = 4.0
+    max_workers: int = 64
+    """Threads available to synchronous calls and their hedges."""
+
+@dataclass
+class ResilienceStats:
+    """Counters since start (or the last reset)."""
+    calls: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    deadline_exceeded: int = 0
+    rejected: int = 0
+    degraded: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+class Resilience:
+    """Runs calls under a deadline with hedging, jittered retries and a circuit breaker."""
+
+    def __init__(self, policy: Optional[ResiliencePolicy] = None, breaker: Optional[CircuitBreaker] = None, seed=None):
+        """
+        Args:
+            policy: Deadline, hedging and retry settings
+            breaker: Circuit breaker shared by every route (one provider)
+            seed: Seed for the backoff jitter
+        """
+        self.policy = policy or ResiliencePolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.stats = ResilienceStats()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def count(self, **increments: int):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def deadline(self, route: str) -> float:
+        return self.policy.route_deadlines.get(route, self.policy.deadline)
+
+    def hedge_delay(self, route: str) -> Optional[float]:
+        """Seconds to wait before sending a duplicate request, or None if hedging is off."""
+        if not self.policy.hedge_percentile:
+            return None
+        observed = self.latency.percentile(route, self.policy.hedge_percentile)
+        return max(self.policy.hedge_min_delay, self.policy.hedge_default_delay if observed is None else observed)
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            return self.stats.hedges < self.policy.hedge_budget * self.stats.calls
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+        cap = min(self.policy.backoff_max, self.policy.backoff_base * 2 ** (attempt - 1))
+        with self._lock:
+            return self._random.uniform(0, cap)
+
+    def _admit(self, route: str):
+        if not self.breaker.allow():
+            self.count(rejected=1)
+            raise CircuitOpenError(f"circuit breaker open, not calling the model for route {route!r}")
+
+    def _succeeded(self, route: str, seconds: float):
+        self.breaker.record(True)
+        self.latency.add(route, seconds)
+        self.count(succeeded=1)
+
+    def _failed(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """Record a failed attempt; the delay before retrying, or None to give up."""
+        if not is_retryable(error):
+            # Not a provider failure (unusable output, a rejected request, a bug): another attempt fails the same way
+            self.breaker.record(True)
+            self.count(failed=1)
+            return None
+        self.breaker.record(False)
+        if isinstance(error, DeadlineExceeded):
+            self.count(failed=1, deadline_exceeded=1)
+            return None
+        delay = self.backoff(attempt + 1)
+        if attempt >= self.policy.retries or time.monotonic() + delay >= deadline:
+            self.count(failed=1)
+            return None
+        self.count(retries=1)
+        return delay
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.policy.max_workers, thread_name_prefix="poms-llm")
+            return self._executor
+
+    def call(self, route: str, function: Callable[[], Any]) -> Any:
+        """
+        Run a blocking call with the route's deadline, hedging and retries.
+
+        Raises:
+            CircuitOpenError: The breaker is open
+            DeadlineExceeded: No attempt finished in time
+            Exception: The last attempt's error once retries are used up
+        """
+        self.count(calls=1)
+        deadline = time.monotonic() + self.deadline(route)
+        attempt = 0
+        while True:
+            self._admit(route)
+            start = time.monotonic()
+            try:
+                result = self._hedged(route, function, deadline)
+            except Exception as e:
+                delay = self._failed(e, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._succeeded(route, time.monotonic() - start)
+            return result
+
+    def _hedged(self, route: str, function: Callable[[], Any], deadline: float) -> Any:
+        """One attempt: the first successful answer of the request and its hedge."""
+        executor = self._get_executor()
+        # Each request runs in a copy of the caller's context, so tracing sees the current trace
+        primary = executor.submit(contextvars.copy_context().run, function)
+        running = {primary}
+        delay = self.hedge_delay(route)
+        hedge_at = None if delay is None else time.monotonic() + delay
+        error: Optional[BaseException] = None
+        try:
+            while running:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise DeadlineExceeded(f"route {route!r} exceeded its {self.deadline(route):g}s deadline")
+                done, running = wait(running, timeout=min(deadline, hedge_at or deadline) - now, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            self.count(hedge_wins=1)
+                        return future.result()
+                    error = future.exception()
+                if running and hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    if self._may_hedge():
+                        running.add(executor.submit(contextvars.copy_context().run, function))
+                        self.count(hedges=1)
+            raise error
+        finally:
+            # Abandoned requests finish in the background; only queued ones can be cancelled
+            for future in running:
+                future.cancel()
+
+    async def acall(self, route: str, function: Callable[[], Awaitable[Any]]) -> Any:
+        """Async twin of call; `function` returns a new awaitable per attempt."""
+        self.count(calls=1)
+        deadline = time.monotonic() + self.deadline(route)
+        attempt = 0
+        while True:
+            self._admit(route)
+            start = time.monotonic()
+            try:
+                result = await self._ahedged(route, function, deadline)
+            except Exception as e:
+                delay = self._failed(e, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(route, time.monotonic() - start)
+            return result
+
+    async def _ahedged(self, route: str, function: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        primary = asyncio.ensure_future(function())
+        running = {primary}
+        delay = self.hedge_delay(route)
+        hedge_at = None if delay is None else time.monotonic() + delay
+        error: Optional[BaseException] = None
+        try:
+            while running:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise DeadlineExceeded(f"route {route!r} exceeded its {self.deadline(route):g}s deadline")
+                done, running = await asyncio.wait(
+                    running, timeout=min(deadline, hedge_at or deadline) - now, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.count(hedge_wins=1)
+                        return task.result()
+                    error = task.exception()
+                if running and hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    if self._may_hedge():
+                        running.add(asyncio.ensure_future(function()))
+                        self.count(hedges=1)
+            raise error
+        finally:
+            for task in running:
+                task.cancel()
+
+    def reset(self):
+        """Clear counters, latencies and the breaker."""
+        with self._lock:
+            self.stats = ResilienceStats()
+        self.latency.clear()
+        self.breaker.reset()
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = self.stats.as_dict()
+        return dict(stats, breaker=self.breaker.as_dict())
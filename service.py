@@ -0,0 +1,371 @@
+"""
+Headless extraction service for P.O.M.S - Portfolio and OMS System
+
+Exposes the extractor over HTTP so other systems (and many app replicas)
+can share one process, one cache and one set of LLM connections:
+
+    POST /extract        {"text": "...", "use_cache": true, "use_fast_path": true}
+    POST /extract/batch  {"texts": ["...", "..."], "max_concurrency": 8}
+    GET  /health
+    GET  /metrics        Prometheus text format
+
+Requests run on a bounded worker pool; when every worker is busy and the
+backlog is full the service answers 503 instead of queueing without limit.
+Concurrent requests for the same (normalized) query are coalesced so they
+share one in-flight extraction.
+
+Usage:
+    python service.py --port 8080 --workers 16
+"""
+import argparse
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from extraction_cache import normalize_query
+from reference_data import UnresolvedReferenceError
+
+MAX_BODY_BYTES = 1 << 20
+# Seconds a kept-alive connection may sit idle (or a request trickle in) before its worker drops it
+IDLE_TIMEOUT = 5.0
+
+@dataclass
+class ServiceStats:
+    """Counters since the service started."""
+    requests: int = 0
+    extractions: int = 0
+    coalesced: int = 0
+    rejected: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+class SingleFlight:
+    """
+    Share one in-flight computation among concurrent callers with the same key.
+
+    The first caller for a key becomes its leader and computes the value;
+    callers arriving before it finishes wait for the leader's result. Nothing
+    is remembered once the computation completes (that is the cache's job).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Any, Future] = {}
+
+    def claim(self, key) -> Tuple[Future, bool]:
+        """The future for a key and whether the caller must compute it."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._flights[key] = future
+            return future, True
+
+    def resolve(self, key, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        """Publish a leader's outcome, then forget the key."""
+        # Callers that claim the key until it is forgotten get the finished future, never a second leader
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        with self._lock:
+            self._flights.pop(key, None)
+
+    def do(self, key, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run `function` unless the same key is already running.
+
+        Returns:
+            (result, shared) where shared is True if another caller computed it
+        """
+        future, leader = self.claim(key)
+        if leader:
+            try:
+                self.resolve(key, future, result=function())
+            except BaseException as e:
+                self.resolve(key, future, error=e)
+        return future.result(), not leader
+
+def dump_result(result) -> Dict[str, Any]:
+    """JSON body for one extraction result."""
+    if result is None:
+        return {"type": None, "result": None}
+    return {"type": type(result).__name__, "result": result.model_dump(mode="json")}
+
+def dump_error(error: BaseException) -> Dict[str, Any]:
+    body = {"error": type(error).__name__, "message": str(error)}
+    if isinstance(error, UnresolvedReferenceError):
+        body.update(accounts=error.accounts, tickers=error.tickers)
+    return body
+
+class ExtractionService:
+    """Coalescing front end over route_input_and_extract and route_many."""
+
+    def __init__(self):
+        self.stats = ServiceStats()
+        self._flights = SingleFlight()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **increments: int):
+        with self._stats_lock:
+            for name, value in increments.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def extract(self, text: str, use_cache: bool = True, use_fast_path: bool = True):
+        """Extract one query, joining an identical extraction already in flight."""
+        from pots_models import route_input_and_extract
+
+        key = (normalize_query(text), use_cache, use_fast_path)
+        result, shared = self._flights.do(key, lambda: route_input_and_extract(text, use_cache, use_fast_path))
+        self._count(**({"coalesced": 1} if shared else {"extractions": 1}))
+        return result
+
+    def extract_batch(
+        self,
+        texts: List[str],
+        max_concurrency: int = 8,
+        use_cache: bool = True,
+        use_fast_path: bool = True,
+    ) -> List[Tuple[Any, Optional[BaseException]]]:
+        """
+        Extract many queries, sending the ones nobody else is running through route_many.
+
+        Duplicates within the batch and queries already in flight elsewhere
+        are not extracted again.
+
+        Returns:
+            (result, error) per text, in input order
+        """
+        from pots_models import route_many
+
+        futures: List[Future] = []
+        leaders: Dict[Any, Tuple[str, Future]] = {}
+        for text in texts:
+            key = (normalize_query(text), use_cache, use_fast_path)
+            if key in leaders:
+                futures.append(leaders[key][1])
+                continue
+            future, leader = self._flights.claim(key)
+            if leader:
+                leaders[key] = (text, future)
+            futures.append(future)
+        self._count(extractions=len(leaders), coalesced=len(texts) - len(leaders))
+
+        if leaders:
+            keys = list(leaders)
+            try:
+                batch = route_many([leaders[key][0] for key in keys], max_concurrency, use_cache, use_fast_path)
+            except BaseException as e:
+                for key in keys:
+                    self._flights.resolve(key, leaders[key][1], error=e)
+            else:
+                for i, key in enumerate(keys):
+                    self._flights.resolve(key, leaders[key][1], result=batch.results[i], error=batch.errors.get(i))
+
+        outcomes = []
+        for future in futures:
+            error = future.exception()
+            outcomes.append((None if error else future.result(), error))
+        return outcomes
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    server: "ExtractionServer"
+    protocol_version = "HTTP/1.1"
+    # Keep-alive connections hold a pool worker, so idle ones are closed
+    timeout = IDLE_TIMEOUT
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: Dict[str, Any]):
+        self._send_text(status, json.dumps(body), "application/json")
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            # The body is left unread, so the connection cannot carry another request
+            self.close_connection = True
+            self._send(413, {"error": "PayloadTooLarge", "message": f"body exceeds {MAX_BODY_BYTES} bytes"})
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send(400, {"error": "BadRequest", "message": f"invalid JSON: {e}"})
+            return None
+        if not isinstance(body, dict):
+            self._send(400, {"error": "BadRequest", "message": "body must be a JSON object"})
+            return None
+        return body
+
+    def _send_text(self, status: int, text: str, content_type: str):
+        payload = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            from pots_models import tracer
+
+            self._send_text(200, tracer.prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+            return
+        if self.path != "/health":
+            self._send(404, {"error": "NotFound", "message": self.path})
+            return
+        from pots_models import cascade_stats, get_rate_limiter, resilience
+
+        self._send(200, {
+            "status": "degraded" if resilience.breaker.is_open else "ok",
+            "stats": self.server.service.stats.as_dict(),
+            "cascade": cascade_stats.as_dict(),
+            "resilience": resilience.as_dict(),
+            "rate_limiter": get_rate_limiter().as_dict(),
+        })
+
+    def do_POST(self):
+        service = self.server.service
+        service._count(requests=1)
+        body = self._read_json()
+        if body is None:
+            return
+        options = {
+            "use_cache": bool(body.get("use_cache", True)),
+            "use_fast_path": bool(body.get("use_fast_path", True)),
+        }
+
+        if self.path == "/extract":
+            text = body.get("text")
+            if not isinstance(text, str) or not text.strip():
+                self._send(400, {"error": "BadRequest", "message": "'text' must be a non-empty string"})
+                return
+            try:
+                result = service.extract(text.strip(), **options)
+            except UnresolvedReferenceError as e:
+                self._send(422, dump_error(e))
+                return
+            except Exception as e:
+                service._count(errors=1)
+                self._send(502, dump_error(e))
+                return
+            self._send(200, dump_result(result))
+
+        elif self.path == "/extract/batch":
+            texts = body.get("texts")
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                self._send(400, {"error": "BadRequest", "message": "'texts' must be a list of strings"})
+                return
+            max_concurrency = body.get("max_concurrency", self.server.batch_concurrency)
+            if not isinstance(max_concurrency, int) or isinstance(max_concurrency, bool) or max_concurrency < 1:
+                self._send(400, {"error": "BadRequest", "message": "'max_concurrency' must be a positive integer"})
+                return
+            outcomes = service.extract_batch([text.strip() for text in texts], max_concurrency, **options)
+            items = []
+            for result, error in outcomes:
+                if error is not None:
+                    service._count(errors=1)
+                    items.append(dump_error(error))
+                else:
+                    items.append(dump_result(result))
+            self._send(200, {"results": items})
+
+        else:
+            self._send(404, {"error": "NotFound", "message": self.path})
+
+class ExtractionServer(ThreadingHTTPServer):
+    """HTTP server whose connections are handled by a fixed-size worker pool."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        workers: int = 16,
+        max_pending: int = 256,
+        batch_concurrency: int = 8,
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            address: (host, port) to listen on
+            workers: Connections handled at once
+            max_pending: Connections accepted (running or waiting) before answering 503
+            batch_concurrency: Default LLM concurrency of a batch request
+            verbose: Log each request to stderr
+        """
+        super().__init__(address, ExtractionHandler)
+        self.service = ExtractionService()
+        self.batch_concurrency = batch_concurrency
+        self.verbose = verbose
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="poms-service")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self.service._count(rejected=1)
+            payload = b'{"error": "Overloaded", "message": "too many pending requests"}'
+            try:
+                # Take in the request first, so the client reads the 503 instead of a reset
+                request.settimeout(0.1)
+                request.recv(MAX_BODY_BYTES)
+                request.sendall(
+                    b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                    b"Connection: close\r\nRetry-After: 1\r\nContent-Length: %d\r\n\r\n%s" % (len(payload), payload)
+                )
+            except OSError:
+                pass
+            finally:
+                self.shutdown_request(request)
+            return
+        self._executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="P.O.M.S extraction service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16, help="requests handled at once")
+    parser.add_argument("--max-pending", type=int, default=256, help="requests accepted before answering 503")
+    parser.add_argument("--batch-concurrency", type=int, default=8, help="default LLM concurrency per batch request")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = ExtractionServer(
+        (args.host, args.port),
+        workers=args.workers,
+        max_pending=args.max_pending,
+        batch_concurrency=args.batch_concurrency,
+        verbose=args.verbose,
+    )
+    print(f"Serving extraction on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Local stand-in chat model for P.O.M.S - Portfolio and OMS System
+
+StubChatModel answers tool-calling requests from a lookup table with
+configurable latency and jitter and never touches the network. It can also
+inject faults, failing a share of calls with StubProviderError and making a
+share of them slow, to exercise deadlines, hedging and the circuit breaker.
+
+StubOpenAIServer answers the same way over HTTP, speaking enough of the
+OpenAI chat completions API for ChatOpenAI (point OPENAI_BASE_URL at its
+base_url), and enforces requests- and tokens-per-minute limits with 429s so
+the shared client layer's pooling and rate limiting can be tested locally. Install it
+as the model cascade with
+`pots_models.register_resource(pots_models.get_model_tiers, [ModelTier("stub", stub)])`
+(one tier per stub to exercise escalation) to run the extraction pipeline offline.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from example_selector import estimate_tokens
+from llm_client import TokenBucket
+
+def answer_tool_calls(
+    answers: Dict[str, List[BaseModel]], query: str, tool_functions: Optional[List[dict]]
+) -> List[Dict[str, Any]]:
+    """Tool calls ({"name", "args", "id"}) answering a query, limited to the bound tools."""
+    tool_names = [function["name"] for function in tool_functions or []]
+    calls = [
+        call for call in answers.get(query, [])
+        if not tool_names or type(call).__name__ in tool_names
+    ]
+    if calls:
+        return [
+            {"name": type(call).__name__, "args": call.model_dump(mode="json"), "id": str(uuid.uuid4())}
+            for call in calls
+        ]
+    if tool_functions:
+        # Unknown query: an empty call of the first bound tool, with required lists left empty
+        parameters = tool_functions[0].get("parameters", {})
+        args = {
+            name: [] for name, prop in parameters.get("properties", {}).items()
+            if name in parameters.get("required", []) and prop.get("type") == "array"
+        }
+        return [{"name": tool_names[0], "args": args, "id": str(uuid.uuid4())}]
+    return []
+
+class StubProviderError(ConnectionError):
+    """Injected provider failure, standing in for a 5xx or dropped connection."""
+
+class StubChatModel(BaseChatModel):
+    """Deterministic tool-calling chat model with simulated latency."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    answers: Dict[str, List[BaseModel]] = Field(default_factory=dict)
+    """Query text -> tool calls to answer with, each a Pydantic model instance."""
+    latency: float = 0.0
+    """Base seconds spent on every call."""
+    jitter: float = 0.0
+    """Extra seconds drawn uniformly from [0, jitter] on every call."""
+    failure_rate: float = 0.0
+    """Share of calls that raise StubProviderError after their latency."""
+    slow_rate: float = 0.0
+    """Share of calls that take slow_latency instead of the usual latency."""
+    slow_latency: float = 5.0
+    seed: int = 0
+    model_name: str = "stub"
+
+    _random: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context: Any):
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "poms-stub"
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs: Any):
+        """Remember which tools were bound so answers can be filtered to them."""
+        functions = [convert_to_openai_tool(tool)["function"] for tool in tools]
+        return self.bind(tool_functions=functions, **kwargs)
+
+    def _delay(self) -> float:
+        if self.slow_rate and self._random.random() < self.slow_rate:
+            return self.slow_latency
+        return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _fail(self):
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise StubProviderError("injected provider failure")
+
+    def _respond(self, messages: List[BaseMessage], tool_functions: Optional[List[dict]]) -> ChatResult:
+        """Build the tool-call response for the last human message."""
+        query = next(
+            (str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), ""
+        )
+        tool_calls = answer_tool_calls(self.answers, query, tool_functions)
+
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = sum(estimate_tokens(json.dumps(call["args"])) for call in tool_calls)
+        message = AIMessage(
+            content="",
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_functions=None, **kwargs) -> ChatResult:
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        self._fail()
+        return self._respond(messages, tool_functions)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tool_functions=None, **kwargs) -> ChatResult:
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        self._fail()
+        return self._respond(messages, tool_functions)
+
+class _StubOpenAIHandler(BaseHTTPRequestHandler):
+    server: "StubOpenAIServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server._count("connections")
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Sequence[Tuple[str, str]] = ()):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        messages = request.get("messages", [])
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+        budget = request.get("max_completion_tokens") or request.get("max_tokens") or 256
+        retry_after = self.server.admit(prompt_tokens + budget)
+        if retry_after is not None:
+            self._send(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                [("Retry-After", f"{retry_after:.3f}")],
+            )
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        query = next((str(m.get("content")) for m in reversed(messages) if m.get("role") == "user"), "")
+        functions = [tool["function"] for tool in request.get("tools", [])]
+        tool_calls = answer_tool_calls(self.server.answers, query, functions)
+        completion_tokens = sum(estimate_tokens(json.dumps(call["args"])) for call in tool_calls)
+        self._send(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [
+                        {"id": call["id"], "type": "function",
+                         "function": {"name": call["name"], "arguments": json.dumps(call["args"])}}
+                        for call in tool_calls
+                    ],
+                },
+                "finish_reason": "tool_calls",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """Local OpenAI-compatible chat completions endpoint with enforced rate limits."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+        answers: Optional[Dict[str, List[BaseModel]]] = None,
+        rpm: int = 0,
+        tpm: int = 0,
+        period: float = 60.0,
+        latency: float = 0.0,
+    ):
+        """
+        Args:
+            address: (host, port) to listen on; port 0 picks a free one
+            answers: Query text -> tool calls to answer with, as for StubChatModel
+            rpm: Requests allowed per period, 0 for no limit
+            tpm: Tokens (prompt estimate plus completion budget) allowed per period, 0 for no limit
+            period: Seconds over which the limits replenish
+            latency: Seconds spent on every admitted request
+        """
+        super().__init__(address, _StubOpenAIHandler)
+        self.answers = answers or {}
+        self.rpm = rpm
+        self.tpm = tpm
+        self.period = period
+        self.latency = latency
+        self.stats = {"connections": 0, "requests": 0, "limited": 0}
+        # Limits replenish continuously, as the provider's do
+        self._requests = TokenBucket(rpm, period) if rpm else None
+        self._tokens = TokenBucket(tpm, period) if tpm else None
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def admit(self, tokens: int) -> Optional[float]:
+        """Take capacity for a request; seconds to retry after if it is over a limit."""
+        with self._lock:
+            self.stats["requests"] += 1
+            retry_after = max(
+                self._requests.wait_time(1) if self._requests else 0.0,
+                self._tokens.wait_time(tokens) if self._tokens else 0.0,
+            )
+            if retry_after > 0:
+                self.stats["limited"] += 1
+                return retry_after
+            if self._requests:
+                self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(tokens)
+            return None
+
+    def start(self) -> "StubOpenAIServer":
+        """Serve from a daemon thread."""
+        threading.Thread(target=self.serve_forever, name="stub-openai", daemon=True).start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Modules live at the repository root and import each other by bare name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No on-disk cache, trace file or book (holdings and returns), and no real credentials, while testing
+os.environ["POMS_CACHE_PATH"] = ""
+os.environ["POMS_TRACE_PATH"] = ""
+os.environ["POMS_HOLDINGS_DIR"] = ""
+os.environ["POMS_PERFORMANCE_PATH"] = ""
+os.environ.pop("OPENAI_API_KEY", None)
@@ -0,0 +1,53 @@
+import datetime
+
+import pytest
+
+from date_resolver import NYSE_CALENDAR, DateRangeError, check_date_range, is_iso_date, resolve_date, resolve_date_range
+from pots_models import PortfolioHolding
+
+SATURDAY = datetime.date(2024, 7, 6)
+
+@pytest.mark.parametrize("expression, expected", [
+    ("2024-03-28", "2024-03-28"),
+    ("28-Mar-2024", "2024-03-28"),
+    ("March 28, 2024", "2024-03-28"),
+    ("03/28/2024", "2024-03-28"),
+    ("today", "2024-07-06"),
+    ("end of last quarter", "2024-06-30"),
+])
+def test_expressions(expression, expected):
+    assert resolve_date(expression, SATURDAY) == expected
+
+def test_unknown_expressions_pass_through():
+    assert resolve_date("Q1 2024", SATURDAY) == "Q1 2024"
+    assert not is_iso_date("Q1 2024") and not is_iso_date("2024-02-30") and is_iso_date("2024-02-29")
+
+def test_period_start_fills_in_the_end():
+    assert resolve_date_range("last quarter", None, SATURDAY) == ("2024-04-01", "2024-06-30")
+
+def test_calendar_knows_holidays():
+    assert not NYSE_CALENDAR.is_business_day(datetime.date(2024, 7, 4))
+    assert NYSE_CALENDAR.roll_back(datetime.date(2024, 7, 4)) == datetime.date(2024, 7, 3)
+
+def test_as_of_and_end_dates_roll_to_the_preceding_trading_day():
+    assert resolve_date_range("today", None, SATURDAY, roll="preceding") == ("2024-07-05", None)
+    assert resolve_date_range("2024-07-04", None, SATURDAY, roll="preceding") == ("2024-07-03", None)
+    assert resolve_date_range("01-Jan-2024", "31-Mar-2024", SATURDAY, roll="preceding") == ("2024-01-01", "2024-03-28")
+    assert resolve_date_range("last quarter", None, SATURDAY, roll="preceding") == ("2024-04-01", "2024-06-28")
+
+def test_year_to_date_on_the_first_of_january_is_a_range():
+    new_year = datetime.date(2024, 1, 1)
+    assert resolve_date_range("YTD", None, new_year) == ("2024-01-01", "2024-01-01")
+    assert resolve_date_range("YTD", None, new_year, roll="preceding") == ("2024-01-01", "2024-01-01")
+
+def test_query_models_keep_their_dates_as_written():
+    holding = PortfolioHolding(start_date="31-Dec-2023", end_date="31-Mar-2024")
+    assert (holding.start_date, holding.end_date) == ("2023-12-31", "2024-03-31")
+
+def test_check_date_range():
+    check_date_range("2024-01-02", None)
+    check_date_range("2024-01-02", "2024-01-02")
+    with pytest.raises(DateRangeError, match="before the start"):
+        check_date_range("2024-01-03", "2024-01-02")
+    with pytest.raises(DateRangeError, match="end date 'Q1 2024'"):
+        check_date_range("2024-01-02", "Q1 2024")
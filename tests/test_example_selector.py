@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import pots_models
+from example_selector import ExampleSelector, estimate_tokens, tokenize
+
+DOCUMENTS = [
+    "Buy 250 AAPL in account capers",
+    "Sell 100 MSFT in account ushy",
+    "Increase exposure to TSLA by 2% in all accounts",
+    "Show my holdings in account capers",
+    "What are my returns in account capers, ushy",
+]
+
+def test_tokenize_and_estimate():
+    assert tokenize("Buy 250 AAPL, in capers!") == ["buy", "250", "aapl", "in", "capers"]
+    assert estimate_tokens("") == 1 and estimate_tokens("x" * 40) == 10
+
+def test_most_similar_examples_come_first():
+    selector = ExampleSelector(DOCUMENTS, [10] * len(DOCUMENTS), k=2, token_budget=1000)
+    assert selector.select("sell 50 MSFT in ushy")[0] == 1
+    assert selector.select("increase my exposure to NVDA by 1%")[0] == 2
+
+def test_rare_terms_outweigh_common_ones():
+    scores = ExampleSelector(DOCUMENTS, [10] * len(DOCUMENTS)).scores("account returns")
+    assert max(scores, key=scores.get) == 4
+
+def test_at_most_k_examples():
+    selector = ExampleSelector(DOCUMENTS, [10] * len(DOCUMENTS), k=3, token_budget=1000)
+    assert len(selector.select("account capers ushy")) == 3
+
+def test_token_budget_is_never_exceeded():
+    costs = [50, 10, 10, 300, 40]
+    selector = ExampleSelector(DOCUMENTS, costs, k=5, token_budget=100)
+    selected = selector.select("account capers ushy holdings returns")
+    assert sum(costs[i] for i in selected) <= 100
+    # The holdings example is the best match for "holdings" but too expensive; cheaper ones still fit
+    assert 3 not in selected and len(selected) >= 2
+
+def test_example_over_budget_alone_is_skipped():
+    selector = ExampleSelector(["buy aapl"], [500], token_budget=100)
+    assert selector.select("buy aapl") == []
+
+def test_no_shared_terms_selects_nothing():
+    assert ExampleSelector(DOCUMENTS, [10] * len(DOCUMENTS)).select("hello there") == []
+
+@pytest.mark.parametrize("route", ["orders", "holdings", "performance", "multi"])
+def test_route_prompts_stay_within_the_budget(route):
+    messages = pots_models.select_example_messages(route, "buy 100 aapl and show my holdings and returns in capers")
+    spent = sum(estimate_tokens(str(message.content) + json.dumps(message.additional_kwargs)) for message in messages)
+    assert spent <= pots_models.FEW_SHOT_TOKEN_BUDGET
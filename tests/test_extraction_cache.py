@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from extraction_cache import ExtractionCache, is_date_relative, normalize_query
+from pots_models import Holdings, Order, Orders, PortfolioHolding
+
+RESULT = Orders(orders=[Order(action="buy", ticker="AAPL", quantity=250, accounts=["CAPERS"])])
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExtractionCache([Orders, Holdings], path=str(tmp_path / "cache.sqlite3"), max_entries=2)
+
+def test_normalization_and_relative_dates():
+    assert normalize_query("  Buy 250   AAPL ") == "buy 250 aapl"
+    assert is_date_relative("show my holdings as of today")
+    assert not is_date_relative("show my holdings as of 2024-03-28")
+
+def test_hit_after_put(cache):
+    assert cache.get("Buy 250 AAPL", "orders", "v1") is None
+    cache.put("Buy 250 AAPL", "orders", "v1", RESULT)
+    assert cache.get("buy 250  aapl", "orders", "v1") == RESULT
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.memory_hits) == (1, 1, 1)
+
+def test_callers_get_their_own_copy(cache):
+    result = RESULT.model_copy(deep=True)
+    cache.put("Buy 250 AAPL", "orders", "v1", result)
+    result.orders[0].quantity = 1
+    cached = cache.get("Buy 250 AAPL", "orders", "v1")
+    cached.orders[0].accounts.append("USHY")
+    assert cache.get("Buy 250 AAPL", "orders", "v1") == RESULT
+
+def test_version_and_route_are_part_of_the_key(cache):
+    cache.put("Buy 250 AAPL", "orders", "v1", RESULT)
+    assert cache.get("Buy 250 AAPL", "orders", "v2") is None
+    assert cache.get("Buy 250 AAPL", "multi", "v1") is None
+
+def test_disk_level_survives_a_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ExtractionCache([Orders], path=path).put("Buy 250 AAPL", "orders", "v1", RESULT)
+    reopened = ExtractionCache([Orders], path=path)
+    assert reopened.get("Buy 250 AAPL", "orders", "v1") == RESULT
+    assert reopened.stats.disk_hits == 1
+
+def test_memory_level_evicts_least_recently_used():
+    cache = ExtractionCache([Orders], max_entries=2)
+    for text in ("a", "b", "c"):
+        cache.put(text, "orders", "v1", RESULT)
+    assert cache.get("a", "orders", "v1") is None
+    assert cache.get("c", "orders", "v1") == RESULT
+    assert cache.stats.evictions == 1
+
+def test_expired_results_only_serve_degraded_answers():
+    cache = ExtractionCache([Orders], ttl=-1)
+    cache.put("Buy 250 AAPL", "orders", "v1", RESULT)
+    assert cache.get("Buy 250 AAPL", "orders", "v1", stale=True) == RESULT
+    assert cache.get("Buy 250 AAPL", "orders", "v1") is None
+    assert cache.stats.stale_hits == 1 and cache.stats.expirations == 1
+
+def test_date_relative_queries_expire_by_midnight():
+    cache = ExtractionCache([Holdings])
+    now = time.time()
+    assert cache._expiry("show my holdings today", "holdings", now) <= now + 24 * 3600
+    assert cache._expiry("show my holdings on 2024-03-28", "holdings", now) == now + cache.ttl
+
+def test_unknown_models_are_not_stored(cache):
+    cache.put("anything", "orders", "v1", PortfolioHolding())
+    assert cache.stats.writes == 0
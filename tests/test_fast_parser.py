@@ -0,0 +1,52 @@
+import pytest
+
+import pots_models
+from fast_parser import FastPathParser, parse_holding, parse_order
+from reference_data import ReferenceIndex
+
+TEXT = "buy 10 aapl in account capers and msft"
+
+@pytest.fixture
+def index(monkeypatch):
+    index = ReferenceIndex(accounts=["CAPERS", "USHY"], tickers=["AAPL", "MSFT"])
+    monkeypatch.setattr(pots_models, "get_reference_index", lambda: index)
+    monkeypatch.setattr(pots_models, "fast_path", FastPathParser())
+    return index
+
+def test_order_with_quantity():
+    order = parse_order("Buy 250 AAPL in account capers").payload["orders"][0]
+    assert order == {"action": "buy", "ticker": "aapl", "quantity": 250, "weight": None, "accounts": ["capers"]}
+
+def test_order_with_weight():
+    order = parse_order("Increase exposure to MSFT by 2% in all accounts").payload["orders"][0]
+    assert (order["action"], order["weight"], order["accounts"]) == ("buy", 2.0, ["ALL"])
+
+def test_holding_between_dates():
+    holding = parse_holding("show my positions in account ushy between 2024-01-02 and 2024-03-28").payload["holdings"][0]
+    assert (holding["accounts"], holding["start_date"], holding["end_date"]) == (["ushy"], "2024-01-02", "2024-03-28")
+
+def test_low_coverage_is_not_a_hit():
+    parser = FastPathParser(threshold=0.9)
+    assert parser.parse("please buy 10 aapl for me when the market opens tomorrow", "orders") is None
+    assert parser.stats.low_confidence == 1
+
+def test_account_list_stops_at_order_terms():
+    result = parse_order("Buy 250 AAPL in account capers, limit 150")
+    assert result.payload["orders"][0]["accounts"] == ["capers"]
+    assert FastPathParser().parse("Buy 250 AAPL in account capers, limit 150", "orders") is None
+
+def test_several_accounts_need_reference_data(monkeypatch):
+    monkeypatch.setattr(pots_models, "get_reference_index", lambda: None)
+    monkeypatch.setattr(pots_models, "fast_path", FastPathParser())
+    assert pots_models._local_result(TEXT, "orders", False, True) is None
+    assert pots_models._local_result("buy 10 aapl in account capers", "orders", False, True).orders[0].accounts == ["capers"]
+
+def test_resolved_parse_is_answered_locally(index):
+    result = pots_models._local_result("buy 10 aapl in account capers and ushy", "orders", False, True)
+    assert result.orders[0].accounts == ["CAPERS", "USHY"]
+
+def test_unresolved_parse_falls_back_to_the_model(index):
+    # "msft" is read as a second account; it must reach the model, not raise
+    assert pots_models._local_result(TEXT, "orders", False, True) is None
+    assert pots_models.fast_path.stats.unresolved == 1
+    assert pots_models.fast_path.stats.hits == 0
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from follow_up import Conversation, FollowUpDelta, apply_delta, parse_delta
+from intent_classifier import IntentClassifier
+from pots_models import Order, Orders, PortfolioPerformance, Performances
+from reference_data import ReferenceIndex
+from tracing import Tracer
+
+PREVIOUS = Orders(orders=[Order(action="buy", ticker="AAPL", quantity=250, accounts=["CAPERS"])])
+
+@pytest.mark.parametrize("text, delta", [
+    ("same for ushy and halifax", {"accounts": ["ushy", "halifax"]}),
+    ("what about all my accounts", {"accounts": ["ALL"]}),
+    ("make it 300", {"quantity": 300}),
+    ("make it 2.5%", {"weight": 2.5}),
+    ("sell instead", {"action": "sell"}),
+    ("same for ushy and halifax, make it 1,000 shares", {"accounts": ["ushy", "halifax"], "quantity": 1000}),
+    ("make it 2024", {"quantity": 2024}),
+    ("as of 2024-03-28", {"start_date": "2024-03-28", "end_date": None}),
+])
+def test_parse_delta(text, delta):
+    assert parse_delta(text) == delta
+
+@pytest.mark.parametrize("text", [
+    "Buy 100 MSFT in capers", "as of the day my cat was born", "make it better",
+    "what about TSLA", "same for ushy", "same for TSLA and capers", "in 2024", "2024",
+])
+def test_not_a_local_delta(text):
+    assert parse_delta(text) is None
+
+def test_lone_names_are_read_against_the_index():
+    index = ReferenceIndex.from_book(["USHY"], ["TSLA"])
+    assert parse_delta("same for ushy", index) == {"accounts": ["ushy"]}
+    assert parse_delta("what about TSLA", index) == {"ticker": "TSLA"}
+    assert parse_delta("what about capers", index) is None
+
+def test_quantity_clears_weight():
+    weighted = Orders(orders=[Order(action="buy", ticker="AAPL", weight=2.0)])
+    order = apply_delta(weighted, {"quantity": 300}).orders[0]
+    assert (order.quantity, order.weight) == (300, None)
+
+def test_performance_accounts_stay_a_string():
+    previous = Performances(performances=[PortfolioPerformance(accounts="capers", start_date="2024-01-02")])
+    assert apply_delta(previous, {"accounts": ["ushy", "halifax"]}).performances[0].accounts == "ushy,halifax"
+
+class Resilience:
+    async def acall(self, route, function):
+        return await function()
+
+class Runnable:
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    async def ainvoke(self, inputs, config):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+def _conversation(outcome, cold_result=None):
+    async def cold_extract(text, use_cache, use_fast_path):
+        return cold_result
+
+    conversation = Conversation(cold_extract, IntentClassifier(), lambda: Runnable(outcome), Resilience(), Tracer(None))
+    conversation.remember(PREVIOUS)
+    return conversation
+
+def test_local_follow_up_patches_the_previous_result():
+    conversation = _conversation(AssertionError("the model is not needed"))
+    result = asyncio.run(conversation.aextract("same for ushy and halifax"))
+    assert result.orders[0].accounts == ["ushy", "halifax"] and result.orders[0].ticker == "AAPL"
+    assert conversation.stats.local == 1 and conversation.last is result
+
+def test_model_follow_up_patches_the_previous_result():
+    conversation = _conversation(FollowUpDelta(ticker="MSFT"))
+    result = asyncio.run(conversation.aextract("same but for microsoft"))
+    assert result.orders[0].ticker == "MSFT"
+    assert conversation.stats.llm == 1
+
+def test_failed_model_follow_up_falls_back_to_a_cold_extraction():
+    cold = Orders(orders=[Order(action="sell", ticker="TSLA", quantity=5)])
+    conversation = _conversation(ConnectionError("provider down"), cold_result=cold)
+    assert asyncio.run(conversation.aextract("same but for tesla")) is cold
+    assert (conversation.stats.failed, conversation.stats.cold, conversation.stats.llm) == (1, 1, 0)
+    assert conversation.last is cold
+
+def test_sync_wrapper():
+    conversation = _conversation(AssertionError("the model is not needed"))
+    assert conversation.extract("make it 300").orders[0].quantity == 300
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import utils
+from holdings_diff import merge_windows, iter_diff, pack_keys
+from holdings_store import HoldingsStore
+from reference_data import UnresolvedReferenceError
+
+def _diff(store, **kwargs):
+    chunks = list(iter_diff(store, "2024-01-02", "2024-01-03", **kwargs))
+    if not chunks:
+        return {}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+@pytest.fixture
+def store(tmp_path):
+    store = HoldingsStore(str(tmp_path))
+    store.write_snapshot(
+        "2024-01-02",
+        accounts=["A", "A", "A", "B"], tickers=["AAPL", "MSFT", "IBM", "AAPL"],
+        quantity=[100, 50, 10, 20], price=[10.0, 20.0, 5.0, 10.0],
+    )
+    store.write_snapshot(
+        "2024-01-03",
+        accounts=["A", "A", "B", "B"], tickers=["AAPL", "MSFT", "AAPL", "TSLA"],
+        quantity=[100, 50, 25, 5], price=[10.0, 21.0, 10.0, 7.0],
+    )
+    return store
+
+def test_merge_windows_align_keys():
+    rng = np.random.default_rng(0)
+    def snapshot(n):
+        keys = np.unique(rng.integers(0, 200, n))
+        return {"account": (keys // 20).astype(np.int32), "ticker": (keys % 20).astype(np.int32)}
+    start, end = snapshot(120), snapshot(90)
+    covered = [0, 0]
+    previous = -1
+    for start_rows, end_rows in merge_windows(start, end, chunk_rows=7):
+        assert start_rows.stop - start_rows.start <= 7 and end_rows.stop - end_rows.start <= 7
+        keys = np.concatenate([
+            pack_keys(start["account"][start_rows], start["ticker"][start_rows]),
+            pack_keys(end["account"][end_rows], end["ticker"][end_rows]),
+        ])
+        # No key straddles two windows
+        assert keys.min() > previous
+        previous = keys.max()
+        assert start_rows.start == covered[0] and end_rows.start == covered[1]
+        covered = [start_rows.stop, end_rows.stop]
+    assert covered == [len(start["account"]), len(end["account"])]
+
+def test_statuses(store):
+    diff = _diff(store, fields=["quantity"])
+    rows = {(a, t): s for a, t, s in zip(diff["account"], diff["ticker"], diff["status"])}
+    assert rows == {("A", "IBM"): "removed", ("B", "AAPL"): "changed", ("B", "TSLA"): "added"}
+
+def test_names_match_ignoring_case(store):
+    diff = _diff(store, accounts=["b"], tickers=["tsla"])
+    assert list(zip(diff["account"], diff["ticker"], diff["status"])) == [("B", "TSLA", "added")]
+
+def test_unknown_names_are_reported(store):
+    with pytest.raises(UnresolvedReferenceError, match="capers"):
+        _diff(store, accounts=["capers"])
+    with pytest.raises(UnresolvedReferenceError, match="ORCL"):
+        _diff(store, tickers=["ORCL"])
+
+def test_any_field_change_is_a_change(store):
+    diff = _diff(store, fields=["price"])
+    rows = {(a, t): s for a, t, s in zip(diff["account"], diff["ticker"], diff["status"])}
+    assert rows[("A", "MSFT")] == "changed"
+    assert diff["price_change"][list(rows).index(("A", "MSFT"))] == 1.0
+
+def test_unknown_on_both_dates_is_unchanged(store):
+    # yield and duration were never written, so they are NaN on both dates
+    diff = _diff(store, fields=["yield", "duration"], include_unchanged=True)
+    rows = {(a, t): s for a, t, s in zip(diff["account"], diff["ticker"], diff["status"])}
+    assert rows[("A", "AAPL")] == "unchanged"
+
+def test_window_size_does_not_change_the_diff(store):
+    whole, windowed = _diff(store, include_unchanged=True), _diff(store, include_unchanged=True, chunk_rows=1)
+    assert whole.keys() == windowed.keys()
+    for name in whole:
+        np.testing.assert_array_equal(whole[name], windowed[name])
+
+def test_streamed_diff_is_computed_once(store, monkeypatch):
+    from pots_models import PortfolioHolding
+
+    calls = []
+    real = utils.iter_holding_diff
+    monkeypatch.setattr(utils, "get_holdings_store", lambda: store)
+    monkeypatch.setattr(utils, "iter_holding_diff", lambda *args, **kwargs: calls.append(1) or real(*args, **kwargs))
+    monkeypatch.setattr(utils, "_holdings_diffs", type(utils._holdings_diffs)())
+    holding = PortfolioHolding(accounts=["ALL"], start_date="2024-01-02", end_date="2024-01-03", fields=["quantity"])
+
+    first = list(utils.stream_holdings_diff(holding, 10))
+    second = list(utils.stream_holdings_diff(holding, 10))
+    assert len(calls) == 1
+    assert len(second) == 1
+    np.testing.assert_array_equal(first[-1][0]["status"], second[0][0]["status"])
+    assert len(first[-1][0]["account"]) == 3 and second[0][1].changed == 1
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import utils
+from date_resolver import DateRangeError
+from holdings_store import HoldingsStore
+from pots_models import Holdings, PortfolioHolding
+from reference_data import UnresolvedReferenceError
+
+@pytest.fixture
+def store(tmp_path):
+    store = HoldingsStore(str(tmp_path))
+    for date, quantity in (("2024-01-02", [100, 50]), ("2024-01-05", [120, 50])):
+        store.write_snapshot(date, accounts=["A", "B"], tickers=["AAPL", "AAPL"], quantity=quantity, price=[10.0, 10.0])
+    return store
+
+def test_as_of_picks_the_latest_snapshot_on_or_before(store):
+    assert store.as_of("2024-01-04") == np.datetime64("2024-01-02")
+    assert store.as_of("2024-01-01") is None
+
+def test_query_filters_accounts_and_projects_fields(store):
+    data = store.query_holding(PortfolioHolding(accounts=["A"], start_date="2024-01-05", fields=["quantity"]))
+    assert list(data["account"]) == ["A"] and list(data["quantity"]) == [120.0]
+    assert set(data) == {"date", "account", "ticker", "quantity"}
+
+def test_names_match_ignoring_case(store):
+    data = store.query_holding(PortfolioHolding(ticker="aapl", accounts=["a"], start_date="2024-01-05"))
+    assert list(data["account"]) == ["A"] and list(data["ticker"]) == ["AAPL"]
+
+def test_unknown_names_are_reported_not_answered_empty(store):
+    with pytest.raises(UnresolvedReferenceError) as error:
+        store.query_holding(PortfolioHolding(ticker="TSLA, aapl", accounts=["a"]))
+    assert error.value.tickers == ["TSLA"]
+    with pytest.raises(UnresolvedReferenceError, match="unknown account"):
+        store.query_holding(PortfolioHolding(accounts=["capers"]))
+
+def test_unresolved_and_inverted_dates_are_rejected(store):
+    with pytest.raises(DateRangeError, match="Jan 2024"):
+        store.query_holding(PortfolioHolding(start_date="sometime in Jan 2024"))
+    with pytest.raises(DateRangeError):
+        store.query_holding(PortfolioHolding(start_date="2024-01-05", end_date="2024-01-02"))
+
+def test_fetched_data_explains_unusable_requests(store, monkeypatch):
+    monkeypatch.setattr(utils, "get_holdings_store", lambda: store)
+    monkeypatch.setattr(utils, "get_performance_engine", lambda: None)
+    result = Holdings(holdings=[
+        PortfolioHolding(start_date="2024-01-05", end_date="2024-01-02"),
+        PortfolioHolding(start_date="Q7 2024"),
+        PortfolioHolding(start_date="2024-01-05"),
+        PortfolioHolding(accounts=["nowhere"]),
+    ])
+    data = utils.fetch_result_data(result)
+    assert [message.split(":")[0] for message in data.messages] == ["Holding 1", "Holding 2", "Holding 4"]
+    assert data.diffs[0] is None and data.positions[1] is None
+    assert len(data.positions[2]["account"]) == 2
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+import ingest
+import pots_models
+from pots_models import Order, Orders
+from reference_data import UnresolvedReferenceError
+
+def test_read_text_lines_skips_blanks():
+    assert list(ingest.read_instructions(["buy 1 aapl\n", "\n", " sell 2 msft \n"])) == [
+        (1, "buy 1 aapl"), (3, "sell 2 msft"),
+    ]
+
+def test_read_csv_by_header_or_first_column():
+    with_header = ["id,instruction\n", "7,buy 1 aapl\n", "8,\n", "9,sell 2 msft\n"]
+    assert list(ingest.read_instructions(with_header, csv_format=True)) == [(2, "buy 1 aapl"), (4, "sell 2 msft")]
+    without = ["buy 1 aapl,x\n", "sell 2 msft,y\n"]
+    assert list(ingest.read_instructions(without, csv_format=True)) == [(1, "buy 1 aapl"), (2, "sell 2 msft")]
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Texts extracted; "boom" fails, "who" is rejected and "hello" is unrouted."""
+    seen = []
+
+    async def extract(text, use_cache=True, use_fast_path=True):
+        seen.append(text)
+        if text == "boom":
+            raise RuntimeError("rate limited")
+        if text == "who":
+            raise UnresolvedReferenceError("no account 'who'")
+        if text == "hello":
+            return None
+        return Orders(orders=[Order(action="buy", ticker="AAPL", quantity=1)])
+
+    monkeypatch.setattr(pots_models, "aroute_input_and_extract", extract)
+    return seen
+
+ITEMS = [(1, "buy 1 aapl"), (2, "boom"), (3, "who"), (4, "hello")]
+
+@pytest.mark.parametrize("name", ["results.jsonl", "results.csv"])
+def test_rerun_only_retries_failed_lines(tmp_path, calls, name):
+    output = str(tmp_path / name)
+    stats = asyncio.run(ingest.ingest(ITEMS, output, concurrency=2))
+    assert (stats.ok, stats.errors, stats.rejected, stats.unrouted) == (1, 1, 1, 1)
+    assert sorted(record["line"] for record in ingest.load_results(output)) == [1, 2, 3, 4]
+
+    calls.clear()
+    stats = asyncio.run(ingest.ingest(ITEMS, output))
+    assert calls == ["boom"]
+    assert (stats.skipped, stats.errors, stats.done) == (3, 1, 4)
+    assert len(ingest.load_results(output)) == 4
+
+def test_changed_text_and_restart_run_again(tmp_path, calls):
+    output = str(tmp_path / "results.jsonl")
+    asyncio.run(ingest.ingest(ITEMS[:1], output))
+    calls.clear()
+    asyncio.run(ingest.ingest([(1, "sell 1 aapl")], output))
+    asyncio.run(ingest.ingest([(1, "sell 1 aapl")], output, restart=True))
+    assert calls == ["sell 1 aapl"] * 2
+
+def test_torn_last_line_is_ignored(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(json.dumps({"line": 1, "text": "a", "status": "ok"}) + "\n" + '{"line": 2, "te')
+    assert [record["line"] for record in ingest.load_results(str(output))] == [1]
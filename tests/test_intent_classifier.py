@@ -0,0 +1,43 @@
+import pytest
+
+from intent_classifier import MULTI_ROUTE, IntentClassifier
+
+@pytest.fixture
+def classifier():
+    return IntentClassifier()
+
+@pytest.mark.parametrize("text, route", [
+    ("Buy 250 AAPL in account capers", "orders"),
+    ("Show my holdings in capers", "holdings"),
+    ("What are my returns in ushy", "performance"),
+    ("Buy 10 AAPL and show my positions", MULTI_ROUTE),
+])
+def test_clear_intents(classifier, text, route):
+    assert classifier.classify(text).route == route
+
+@pytest.mark.parametrize("text", [
+    "Sell my position in AAPL",
+    "Reduce my position in TSLA in capers",
+    "Close out the positions in halifax",
+])
+def test_trading_a_position_is_an_order(classifier, text):
+    classification = classifier.classify(text)
+    assert classification.route == "orders"
+    assert classification.intents == ("orders",)
+
+def test_whole_words_only(classifier):
+    assert classifier.classify("what is the threshold").route is None
+    assert classifier.classify("it returned nothing").route is None
+
+def test_weak_evidence_goes_to_the_leading_intent(classifier):
+    classification = classifier.classify("What's my nav")
+    assert classification.ambiguous
+    assert classification.route == "performance"
+
+def test_tied_weak_evidence_is_unrouted_by_default(classifier):
+    classification = classifier.classify("portfolio nav")
+    assert classification.ambiguous
+    assert classification.route is None
+
+def test_tied_weak_evidence_uses_the_configured_fallback():
+    assert IntentClassifier(fallback=MULTI_ROUTE).classify("portfolio nav").route == MULTI_ROUTE
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_client import RateLimiter, TokenBucket, get_event_loop, run_sync
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_refills_evenly_up_to_its_burst():
+    clock = Clock()
+    bucket = TokenBucket(60, period=60, burst=0.5, clock=clock)
+    assert bucket.capacity == 30 and bucket.wait_time(30) == 0
+    bucket.take(30)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now = 1000
+    # Never more than the capacity, and a request larger than it only waits for a full bucket
+    assert bucket.wait_time(100) == 0
+
+def test_disabled_limiter_never_waits():
+    limiter = RateLimiter()
+    assert not limiter.enabled and limiter.acquire(10**6) == 0.0
+
+def test_higher_lanes_are_served_first():
+    # One request per 0.2s, none left after the first call
+    limiter = RateLimiter(rpm=1, period=0.2, burst=1.0)
+    limiter.acquire(lane=0)
+    served = []
+
+    def call(lane):
+        limiter.acquire(lane=lane)
+        served.append(lane)
+
+    threads = []
+    for lane in (2, 1, 0):
+        threads.append(threading.Thread(target=call, args=(lane,)))
+        threads[-1].start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert served == [0, 1, 2]
+    assert limiter.as_dict()["lanes"]["2"]["calls"] == 1
+    assert limiter.lanes[2].max_wait > limiter.lanes[0].max_wait
+
+def test_tokens_per_minute_are_limited():
+    limiter = RateLimiter(tpm=100, period=0.5, burst=1.0)
+    assert limiter.acquire(100) < 0.05
+    waited = asyncio.run(limiter.aacquire(50))
+    assert 0.15 < waited < 0.5
+
+def test_async_callers_wait_their_turn_without_polling():
+    limiter = RateLimiter(rpm=1, period=0.1, burst=1.0)
+    limiter.acquire()
+    tries = []
+    try_take = limiter._try_take
+
+    def counted(ticket, tokens):
+        tries.append(ticket)
+        return try_take(ticket, tokens)
+
+    limiter._try_take = counted
+
+    async def main():
+        served = []
+
+        async def call(lane):
+            await limiter.aacquire(lane=lane)
+            served.append(lane)
+
+        await asyncio.gather(call(2), call(1), call(0))
+        return served
+
+    assert asyncio.run(main()) == [0, 1, 2]
+    # Polling every few milliseconds would try dozens of times over the ~0.3s of waiting
+    assert len(tries) < 15 and not limiter._events and not limiter._queue
+
+def test_run_sync_uses_one_shared_loop():
+    async def loop_of(value):
+        await asyncio.sleep(0)
+        return asyncio.get_running_loop(), value
+
+    loop, value = run_sync(loop_of(1))
+    assert value == 1 and loop is get_event_loop() is run_sync(loop_of(2))[0]
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableLambda
+
+import pots_models
+from model_cascade import Cascade, CascadeStats, find_problem, parse_tier_spec
+from pots_models import Holdings, Order, Orders, PortfolioHolding, PortfolioPerformance, Performances
+
+def test_usable_results_pass():
+    assert find_problem(Orders(orders=[Order(action="buy", ticker="AAPL", quantity=10)])) is None
+    assert find_problem(Performances(performances=[PortfolioPerformance(start_date="2024-01-02", end_date="2024-03-28")])) is None
+
+def test_missing_and_empty_results():
+    assert find_problem(None) == "parse"
+    assert find_problem(Orders(orders=[])) == "empty"
+    assert find_problem(Orders(orders=[Order(action="buy", ticker="AAPL")])) == "missing quantity/weight"
+
+def test_unresolved_performance_dates_escalate():
+    result = Performances(performances=[PortfolioPerformance(start_date="Q1 2024")])
+    assert find_problem(result) == "unresolved start_date"
+
+def test_inverted_performance_dates_escalate():
+    result = Performances(performances=[PortfolioPerformance(start_date="2024-05-05", end_date="2024-05-02")])
+    assert find_problem(result) == "inverted dates"
+
+def test_unresolved_holding_dates_escalate():
+    result = Holdings(holdings=[PortfolioHolding(start_date="2024-01-02", end_date="around easter")])
+    assert find_problem(result) == "unresolved end_date"
+
+def test_tier_spec():
+    assert parse_tier_spec("gpt-4o-mini:512, gpt-4o") == [("gpt-4o-mini", 512), ("gpt-4o", None)]
+
+def test_route_version_needs_no_model_client(monkeypatch):
+    def no_clients():
+        raise AssertionError("route_version built the model clients")
+
+    monkeypatch.setattr(pots_models, "get_model_tiers", no_clients)
+    pots_models.reset_resources()
+    version = pots_models.route_version("orders")
+    monkeypatch.setattr(pots_models, "MODEL_TIERS", "gpt-4o")
+    pots_models.reset_resources()
+    assert pots_models.route_version("orders") != version
+
+GOOD = Orders(orders=[Order(action="buy", ticker="AAPL", quantity=10)])
+INCOMPLETE = Orders(orders=[Order(action="buy", ticker="AAPL")])
+
+def tier(answer):
+    """A tier answering `answer`, or raising it if it is an exception."""
+    def call(inputs):
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    return RunnableLambda(call)
+
+def test_cascade_escalates_until_a_usable_answer():
+    stats = CascadeStats()
+    cascade = Cascade([("mini", tier(INCOMPLETE)), ("mid", tier(OutputParserException("bad"))), ("big", tier(GOOD))], stats)
+    assert cascade.invoke({}) is GOOD
+    assert asyncio.run(cascade.as_runnable().ainvoke({})) is GOOD
+    tiers = stats.as_dict()
+    assert tiers["mini"]["escalation_reasons"] == {"missing quantity/weight": 2}
+    assert tiers["mid"]["escalation_reasons"] == {"parse": 2}
+    assert (tiers["big"]["calls"], tiers["big"]["hit_rate"]) == (2, 1.0)
+
+def test_cheap_tier_answer_is_used_when_usable():
+    stats = CascadeStats()
+    assert Cascade([("mini", tier(GOOD)), ("big", tier(AssertionError("called")))], stats).invoke({}) is GOOD
+    assert set(stats.as_dict()) == {"mini"}
+
+def test_last_tier_answer_is_final_but_not_counted_as_accepted():
+    stats = CascadeStats()
+    assert Cascade([("mini", tier(INCOMPLETE)), ("big", tier(INCOMPLETE))], stats).invoke({}) is INCOMPLETE
+    big = stats.as_dict()["big"]
+    assert (big["accepted"], big["rejected_final"], big["hit_rate"]) == (0, 1, 0.0)
+    with pytest.raises(OutputParserException):
+        Cascade([("big", tier(OutputParserException("bad")))], stats).invoke({})
+    assert stats.as_dict()["big"]["errors"] == 1
+
+def test_provider_errors_are_recorded_against_their_tier():
+    stats = CascadeStats()
+    cascade = Cascade([("mini", tier(ConnectionError("down"))), ("big", tier(GOOD))], stats)
+    with pytest.raises(ConnectionError):
+        cascade.invoke({})
+    with pytest.raises(ConnectionError):
+        asyncio.run(cascade.ainvoke({}))
+    assert set(stats.as_dict()) == {"mini"}
+    assert (stats.as_dict()["mini"]["calls"], stats.as_dict()["mini"]["errors"]) == (2, 2)
@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from order_queue import OrderQueue, QueueClosedError, QueueFullError, idempotency_key, read_log
+from pots_models import Order
+
+ORDER = {"action": "buy", "ticker": "aapl", "quantity": 250, "weight": None, "accounts": ["capers"]}
+OTHER = {"action": "sell", "ticker": "msft", "quantity": 10, "weight": None, "accounts": ["ushy"]}
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "orders.wal")
+
+def open_queue(path):
+    return OrderQueue(path, max_delay=0, fsync=False)
+
+class FailingFile:
+    """Writes half of what it is given, then fails, like a disk filling up mid-batch."""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        self.file.write(data[:len(data) // 2])
+        self.file.flush()
+        raise OSError("disk full")
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+def test_idempotency_key_depends_on_scope_and_content():
+    assert idempotency_key(ORDER, "a") == idempotency_key(dict(ORDER, ticker="AAPL"), "a")
+    assert idempotency_key(ORDER, "a") != idempotency_key(ORDER, "b")
+
+def test_resubmitting_in_the_same_scope_is_a_no_op(path):
+    order_queue = open_queue(path)
+    assert not order_queue.submit(ORDER, scope="run-1").duplicate
+    assert order_queue.submit(ORDER, scope="run-1").duplicate
+    assert not order_queue.submit(ORDER, scope="run-2").duplicate
+    assert len(order_queue.pending()) == 2
+    order_queue.close()
+
+def test_unacknowledged_orders_are_replayed(path):
+    order_queue = open_queue(path)
+    first = order_queue.submit(ORDER, scope="s")
+    order_queue.submit(OTHER, scope="s")
+    order_queue.ack(first.key)
+    order_queue.close()
+
+    reopened = open_queue(path)
+    assert [item.order["ticker"] for item in reopened.pending()] == ["MSFT"]
+    assert reopened.submit(ORDER, scope="s").duplicate
+    reopened.close()
+
+def test_torn_tail_is_dropped_on_replay(path):
+    order_queue = open_queue(path)
+    order_queue.submit(ORDER, scope="s")
+    order_queue.close()
+    with open(path, "ab") as f:
+        f.write(b"0000 torn")
+
+    reopened = open_queue(path)
+    assert len(reopened.pending()) == 1
+    reopened.close()
+
+def test_failed_write_does_not_hide_later_orders(path):
+    order_queue = open_queue(path)
+    order_queue.submit(ORDER, scope="s")
+    order_queue._file = FailingFile(order_queue._file)
+    with pytest.raises(OSError):
+        order_queue.submit(OTHER, scope="s")
+    # The failed order can be retried, and later commits follow the last good record
+    order_queue.submit(OTHER, scope="s")
+    order_queue.close()
+
+    records, valid = read_log(path)
+    assert [record["order"]["ticker"] for record in records] == ["AAPL", "MSFT"]
+    reopened = open_queue(path)
+    assert len(reopened.pending()) == 2
+    reopened.close()
+
+def test_failed_ack_leaves_the_order_unacknowledged(path):
+    order_queue = open_queue(path)
+    result = order_queue.submit(ORDER, scope="s")
+    order_queue._file = FailingFile(order_queue._file)
+    with pytest.raises(OSError):
+        order_queue.ack(result.key)
+    assert [item.key for item in order_queue.pending()] == [result.key]
+    order_queue.ack(result.key)
+    assert order_queue.pending() == []
+    order_queue.close()
+
+    reopened = open_queue(path)
+    assert reopened.pending() == []
+    reopened.close()
+
+def test_close_fails_blocked_submitters_and_later_acks(path):
+    order_queue = OrderQueue(path, capacity=1, max_delay=0, fsync=False)
+    first = order_queue.submit(ORDER)
+    errors = []
+
+    def blocked_submit():
+        try:
+            order_queue.submit(OTHER)
+        except QueueClosedError as e:
+            errors.append(e)
+
+    submitter = threading.Thread(target=blocked_submit)
+    submitter.start()
+    time.sleep(0.05)
+    order_queue.close()
+    submitter.join(timeout=5)
+    assert not submitter.is_alive() and len(errors) == 1
+    with pytest.raises(QueueClosedError):
+        order_queue.ack(first.key)
+
+class RefusingQueue:
+    def __init__(self, error):
+        self.error = error
+
+    def submit_many(self, orders, scope, timeout):
+        raise self.error
+
+@pytest.mark.parametrize("error", [QueueFullError("full"), QueueClosedError("closed"), OSError("disk full")])
+def test_refused_orders_are_reported_not_raised(monkeypatch, error):
+    import utils
+
+    monkeypatch.setattr(utils, "get_order_queue", lambda: RefusingQueue(error))
+    assert utils.queue_orders([Order(action="buy", ticker="AAPL", quantity=1)], "submission") is None
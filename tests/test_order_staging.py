@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from order_staging import MarketState, allocate, stage_orders
+from pots_models import Order
+
+@pytest.fixture
+def market():
+    # A holds 100 AAPL and 50 MSFT, B holds 300 AAPL; AAPL is 10, MSFT is 20
+    return MarketState(
+        accounts=["A", "B"],
+        account_codes=np.array([0, 0, 1]),
+        ticker_codes=np.array([0, 1, 0]),
+        quantity=np.array([100.0, 50.0, 300.0]),
+        prices={"AAPL": 10.0, "MSFT": 20.0},
+    )
+
+def test_allocate_adds_up_in_whole_lots():
+    shares = allocate(1050, np.array([1.0, 1.0, 1.0]), lot=100)
+    assert list(shares) == [400, 300, 300]
+    assert list(allocate(10, np.array([1.0, 2.0]))) == [3, 7]
+    assert list(allocate(10, np.zeros(2))) == [0, 0]
+
+def test_navs_default_to_market_value(market):
+    assert list(market.navs) == [2000.0, 3000.0]
+
+def test_buy_quantity_follows_account_size(market):
+    staged = stage_orders([Order(action="buy", ticker="AAPL", quantity=100, accounts=["A", "B"])], market)
+    assert dict(zip(staged.blotter["account"], staged.blotter["quantity"])) == {"A": 40, "B": 60}
+
+def test_sell_quantity_follows_holdings_and_is_capped(market):
+    staged = stage_orders([Order(action="sell", ticker="AAPL", quantity=1000, accounts=["ALL"])], market)
+    rows = dict(zip(staged.blotter["account"], staged.blotter["target_position"]))
+    assert rows == {"A": 0, "B": 0}
+
+def test_weight_order_is_sized_from_nav(market):
+    staged = stage_orders([Order(action="buy", ticker="MSFT", weight=10.0, accounts=["B"])], market)
+    # 10% of a 3000 NAV at 20 a share
+    assert list(staged.blotter["quantity"]) == [15]
+    assert staged.blotter["weight_pct"][0] == pytest.approx(10.0)
+
+def test_problems_become_warnings(market):
+    staged = stage_orders([
+        Order(action="hold", ticker="AAPL", quantity=1),
+        Order(action="buy", ticker="AAPL"),
+        Order(action="buy", ticker="ZZZ", quantity=1, accounts=["A"]),
+        Order(action="buy", ticker="AAPL", quantity=10, accounts=["A", "NOPE"]),
+    ], market)
+    assert len(staged.warnings) == 4
+    assert list(staged.blotter["account"]) == ["A"]
+
+def test_names_match_ignoring_case(market):
+    staged = stage_orders([Order(action="buy", ticker="msft", quantity=10, accounts=["b"])], market)
+    assert list(zip(staged.blotter["account"], staged.blotter["ticker"], staged.blotter["quantity"])) == [("B", "MSFT", 10)]
+    assert staged.warnings == []
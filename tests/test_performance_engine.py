@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from date_resolver import DateRangeError
+from performance_engine import PerformanceEngine
+from pots_models import PortfolioPerformance
+from reference_data import UnresolvedReferenceError
+
+@pytest.fixture
+def engine():
+    engine = PerformanceEngine(["CAPERS", "USHY"])
+    engine.extend(
+        ["2024-01-02", "2024-01-03", "2024-01-04"],
+        ["CAPERS", "USHY"],
+        np.array([[0.01, 0.0], [0.02, 0.01], [-0.01, 0.02]]),
+    )
+    return engine
+
+def test_period_return_compounds_daily_returns(engine):
+    returns = engine.period_returns(["CAPERS", "UNKNOWN"], "2024-01-02", "2024-01-03")
+    assert returns[0] == pytest.approx(1.01 * 1.02 - 1)
+    assert np.isnan(returns[1])
+
+def test_without_an_end_date_the_period_runs_to_the_latest_date(engine):
+    result = engine.evaluate(PortfolioPerformance(accounts="CAPERS", start_date="2024-01-03"))
+    assert result["end_date"][0] == np.datetime64("2024-01-04")
+    assert result["return_pct"][0] == pytest.approx((1.02 * 0.99 - 1) * 100)
+
+def test_accounts_match_ignoring_case(engine):
+    result = engine.evaluate(PortfolioPerformance(accounts="capers", start_date="2024-01-02", end_date="2024-01-03"))
+    assert list(result["account"]) == ["CAPERS"]
+    assert result["return_pct"][0] == pytest.approx((1.01 * 1.02 - 1) * 100)
+
+def test_accounts_without_history_are_reported(engine):
+    with pytest.raises(UnresolvedReferenceError, match="halifax"):
+        engine.evaluate(PortfolioPerformance(accounts="capers,halifax", start_date="2024-01-02"))
+
+def test_comparison_carries_excess_over_the_first_account(engine):
+    result = engine.evaluate(PortfolioPerformance(accounts="CAPERS,USHY", start_date="2024-01-02", end_date="2024-01-04"))
+    assert result["excess_vs_first_pct"][0] == 0.0
+    assert list(result["account"]) == ["CAPERS", "USHY"]
+
+def test_inverted_range_is_rejected(engine):
+    with pytest.raises(DateRangeError, match="before the start date"):
+        engine.evaluate(PortfolioPerformance(accounts="CAPERS", start_date="2024-01-04", end_date="2024-01-02"))
+
+def test_unresolved_date_is_rejected_with_a_message(engine):
+    with pytest.raises(DateRangeError, match="Q7 2024"):
+        engine.evaluate(PortfolioPerformance(accounts="CAPERS", start_date="Q7 2024"))
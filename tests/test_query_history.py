@@ -0,0 +1,38 @@
+import numpy as np
+
+import utils
+from pots_models import Holdings, Order, Orders, PortfolioHolding
+from query_history import QueryHistory
+
+def test_same_query_replaces_its_entry():
+    history = QueryHistory()
+    history.add("Buy 10 AAPL", None, 0.1)
+    entry = history.add("buy 10 aapl ", None, 0.2)
+    assert len(history) == 1 and history.get("BUY 10 AAPL") is entry
+
+def test_oldest_entries_are_evicted_by_count():
+    history = QueryHistory(max_entries=2)
+    for text in ("a", "b", "c"):
+        history.add(text, None, 0.0)
+    assert [entry.query for entry in history.entries()] == ["c", "b"]
+
+def test_fetched_data_counts_towards_the_byte_budget():
+    data = utils.ResultData(positions=[{"quantity": np.zeros(1000)}])
+    history = QueryHistory(max_bytes=10_000)
+    history.add("old", Orders(orders=[Order(action="buy", ticker="AAPL", quantity=1)]), 0.0)
+    entry = history.add("new", None, 0.0, data=data)
+    assert entry.size == 8000 and entry.data is data
+    history.add("newer", None, 0.0, data=data)
+    assert [entry.query for entry in history.entries()] == ["newer"]
+
+def test_result_data_is_fetched_per_item(monkeypatch):
+    monkeypatch.setattr(utils, "fetch_holdings", lambda holding: {"ticker": np.array([holding.ticker])})
+    monkeypatch.setattr(utils, "stream_holdings_diff", lambda holding, rows: iter([({"n": np.zeros(1)}, "first"), ({"n": np.zeros(2)}, "last")]))
+    result = Holdings(holdings=[
+        PortfolioHolding(ticker="AAPL", start_date="2024-01-02"),
+        PortfolioHolding(ticker="MSFT", start_date="2024-01-02", end_date="2024-03-28"),
+    ])
+    data = utils.fetch_result_data(result)
+    assert data.positions[0]["ticker"][0] == "AAPL" and data.positions[1] is None
+    assert data.diffs[0] is None and data.diffs[1][1] == "last"
+    assert data.staged is None and data.returns == []
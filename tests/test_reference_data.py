@@ -0,0 +1,95 @@
+import pytest
+
+from holdings_store import HoldingsStore
+from performance_engine import PerformanceEngine
+from pots_models import Holdings, Order, Orders, PortfolioHolding
+from reference_data import (
+    DEMO_REFERENCE_DIR,
+    ReferenceIndex,
+    UnresolvedReferenceError,
+    load_book_index,
+    load_default_index,
+    load_index,
+    resolve_references,
+)
+
+@pytest.fixture
+def index():
+    return ReferenceIndex(
+        accounts=["CAPERS", "USHY", "HALIFAX"],
+        tickers=["AAPL", "MSFT"],
+        account_names={"CAPERS": "Capers Equity Fund"},
+        security_names={"AAPL": "Apple Inc"},
+    )
+
+def test_no_master_and_no_book_means_no_index(monkeypatch):
+    monkeypatch.delenv("POMS_REFERENCE_DIR", raising=False)
+    assert load_default_index() is None
+
+@pytest.fixture
+def book(tmp_path, monkeypatch):
+    """A holdings store with CAPERS and USHY, and a return history that also has HALIFAX."""
+    root, path = str(tmp_path / "holdings"), str(tmp_path / "performance.npz")
+    HoldingsStore(root).write_snapshot(
+        "2024-01-02", accounts=["CAPERS", "USHY"], tickers=["TSLA", "AAPL"], quantity=[10, 20], price=[1.0, 1.0]
+    )
+    engine = PerformanceEngine()
+    engine.extend(["2024-01-02"], ["CAPERS", "HALIFAX"], [[0.01, 0.02]])
+    engine.save(path)
+    monkeypatch.delenv("POMS_REFERENCE_DIR", raising=False)
+    monkeypatch.setenv("POMS_HOLDINGS_DIR", root)
+    monkeypatch.setenv("POMS_PERFORMANCE_PATH", path)
+
+def test_without_a_master_the_book_is_the_master(book):
+    index = load_default_index()
+    assert index.accounts == ("CAPERS", "USHY", "HALIFAX") and index.tickers == ("TSLA", "AAPL")
+    assert index.version == load_book_index().version
+
+def test_book_master_canonicalizes_names_and_expands_all(book):
+    result = Holdings(holdings=[
+        PortfolioHolding(ticker="tsla", accounts=["capers"]),
+        PortfolioHolding(ticker="orcl", accounts=["ALL"]),
+    ])
+    first, second = resolve_references(result, load_default_index()).holdings
+    assert (first.ticker, first.accounts) == ("TSLA", ["CAPERS"])
+    # Only held securities are known, so a new ticker is let through
+    assert (second.ticker, second.accounts) == ("ORCL", ["CAPERS", "USHY", "HALIFAX"])
+
+def test_book_master_rejects_unknown_accounts(book):
+    result = Orders(orders=[Order(action="buy", ticker="AAPL", quantity=1, accounts=["nowhere"])])
+    with pytest.raises(UnresolvedReferenceError, match="nowhere"):
+        resolve_references(result, load_default_index())
+
+def test_configured_master_is_loaded(monkeypatch):
+    monkeypatch.setenv("POMS_REFERENCE_DIR", DEMO_REFERENCE_DIR)
+    assert "CAPERS" in load_default_index().accounts
+
+def test_missing_master_files(tmp_path):
+    assert load_index(str(tmp_path)) is None
+
+def test_names_pass_through_without_an_index():
+    result = Orders(orders=[Order(action="buy", ticker="ORCL", quantity=100, accounts=["anything"])])
+    assert resolve_references(result, None).orders[0].ticker == "ORCL"
+
+def test_accounts_resolve_by_exact_code_or_name(index):
+    assert index.resolve_account("capers") == "CAPERS"
+    assert index.resolve_account("Capers Equity Fund") == "CAPERS"
+
+def test_account_prefix_and_typo_are_not_resolved(index):
+    assert index.resolve_account("cap") is None
+    assert index.resolve_account("capres") is None
+
+def test_unknown_account_error_suggests_near_matches(index):
+    result = Orders(orders=[Order(action="buy", ticker="AAPL", quantity=1, accounts=["cap"])])
+    with pytest.raises(UnresolvedReferenceError) as error:
+        resolve_references(result, index)
+    assert error.value.accounts == ["cap"]
+    assert error.value.suggestions == {"cap": ["CAPERS"]}
+    assert "did you mean CAPERS" in str(error.value)
+
+def test_all_expands_to_every_account(index):
+    assert index.resolve_accounts(["ALL"]) == (["CAPERS", "USHY", "HALIFAX"], [])
+
+def test_tickers_resolve_by_issuer_name(index):
+    assert index.resolve_ticker("apple inc") == "AAPL"
+    assert index.resolve_ticker("ORCL") is None
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    Resilience,
+    ResiliencePolicy,
+    is_retryable,
+    parse_deadlines,
+)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+def status_error(cls, status):
+    return cls("provider said no", response=httpx.Response(status, request=REQUEST), body=None)
+
+@pytest.mark.parametrize("error", [
+    ConnectionError("reset"),
+    DeadlineExceeded("slow"),
+    openai.APITimeoutError(REQUEST),
+    openai.APIConnectionError(request=REQUEST),
+    status_error(openai.RateLimitError, 429),
+    status_error(openai.InternalServerError, 503),
+])
+def test_transient_provider_errors_are_retryable(error):
+    assert is_retryable(error)
+
+@pytest.mark.parametrize("error", [
+    ValueError("bad output"),
+    TypeError("bug"),
+    KeyError("bug"),
+    AttributeError("bug"),
+    status_error(openai.BadRequestError, 400),
+    status_error(openai.AuthenticationError, 401),
+])
+def test_other_errors_are_not_retryable(error):
+    assert not is_retryable(error)
+
+def test_parse_deadlines():
+    assert parse_deadlines("orders=5, holdings=2.5,,bad") == {"orders": 5.0, "holdings": 2.5}
+
+def test_breaker_opens_probes_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker(error_rate=0.5, window=4, min_calls=4, cooldown=10, clock=clock)
+    for ok in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.is_open and not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow() and not breaker.allow()  # a single half-open probe
+    breaker.record(False)
+    assert breaker.is_open and breaker.trips == 2
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def policy(**overrides):
+    return ResiliencePolicy(**{"deadline": 2.0, "hedge_percentile": 0, "backoff_base": 0.001, **overrides})
+
+def flaky(failures, error=ConnectionError):
+    """A call failing `failures` times before it answers "ok"."""
+    calls = []
+
+    def function():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error("provider down")
+        return "ok"
+
+    return function, calls
+
+def test_provider_errors_are_retried():
+    resilience = Resilience(policy(retries=2), seed=0)
+    function, calls = flaky(2)
+    assert resilience.call("orders", function) == "ok"
+    assert len(calls) == 3 and resilience.stats.retries == 2
+
+    function, calls = flaky(5)
+    with pytest.raises(ConnectionError):
+        resilience.call("orders", function)
+    assert len(calls) == 3 and resilience.stats.failed == 1
+
+def test_unusable_output_is_not_retried_or_held_against_the_breaker():
+    resilience = Resilience(policy(), CircuitBreaker(min_calls=1, error_rate=0.5))
+    function, calls = flaky(1, ValueError)
+    with pytest.raises(ValueError):
+        resilience.call("orders", function)
+    assert len(calls) == 1 and not resilience.breaker.is_open
+
+def test_open_breaker_fails_fast():
+    resilience = Resilience(policy(retries=0), CircuitBreaker(min_calls=1, error_rate=0.5))
+    with pytest.raises(ConnectionError):
+        resilience.call("orders", flaky(1)[0])
+    function, calls = flaky(0)
+    with pytest.raises(CircuitOpenError):
+        resilience.call("orders", function)
+    assert not calls and resilience.stats.rejected == 1
+
+def test_deadline():
+    resilience = Resilience(policy(route_deadlines={"orders": 0.05}))
+    release = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        resilience.call("orders", release.wait)
+    release.set()
+    assert resilience.stats.deadline_exceeded == 1
+
+def test_hedge_answers_a_stuck_call():
+    resilience = Resilience(policy(hedge_percentile=0.95, hedge_min_delay=0.02, hedge_default_delay=0.02, hedge_budget=1.0))
+    release = threading.Event()
+    calls = []
+
+    def function():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait()
+            return "slow"
+        return "fast"
+
+    assert resilience.call("orders", function) == "fast"
+    release.set()
+    assert (resilience.stats.hedges, resilience.stats.hedge_wins) == (1, 1)
+
+def test_async_retry_and_hedge():
+    resilience = Resilience(policy(hedge_percentile=0.95, hedge_min_delay=0.02, hedge_default_delay=0.02, hedge_budget=1.0))
+    attempts = []
+
+    async def function():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("provider down")
+        if len(attempts) == 2:
+            await asyncio.sleep(1)
+            return "slow"
+        return "fast"
+
+    start = time.monotonic()
+    assert asyncio.run(resilience.acall("orders", function)) == "fast"
+    assert time.monotonic() - start < 1
+    assert (resilience.stats.retries, resilience.stats.hedge_wins) == (1, 1)
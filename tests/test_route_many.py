@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+import pots_models
+from pots_models import Holdings, Order, Orders, PortfolioPerformance, Performances
+from resilience import Resilience, ResiliencePolicy
+from tracing import Tracer
+
+RESULTS = {
+    "orders": Orders(orders=[Order(action="buy", ticker="AAPL", quantity=1)]),
+    "holdings": Holdings(holdings=[]),
+    "performance": Performances(performances=[PortfolioPerformance(start_date="2024-01-02")]),
+}
+
+class Runnable:
+    """Records how many calls are in flight at once, across every route."""
+    lock = threading.Lock()
+    active = peak = 0
+
+    def __init__(self, route):
+        self.route = route
+
+    def invoke(self, inputs, config=None):
+        with Runnable.lock:
+            Runnable.active += 1
+            Runnable.peak = max(Runnable.peak, Runnable.active)
+        time.sleep(0.02)
+        with Runnable.lock:
+            Runnable.active -= 1
+        return RESULTS[self.route]
+
+@pytest.fixture(autouse=True)
+def runnables(monkeypatch):
+    Runnable.active = Runnable.peak = 0
+    monkeypatch.setattr(pots_models, "get_runnable", Runnable)
+    monkeypatch.setattr(pots_models, "tracer", Tracer(None))
+    monkeypatch.setattr(pots_models, "resilience", Resilience(ResiliencePolicy(retries=2, backoff_base=0.001)))
+    monkeypatch.setattr(pots_models, "route_inputs", lambda route, text: {"text": text})
+
+TEXTS = (
+    ["buy 10 aapl for me sometime"] * 5
+    + ["show me the exposure of everything please"] * 3
+    + ["how did we perform lately, returns please"] * 2
+)
+
+@pytest.mark.parametrize("max_concurrency", [1, 2, 3, 8])
+def test_concurrency_limit_holds_across_routes(max_concurrency):
+    batch = pots_models.route_many(TEXTS, max_concurrency=max_concurrency, use_cache=False, use_fast_path=False)
+    assert not batch.errors
+    assert Runnable.peak <= max_concurrency
+    assert [type(result).__name__ for result in batch.results] == ["Orders"] * 5 + ["Holdings"] * 3 + ["Performances"] * 2
+
+def test_unrouted_texts_stay_empty():
+    batch = pots_models.route_many(["hello there", TEXTS[0]], use_cache=False, use_fast_path=False)
+    assert batch.results[0] is None and list(batch.successes) == [1]
+
+def test_items_are_traced_and_called_through_the_resilience_layer(monkeypatch):
+    calls = []
+
+    class Flaky(Runnable):
+        def invoke(self, inputs, config=None):
+            calls.append(inputs["text"])
+            if len(calls) == 1:
+                raise ConnectionError("provider blip")
+            return super().invoke(inputs, config)
+
+    monkeypatch.setattr(pots_models, "get_runnable", Flaky)
+    batch = pots_models.route_many([TEXTS[0], "hello there"], use_cache=False, use_fast_path=False)
+    assert type(batch.results[0]).__name__ == "Orders" and not batch.errors
+    assert pots_models.resilience.stats.retries == 1
+    assert pots_models.tracer.outcomes == {("orders", "llm"): 1, ("none", "unrouted"): 1}
+
+@pytest.mark.parametrize("max_concurrency", [0, -1])
+def test_bad_concurrency_is_an_error(max_concurrency):
+    with pytest.raises(ValueError):
+        pots_models.route_many(TEXTS, max_concurrency=max_concurrency)
@@ -0,0 +1,77 @@
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import service
+from service import ExtractionServer, SingleFlight
+
+@pytest.fixture
+def server():
+    server = ExtractionServer(("127.0.0.1", 0), workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def post(server, path, body):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.server_address[1]}{path}",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+@pytest.mark.parametrize("max_concurrency", ["eight", None, 0, -3, 2.5, True, [4]])
+def test_bad_batch_concurrency_is_a_bad_request(server, max_concurrency):
+    status, body = post(server, "/extract/batch", {"texts": ["buy 10 aapl"], "max_concurrency": max_concurrency})
+    assert status == 400 and body["error"] == "BadRequest"
+
+def test_bad_text_is_a_bad_request(server):
+    assert post(server, "/extract", {"text": "  "})[0] == 400
+    assert post(server, "/extract/batch", {"texts": "buy 10 aapl"})[0] == 400
+
+def test_fast_path_batch(server):
+    status, body = post(server, "/extract/batch", {"texts": ["Buy 250 AAPL in account capers"], "max_concurrency": 2, "use_cache": False})
+    assert status == 200
+    assert body["results"][0]["result"]["orders"][0]["quantity"] == 250
+
+def connect(server):
+    return socket.create_connection(("127.0.0.1", server.server_address[1]), timeout=5)
+
+def read_all(connection):
+    data = b""
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+def test_oversized_body_closes_the_connection(server):
+    with connect(server) as connection:
+        connection.sendall(
+            b"POST /extract HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n\r\n{" % (service.MAX_BODY_BYTES + 1)
+        )
+        response = read_all(connection)
+    assert response.startswith(b"HTTP/1.1 413") and b"Connection: close" in response
+
+def test_idle_connections_are_dropped(monkeypatch, server):
+    monkeypatch.setattr(service.ExtractionHandler, "timeout", 0.2)
+    with connect(server) as connection:
+        assert read_all(connection) == b""
+
+def test_single_flight_result_is_set_before_the_key_is_forgotten():
+    flights = SingleFlight()
+    future, leader = flights.claim("key")
+    seen = []
+    future.add_done_callback(lambda done: seen.append("key" in flights._flights))
+    flights.resolve("key", future, result=1)
+    assert leader and seen == [True] and "key" not in flights._flights
@@ -0,0 +1,46 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pots_models import Order, Orders
+from stub_llm import StubChatModel, StubOpenAIServer, StubProviderError
+
+ANSWERS = {"buy 10 aapl": [Orders(orders=[Order(action="buy", ticker="AAPL", quantity=10)])]}
+
+def test_stub_answers_with_bound_tool_calls():
+    model = StubChatModel(answers=ANSWERS).bind_tools([Orders])
+    message = model.invoke("buy 10 aapl")
+    assert [call["name"] for call in message.tool_calls] == ["Orders"]
+    assert message.tool_calls[0]["args"]["orders"][0]["quantity"] == 10
+    assert message.usage_metadata["input_tokens"] > 0
+
+def test_unknown_query_gets_an_empty_call():
+    message = StubChatModel(answers=ANSWERS).bind_tools([Orders]).invoke("hello")
+    assert message.tool_calls[0]["args"] == {"orders": []}
+
+def test_injected_failures():
+    with pytest.raises(StubProviderError):
+        StubChatModel(failure_rate=1.0).invoke("buy 10 aapl")
+
+def post(server, body):
+    request = urllib.request.Request(
+        server.base_url + "/chat/completions", json.dumps(body).encode(), {"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+def test_server_answers_and_rate_limits():
+    server = StubOpenAIServer(answers=ANSWERS, rpm=1).start()
+    try:
+        body = {"model": "stub", "messages": [{"role": "user", "content": "buy 10 aapl"}]}
+        answer = post(server, body)
+        arguments = json.loads(answer["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"])
+        assert arguments["orders"][0]["ticker"] == "AAPL"
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post(server, body)
+        assert error.value.code == 429 and float(error.value.headers["Retry-After"]) > 0
+        assert (server.stats["requests"], server.stats["limited"]) == (2, 1)
+    finally:
+        server.close()
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+
+from stub_llm import StubChatModel
+from tracing import Tracer, current_trace
+
+def test_trace_collects_stages_and_outcome(tmp_path):
+    path = tmp_path / "traces" / "traces.jsonl"
+    tracer = Tracer(str(path))
+    with tracer.trace("buy 10 aapl") as trace:
+        assert current_trace() is trace
+        with tracer.timed("route"):
+            pass
+        tracer.annotate(route="orders", outcome="fast_path")
+    assert current_trace() is None
+    with tracer.timed("outside"):
+        pass
+
+    tracer.close()
+    record = json.loads(path.read_text())
+    assert (record["query"], record["route"], record["outcome"]) == ("buy 10 aapl", "orders", "fast_path")
+    assert set(record["stages_ms"]) == {"route"}
+    assert set(tracer.snapshot()) == {"route", "outside", "total"}
+    assert tracer.outcomes == {("orders", "fast_path"): 1}
+
+def test_failed_extraction_is_traced_as_an_error():
+    tracer = Tracer()
+    with pytest.raises(KeyError):
+        with tracer.trace("boom"):
+            raise KeyError("x")
+    assert tracer.outcomes == {("none", "error"): 1}
+
+def test_callback_times_prompt_and_model_and_counts_tokens():
+    tracer = Tracer()
+    chain = ChatPromptTemplate.from_messages([("human", "{text}")]) | StubChatModel()
+    with tracer.trace("hello") as trace:
+        chain.invoke({"text": "hello"}, config={"callbacks": [tracer.callback()]})
+    assert {"prompt", "llm"} <= set(trace.stages)
+    assert trace.input_tokens > 0 and tracer.tokens["input"] == trace.input_tokens
+
+def test_prometheus_text():
+    tracer = Tracer()
+    tracer.observe("llm", 0.25)
+    tracer.add_tokens(None, 10, 2)
+    text = tracer.prometheus()
+    assert 'poms_stage_seconds{stage="llm",quantile="0.5"} 0.250000' in text
+    assert 'poms_stage_seconds_count{stage="llm"} 1' in text
+    assert 'poms_tokens_total{kind="output"} 2' in text
+    tracer.reset()
+    assert "llm" not in tracer.prometheus()
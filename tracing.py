@@ -0,0 +1,275 @@
+"""
+Pipeline tracing for P.O.M.S - Portfolio and OMS System
+
+Each extraction gets a Trace recording the route chosen, how it was answered
+(cache, fast path, LLM, degraded fallback), per-stage latencies and token
+counts. Stages inside the LLM runnables (prompt rendering, the model call,
+tool-call parsing and validation) are timed by a LangChain callback handler;
+the rest of the pipeline and the UI time themselves with `tracer.timed`.
+
+Finished traces are appended to a JSONL file, and rolling per-stage
+percentiles plus cumulative counters are kept in memory for the app's
+sidebar and the service's Prometheus-text /metrics endpoint. Recording is a
+few dict updates and one buffered line write per query, cheap enough to
+leave on.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, Optional
+
+# Runnable names (as reported to callbacks) timed as pipeline stages
+CHAIN_STAGES = {
+    "ChatPromptTemplate": "prompt",
+    "PydanticToolsParser": "parse",
+    "merge_tool_results": "parse",
+}
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("poms_trace", default=None)
+
+@dataclass
+class Trace:
+    """What happened to one query."""
+    query: str
+    route: Optional[str] = None
+    outcome: Optional[str] = None
+    error: Optional[str] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total: float = 0.0
+    timestamp: float = field(default_factory=time.time)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "timestamp": self.timestamp,
+            "query": self.query,
+            "route": self.route,
+            "outcome": self.outcome,
+            "error": self.error,
+            "total_ms": round(self.total * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+@dataclass
+class StageStats:
+    """Cumulative count and time of a stage, plus a window of recent samples."""
+    count: int = 0
+    total_seconds: float = 0.0
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def quantile(self, q: float) -> float:
+        recent = sorted(self.recent)
+        return recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0.0
+
+def current_trace() -> Optional[Trace]:
+    """The trace of the extraction running in this context, if any."""
+    return _current.get()
+
+@functools.lru_cache(maxsize=None)
+def _handler_class():
+    """TracingCallbackHandler, defined on first use so importing this module does not import LangChain."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TracingCallbackHandler(BaseCallbackHandler):
+        """Times the prompt, model and parser runs of one trace and counts its tokens."""
+
+        # Called in the caller's thread or event loop rather than an executor
+        run_inline = True
+
+        def __init__(self, tracer: "Tracer", trace: Trace):
+            self.tracer = tracer
+            self.trace = trace
+            self._starts: Dict[Any, tuple] = {}
+
+        def _start(self, run_id, stage: Optional[str]):
+            if stage is not None:
+                self._starts[run_id] = (stage, time.perf_counter())
+
+        def _end(self, run_id):
+            started = self._starts.pop(run_id, None)
+            if started is not None:
+                stage, start = started
+                self.tracer.observe(stage, time.perf_counter() - start, self.trace)
+
+        def on_chain_start(self, serialized, inputs, *, run_id, name=None, **kwargs):
+            name = name or (serialized or {}).get("name")
+            self._start(run_id, CHAIN_STAGES.get(name))
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._start(run_id, "llm")
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start(run_id, "llm")
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            self._end(run_id)
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    self.tracer.add_tokens(self.trace, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id)
+
+    return TracingCallbackHandler
+
+class Tracer:
+    """Collects traces and per-stage latency statistics."""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: JSONL file finished traces are appended to, or None to keep them in memory only
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self.stages: Dict[str, StageStats] = {}
+        self.outcomes: Dict[tuple, int] = {}
+        self.tokens = {"input": 0, "output": 0}
+
+    def _sample(self, stage: str, seconds: float):
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+        stats.count += 1
+        stats.total_seconds += seconds
+        stats.recent.append(seconds)
+
+    def observe(self, stage: str, seconds: float, trace: Optional[Trace] = None):
+        """Record one stage timing, adding it to `trace` (default: the current one)."""
+        trace = trace or _current.get()
+        with self._lock:
+            self._sample(stage, seconds)
+            if trace is not None:
+                trace.stages[stage] = trace.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        """Time a block as a stage of the current trace (if any) and of the rolling statistics."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def add_tokens(self, trace: Optional[Trace], input_tokens: int, output_tokens: int):
+        with self._lock:
+            self.tokens["input"] += input_tokens
+            self.tokens["output"] += output_tokens
+            if trace is not None:
+                trace.input_tokens += input_tokens
+                trace.output_tokens += output_tokens
+
+    def annotate(self, **fields: Any):
+        """Set fields (route, outcome, ...) of the current trace, if any."""
+        trace = _current.get()
+        if trace is not None:
+            for name, value in fields.items():
+                setattr(trace, name, value)
+
+    def callback(self, trace: Optional[Trace] = None):
+        """A LangChain callback handler feeding `trace` (default: the current one)."""
+        return _handler_class()(self, trace or _current.get())
+
+    @contextmanager
+    def trace(self, query: str) -> Iterator[Trace]:
+        """Trace one extraction; the trace is current inside the block and recorded when it ends."""
+        trace = Trace(query)
+        token = _current.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        except Exception as e:
+            trace.outcome, trace.error = "error", type(e).__name__
+            raise
+        finally:
+            trace.total = time.perf_counter() - start
+            _current.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace: Trace):
+        """Count a finished trace and append it to the JSONL file."""
+        line = json.dumps(trace.as_dict()) + "\n" if self.path else None
+        with self._lock:
+            self._sample("total", trace.total)
+            key = (trace.route or "none", trace.outcome or "unknown")
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+            if line is not None:
+                try:
+                    if self._file is None:
+                        directory = os.path.dirname(self.path)
+                        if directory:
+                            os.makedirs(directory, exist_ok=True)
+                        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+                    self._file.write(line)
+                except OSError:
+                    # A full or read-only disk must not break extraction
+                    pass
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage count, mean and rolling percentiles in milliseconds."""
+        with self._lock:
+            return {
+                stage: {
+                    "count": stats.count,
+                    "mean_ms": stats.total_seconds / stats.count * 1000 if stats.count else 0.0,
+                    **{f"p{int(q * 100)}_ms": stats.quantile(q) * 1000 for q in QUANTILES},
+                }
+                for stage, stats in self.stages.items()
+            }
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP poms_stage_seconds Extraction pipeline stage latency (quantiles over recent samples)",
+            "# TYPE poms_stage_seconds summary",
+        ]
+        with self._lock:
+            for stage, stats in sorted(self.stages.items()):
+                for q in QUANTILES:
+                    lines.append(f'poms_stage_seconds{{stage="{stage}",quantile="{q}"}} {stats.quantile(q):.6f}')
+                lines.append(f'poms_stage_seconds_sum{{stage="{stage}"}} {stats.total_seconds:.6f}')
+                lines.append(f'poms_stage_seconds_count{{stage="{stage}"}} {stats.count}')
+            lines += [
+                "# HELP poms_extractions_total Extractions by route and outcome",
+                "# TYPE poms_extractions_total counter",
+            ]
+            for (route, outcome), count in sorted(self.outcomes.items()):
+                lines.append(f'poms_extractions_total{{route="{route}",outcome="{outcome}"}} {count}')
+            lines += ["# HELP poms_tokens_total LLM tokens used", "# TYPE poms_tokens_total counter"]
+            for kind, count in self.tokens.items():
+                lines.append(f'poms_tokens_total{{kind="{kind}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.outcomes.clear()
+            self.tokens = {"input": 0, "output": 0}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -1,10 +1,19 @@
 """
 UI Components for P.O.M.S - Portfolio and OMS System
 """
+import io
+import math
+import os
+import queue
+import pandas as pd
 import streamlit as st
-from typing import List, Any
-from pots_models import Order, PortfolioHolding, PortfolioPerformance
-from config import UI_TEXT, EXAMPLE_QUERIES
+from typing import List, Any, Dict, Optional, Tuple
+from pots_models import Order, PortfolioHolding, PortfolioPerformance, tracer
+from config import UI_TEXT, EXAMPLE_QUERIES, TABLE_MODE_THRESHOLD, TABLE_PAGE_SIZE
+from holdings_diff import DiffStats
+from ingest import read_instructions
+from order_staging import StagingResult
+from utils import ResultData, queue_orders, fetch_result_data, is_change_request, ingestion_output_path, start_ingestion
 
 def render_header():
     """Render the main header section."""
@@ -34,6 +43,37 @@ def render_sidebar():
             if st.button(f"📈 {example}", key=f"perf_{example}"):
                 st.session_state.query_text = example
 
+def render_history_sidebar():
+    """Render the session's query history; selecting an entry shows it without re-extracting."""
+    history = st.session_state.history
+    if not len(history):
+        return
+    with st.sidebar:
+        st.header("🕘 History")
+        for i, entry in enumerate(history.entries()):
+            status = "⚠️" if entry.error else "✅"
+            if st.button(f"{status} {entry.query} · {entry.elapsed:.2f}s", key=f"history_{i}_{entry.timestamp}", help=entry.error):
+                st.session_state.shown_queries = [entry.query]
+                st.session_state.query_text = entry.query
+                st.rerun()
+        st.caption(f"{len(history)} queries, {history.nbytes / 1024:.0f} KB")
+        if st.button("Clear history", key="clear_history"):
+            history.clear()
+            st.session_state.shown_queries = []
+            st.rerun()
+
+def render_metrics_sidebar():
+    """Render rolling per-stage latency percentiles of this process's extractions."""
+    snapshot = tracer.snapshot()
+    if not snapshot:
+        return
+    with st.sidebar:
+        with st.expander("⏱️ Pipeline latency", expanded=False):
+            frame = pd.DataFrame.from_dict(snapshot, orient="index")
+            frame.index.name = "stage"
+            st.dataframe(frame.round(1), use_container_width=True)
+            st.caption(f"Tokens used: {tracer.tokens['input']} in, {tracer.tokens['output']} out")
+
 def render_query_input():
     """Render the query input section."""
     query_text = st.text_area(
@@ -43,8 +83,50 @@ def render_query_input():
         placeholder=UI_TEXT["query_placeholder"],
         help=UI_TEXT["query_help"]
     )
+    st.toggle("Follow-up mode", key="follow_up", help=UI_TEXT["follow_up_help"])
     return query_text
 
+def render_ingestion():
+    """Render the bulk ingestion section: upload a file of instructions and extract every line."""
+    with st.expander("📂 Bulk ingestion", expanded=False):
+        upload = st.file_uploader("Instruction file (one per line, or a CSV with a 'text' column)", type=["txt", "csv"])
+        concurrency = st.number_input("Concurrent extractions", min_value=1, max_value=64, value=8)
+        if upload is None or not st.button("Ingest file", key="ingest_file"):
+            return
+
+        text = upload.getvalue().decode("utf-8-sig")
+        items = list(read_instructions(io.StringIO(text, newline=""), csv_format=upload.name.lower().endswith(".csv")))
+        output = ingestion_output_path(upload.name)
+        future, updates = start_ingestion(items, output, int(concurrency))
+
+        progress = st.progress(0.0, text="Starting...")
+        table = st.empty()
+        rows = []
+        while not (future.done() and updates.empty()):
+            batch = []
+            try:
+                batch.append(updates.get(timeout=0.25))
+                # Drain whatever else arrived before redrawing
+                while True:
+                    batch.append(updates.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                continue
+            for record, stats in batch:
+                rows.append({column: record[column] for column in ("line", "text", "status", "type", "error", "elapsed")})
+            progress.progress(stats.done / max(stats.total, 1), text=f"{stats.done}/{stats.total} lines ({stats.skipped} from checkpoint)")
+            table.dataframe(pd.DataFrame(rows[-TABLE_PAGE_SIZE:]), use_container_width=True, hide_index=True)
+
+        stats = future.result()
+        progress.progress(1.0, text=f"{stats.done}/{stats.total} lines")
+        st.write(f"✅ {stats.ok} extracted, {stats.unrouted} not understood, {stats.rejected} rejected, "
+                 f"{stats.errors} failed, {stats.skipped} already done ({stats.elapsed:.1f}s)")
+        if stats.errors:
+            st.warning("Some lines failed; ingest the same file again to retry only those lines.")
+        with open(output, "rb") as f:
+            st.download_button("Download results (JSONL)", f.read(), file_name=os.path.basename(output))
+
 def render_footer():
     """Render the footer section."""
     st.markdown("---")
@@ -57,15 +139,73 @@ def render_footer():
         unsafe_allow_html=True
     )
 
-def display_order_result(orders: List[Order]):
-    """Display order results in a formatted way."""
+def flatten_items(items: List[Any]) -> pd.DataFrame:
+    """One row per extracted item, list fields joined into text."""
+    rows = []
+    for i, item in enumerate(items, 1):
+        row = {"#": i}
+        for name, value in item.model_dump().items():
+            row[name] = ", ".join(map(str, value)) if isinstance(value, list) else value
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def concat_frames(parts: List[Optional[Dict]], label: str = "#") -> Optional[pd.DataFrame]:
+    """Stack per-item column arrays into one frame, tagging rows with their item number."""
+    frames = [pd.DataFrame(part).assign(**{label: i}) for i, part in enumerate(parts, 1) if part is not None]
+    if not frames:
+        return None
+    frame = pd.concat(frames, ignore_index=True)
+    return frame[[label, *[column for column in frame.columns if column != label]]]
+
+def display_table(frame: pd.DataFrame, key: str):
+    """Filterable, sortable table showing one page of rows at a time."""
+    col1, col2, col3 = st.columns([3, 2, 1])
+    with col1:
+        text = st.text_input("Filter", key=f"{key}_filter", placeholder="Show rows containing...")
+    with col2:
+        sort_by = st.selectbox("Sort by", ["(input order)", *frame.columns], key=f"{key}_sort")
+    with col3:
+        descending = st.toggle("Descending", key=f"{key}_descending")
+
+    if text:
+        matches = frame.astype(str).apply(lambda column: column.str.contains(text, case=False, regex=False))
+        frame = frame[matches.any(axis=1)]
+    if sort_by in frame.columns:
+        frame = frame.sort_values(sort_by, ascending=not descending, kind="stable")
+
+    pages = max(1, math.ceil(len(frame) / TABLE_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    start = (page - 1) * TABLE_PAGE_SIZE
+    st.dataframe(frame.iloc[start:start + TABLE_PAGE_SIZE], use_container_width=True, hide_index=True)
+    st.caption(f"Rows {min(start + 1, len(frame))}-{min(start + TABLE_PAGE_SIZE, len(frame))} of {len(frame)}")
+
+def display_order_result(
+    orders: List[Order],
+    key: str = "orders",
+    submission: Optional[str] = None,
+    staged: Optional[StagingResult] = None,
+):
+    """
+    Display order results in a formatted way, as a table for large baskets.
+
+    With a submission id, a button queues the orders once the trader has
+    reviewed them; staged is their blotter, if the holdings allowed staging.
+    """
     if not orders:
         st.warning("No orders found")
         return
     
     st.subheader("📋 Trading Orders")
-    
-    for i, order in enumerate(orders, 1):
+
+    if len(orders) > TABLE_MODE_THRESHOLD:
+        display_table(flatten_items(orders), key)
+        orders_shown = []
+    else:
+        orders_shown = orders
+
+    for i, order in enumerate(orders_shown, 1):
         with st.expander(f"Order {i}: {order.action.upper()} {order.ticker or 'Multiple Assets'}", expanded=True):
             col1, col2, col3 = st.columns(3)
             
@@ -93,15 +233,57 @@ def display_order_result(orders: List[Order]):
                 else:
                     st.metric("Accounts", "All Accounts")
 
-def display_holding_result(holdings: List[PortfolioHolding]):
-    """Display portfolio holdings results in a formatted way."""
+    if staged is not None:
+        st.markdown(f"**Staged blotter** ({len(staged)} child orders)")
+        for warning in staged.warnings:
+            st.caption(warning)
+        if len(staged) > TABLE_PAGE_SIZE:
+            display_table(pd.DataFrame(staged.blotter), f"{key}_blotter")
+        elif len(staged):
+            st.dataframe(staged.blotter, use_container_width=True, hide_index=True)
+
+    if submission is not None:
+        render_order_submission(orders, submission, key)
+
+def render_order_submission(orders: List[Order], submission: str, key: str):
+    """Confirm-and-submit button for a result's orders, replaced by the outcome once submitted."""
+    submitted = st.session_state.setdefault("submitted_orders", {})
+    if submission not in submitted and st.button(f"📤 Submit {len(orders)} order(s)", key=f"{key}_submit"):
+        message = queue_orders(orders, submission)
+        if message is not None:
+            submitted[submission] = message
+    if submission in submitted:
+        st.caption(submitted[submission])
+
+def display_holding_result(
+    holdings: List[PortfolioHolding],
+    key: str = "holdings",
+    positions: Optional[List[Optional[Dict]]] = None,
+    diffs: Optional[List[Optional[Tuple[Optional[Dict], DiffStats]]]] = None,
+):
+    """
+    Display portfolio holdings results in a formatted way, as tables for many requests.
+
+    positions and diffs hold each holding's fetched positions or change of
+    positions (see utils.ResultData).
+    """
+    positions = positions or [None] * len(holdings)
+    diffs = diffs or [None] * len(holdings)
     if not holdings:
         st.warning("No holdings found")
         return
     
     st.subheader("📊 Portfolio Holdings")
-    
-    for i, holding in enumerate(holdings, 1):
+
+    if len(holdings) > TABLE_MODE_THRESHOLD:
+        display_table(flatten_items(holdings), key)
+        table = concat_frames([diff[0] if diff is not None else data for data, diff in zip(positions, diffs)])
+        if table is not None:
+            st.markdown("**Positions**")
+            display_table(table, f"{key}_positions")
+        return
+
+    for i, (holding, data, diff) in enumerate(zip(holdings, positions, diffs), 1):
         with st.expander(f"Holding {i}: {holding.ticker or 'All Holdings'}", expanded=True):
             col1, col2, col3 = st.columns(3)
             
@@ -127,15 +309,53 @@ def display_holding_result(holdings: List[PortfolioHolding]):
                 else:
                     st.metric("Accounts", "All Accounts")
 
-def display_performance_result(performances: List[PortfolioPerformance]):
-    """Display portfolio performance results in a formatted way."""
+            if is_change_request(holding):
+                display_holding_diff(diff)
+                continue
+            if data is not None:
+                if len(data["account"]):
+                    st.dataframe(data, use_container_width=True, hide_index=True)
+                else:
+                    st.info("No positions found for this request")
+
+def display_holding_diff(diff: Optional[Tuple[Optional[Dict], DiffStats]]):
+    """Show how positions changed between a holding's dates: the first rows of the diff and its totals."""
+    if diff is None:
+        return
+    rows, stats = diff
+    shown = len(rows["account"]) if rows is not None else 0
+    if not shown:
+        st.info("No position changes found for this request")
+        return
+    st.caption(
+        f"Changes {stats.start_date or 'before the first snapshot'} → {stats.end_date or 'N/A'}: "
+        f"{stats.added} added, {stats.removed} removed, {stats.changed} changed "
+        f"({stats.rows_scanned:,} rows scanned, showing {shown})"
+    )
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+def display_performance_result(
+    performances: List[PortfolioPerformance],
+    key: str = "performances",
+    returns: Optional[List[Optional[Dict]]] = None,
+):
+    """Display portfolio performance results in a formatted way, as tables for many requests; returns holds each one's fetched returns."""
+    returns = returns or [None] * len(performances)
     if not performances:
         st.warning("No performance data found")
         return
     
     st.subheader("📈 Portfolio Performance")
-    
-    for i, performance in enumerate(performances, 1):
+
+    if len(performances) > TABLE_MODE_THRESHOLD:
+        display_table(flatten_items(performances), key)
+        table = concat_frames(returns)
+        if table is not None:
+            st.markdown("**Returns**")
+            display_table(table, f"{key}_returns")
+        return
+
+    for i, (performance, data) in enumerate(zip(performances, returns), 1):
         with st.expander(f"Performance {i}: {performance.accounts or 'All Accounts'}", expanded=True):
             col1, col2 = st.columns(2)
             
@@ -146,30 +366,66 @@ def display_performance_result(performances: List[PortfolioPerformance]):
             with col2:
                 st.metric("Accounts", performance.accounts or "All Accounts")
 
-def display_raw_result(result: Any):
+            if data is not None:
+                st.dataframe(data, use_container_width=True, hide_index=True)
+
+def display_raw_result(raw: Any):
     """Display raw JSON result."""
     st.subheader("🔍 Raw Result")
-    st.json(result.model_dump() if hasattr(result, 'model_dump') else result)
+    st.json(raw)
+
+def display_results(result: Any, key: str = "result", submission: Optional[str] = None, data: Optional[ResultData] = None):
+    """
+    Display results based on the result type.
+
+    Args:
+        result: Extracted result to render
+        key: Widget key prefix, unique per result shown on the page
+        submission: Id scoping the idempotency of the result's orders; without one they cannot be submitted
+        data: Data fetched for the result when it was recorded; fetched now if not given
+    """
+    with tracer.timed("render"):
+        if data is None and result is not None:
+            data = fetch_result_data(result)
+        _display_results(result, key, submission, data)
 
-def display_results(result: Any):
-    """Display results based on the result type."""
+def _display_results(result: Any, key: str, submission: Optional[str], data: Optional[ResultData]):
     if result is None:
         st.warning("I couldn't understand your query. Please try rephrasing or use one of the example queries from the sidebar.")
         return
     
     st.success("Query processed successfully!")
+    for message in data.messages:
+        st.warning(message)
+    raw = result.model_dump() if hasattr(result, 'model_dump') else result
     
-    # Display results based on type
-    if hasattr(result, 'orders') and result.orders:
-        display_order_result(result.orders)
-    elif hasattr(result, 'holdings') and result.holdings:
-        display_holding_result(result.holdings)
-    elif hasattr(result, 'performances') and result.performances:
-        display_performance_result(result.performances)
-    else:
+    # Display each section present; multi-intent results can carry all three
+    sections = 0
+    if getattr(result, 'orders', None):
+        display_order_result(result.orders, key=f"{key}_orders", submission=submission, staged=data.staged)
+        sections += 1
+    if getattr(result, 'holdings', None):
+        display_holding_result(result.holdings, key=f"{key}_holdings", positions=data.positions, diffs=data.diffs)
+        sections += 1
+    if getattr(result, 'performances', None):
+        display_performance_result(result.performances, key=f"{key}_performances", returns=data.returns)
+        sections += 1
+    if not sections:
         st.info("No specific data extracted. Here's the raw result:")
-        display_raw_result(result)
+        display_raw_result(raw)
     
     # Show raw JSON in expander
     with st.expander("🔍 View Raw JSON", expanded=False):
-        st.json(result.model_dump() if hasattr(result, 'model_dump') else result)
+        st.json(raw)
+
+def display_history_entries(queries: List[str]):
+    """Display the stored results of queries from the session history."""
+    history = st.session_state.history
+    entries = [entry for entry in map(history.get, queries) if entry is not None]
+    for i, entry in enumerate(entries):
+        if entry.error:
+            continue
+        if len(entries) > 1:
+            st.markdown(f"#### {entry.query}")
+        st.caption(f"Processed in {entry.elapsed:.2f}s")
+        display_results(entry.result, key=f"result_{i}", submission=entry.submission_id, data=entry.data)
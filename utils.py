@@ -1,48 +1,376 @@
 """
 Utility functions for P.O.M.S - Portfolio and OMS System
 """
+import asyncio
+import atexit
+import copy
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+import numpy as np
 import streamlit as st
-from typing import Any
-from pots_models import route_input_and_extract
+from typing import Any, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple
+from pots_models import aroute_input_and_extract, new_conversation, tracer
+from llm_client import get_event_loop, run_sync
+from date_resolver import DateRangeError, check_date_range
+from reference_data import UnresolvedReferenceError
+from config import DIFF_CACHE_ENTRIES, DIFF_DISPLAY_MAX_ROWS, HISTORY_MAX_ENTRIES, HISTORY_MAX_BYTES
+from query_history import QueryHistory
+from follow_up import Conversation
+from ingest import Item, ingest
+from holdings_store import HoldingsStore, Columns, default_root
+from holdings_diff import DiffStats, iter_holding_diff
+from order_queue import OrderQueue, QueueClosedError, QueueFullError, default_path as default_order_log_path
+from order_staging import MarketState, StagingResult, stage_orders
+from performance_engine import PerformanceEngine, default_path as default_performance_path
+
+async def _extract_timed(
+    query: str,
+    extract: Callable[[str], Awaitable[Any]] = aroute_input_and_extract,
+) -> Tuple[Any, float]:
+    """Extract one query, returning (result or exception, seconds taken)."""
+    start = time.perf_counter()
+    try:
+        outcome = await extract(query)
+    except Exception as e:
+        outcome = e
+    return outcome, time.perf_counter() - start
+
+async def _extract_all(queries: List[str]) -> List[Tuple[Any, float]]:
+    """Extract several queries concurrently, returning exceptions in place of failed results."""
+    return await asyncio.gather(*(_extract_timed(query) for query in queries))
+
+async def _extract_conversation(queries: List[str], conversation: Conversation) -> List[Tuple[Any, float]]:
+    """Extract queries one after another, each a possible follow-up to the one before."""
+    return [await _extract_timed(query, conversation.aextract) for query in queries]
+
+def ingestion_output_path(file_name: str) -> str:
+    """Results file (and checkpoint) for an uploaded instruction file."""
+    stem = os.path.splitext(os.path.basename(file_name))[0] or "upload"
+    return os.path.join(os.getenv("POMS_INGEST_DIR", os.path.join(".poms_data", "ingest")), f"{stem}.results.jsonl")
+
+def start_ingestion(items: List[Item], output: str, concurrency: int = 8) -> Tuple[Future, "queue.Queue"]:
+    """
+    Start a bulk ingestion on the shared event loop.
+
+    Returns:
+        (future resolving to the IngestStats, queue of (record, stats snapshot) updates)
+    """
+    updates: "queue.Queue" = queue.Queue()
+    coroutine = ingest(items, output, concurrency, on_record=lambda record, stats: updates.put((record, copy.copy(stats))))
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()), updates
+
+@st.cache_resource
+def _open_holdings_store(root: str) -> HoldingsStore:
+    return HoldingsStore(root)
+
+def get_holdings_store() -> Optional[HoldingsStore]:
+    """Return the holdings store shared by all sessions, or None when no snapshots exist."""
+    root = default_root()
+    if not os.path.isdir(root):
+        return None
+    return _open_holdings_store(root)
+
+def fetch_holdings(holding) -> Optional[Columns]:
+    """
+    Fetch the positions a PortfolioHolding asks for.
+
+    Returns:
+        Column arrays (date, account, ticker and requested fields), or None without a store
+
+    Raises:
+        DateRangeError: if a date did not resolve or the range is inverted
+        UnresolvedReferenceError: if an account or ticker is not in the store
+    """
+    store = get_holdings_store()
+    if store is None:
+        return None
+    store.refresh()
+    return store.query_holding(holding)
+
+def is_change_request(holding) -> bool:
+    """Whether a PortfolioHolding asks how positions changed between two dates."""
+    return bool(holding.start_date and holding.end_date) and holding.start_date != holding.end_date
+
+# Finished diffs: (holding request, snapshot dates, rows) -> (first rows, totals)
+_holdings_diffs: "OrderedDict[Tuple, Tuple[Optional[Columns], DiffStats]]" = OrderedDict()
+_holdings_diffs_lock = threading.Lock()
+
+def stream_holdings_diff(holding, max_rows: int) -> Optional[Iterator[Tuple[Optional[Columns], DiffStats]]]:
+    """
+    The first max_rows rows of a holding's change of positions and the diff's totals, as they grow.
+
+    The book is scanned once per request and pair of snapshots it resolves
+    to; later calls, such as Streamlit reruns, replay the finished diff
+    from memory in a single step.
+
+    Returns:
+        Iterator of (rows so far or None, totals so far), one step per merge window, or None without a store
+
+    Raises:
+        DateRangeError: if a date did not resolve or the range is inverted
+        UnresolvedReferenceError: while iterating, if an account or ticker is not in the store
+    """
+    check_date_range(holding.start_date, holding.end_date)
+    store = get_holdings_store()
+    if store is None:
+        return None
+    store.refresh()
+    key = (holding.model_dump_json(), str(store.as_of(holding.start_date)), str(store.as_of(holding.end_date)), max_rows)
+    with _holdings_diffs_lock:
+        cached = _holdings_diffs.get(key)
+        if cached is not None:
+            _holdings_diffs.move_to_end(key)
+    if cached is not None:
+        return iter([cached])
+    return _stream_holdings_diff(store, holding, max_rows, key)
+
+def _stream_holdings_diff(store: HoldingsStore, holding, max_rows: int, key: Tuple) -> Iterator[Tuple[Optional[Columns], DiffStats]]:
+    stats = DiffStats()
+    parts, rows, shown = [], 0, None
+    for chunk in iter_holding_diff(store, holding, stats=stats):
+        if rows < max_rows:
+            parts.append({name: values[:max_rows - rows] for name, values in chunk.items()})
+            rows += len(parts[-1]["account"])
+            shown = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        yield shown, stats
+    with _holdings_diffs_lock:
+        _holdings_diffs[key] = (shown, stats)
+        while len(_holdings_diffs) > DIFF_CACHE_ENTRIES:
+            _holdings_diffs.popitem(last=False)
+    if not stats.windows:
+        yield shown, stats
+
+def stage_order_result(orders) -> Optional[StagingResult]:
+    """
+    Size extracted orders into per-account child orders against the latest holdings.
+
+    Returns:
+        The staged blotter, or None without a holdings store
+    """
+    store = get_holdings_store()
+    if store is None:
+        return None
+    store.refresh()
+    market = MarketState.from_store(store)
+    if market is None:
+        return None
+    return stage_orders(orders, market)
+
+@st.cache_resource
+def _open_performance_engine(path: str) -> PerformanceEngine:
+    return PerformanceEngine.load(path)
+
+def get_performance_engine() -> Optional[PerformanceEngine]:
+    """Return the performance engine shared by all sessions, or None when no history exists."""
+    path = default_performance_path()
+    if not os.path.exists(path):
+        return None
+    return _open_performance_engine(path)
+
+def fetch_performance(performance) -> Optional[Columns]:
+    """
+    Compute the returns a PortfolioPerformance asks for.
+
+    Returns:
+        Column arrays (account, dates, return, NAVs), or None without a history
+
+    Raises:
+        DateRangeError: if a date did not resolve or the range is inverted
+        UnresolvedReferenceError: if an account has no history
+    """
+    engine = get_performance_engine()
+    if engine is None:
+        return None
+    engine.refresh()
+    return engine.evaluate(performance)
+
+@dataclass
+class ResultData:
+    """
+    Data fetched for an extracted result: staged orders, positions,
+    position changes and returns, one slot per holding or performance.
+
+    Fetched once when the result is recorded in the query history, so
+    Streamlit reruns only redraw it. Requests whose dates cannot be looked
+    up, or whose accounts or tickers are not in the book, are left empty
+    and explained in messages.
+    """
+    staged: Optional[StagingResult] = None
+    positions: List[Optional[Columns]] = field(default_factory=list)
+    diffs: List[Optional[Tuple[Optional[Columns], DiffStats]]] = field(default_factory=list)
+    returns: List[Optional[Columns]] = field(default_factory=list)
+    messages: List[str] = field(default_factory=list)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the fetched arrays."""
+        tables = [*self.positions, *(diff[0] for diff in self.diffs if diff is not None), *self.returns]
+        if self.staged is not None:
+            tables.append(self.staged.blotter)
+        return sum(getattr(values, "nbytes", 0) for table in tables if table for values in table.values())
+
+def _last_step(steps: Optional[Iterable[Tuple[Optional[Columns], DiffStats]]]) -> Optional[Tuple[Optional[Columns], DiffStats]]:
+    last = None
+    for last in steps or ():
+        pass
+    return last
+
+def fetch_result_data(result: Any) -> ResultData:
+    """Fetch everything the page shows alongside an extracted result."""
+    data = ResultData()
+    if getattr(result, "orders", None):
+        data.staged = stage_order_result(result.orders)
+    for i, holding in enumerate(getattr(result, "holdings", None) or [], 1):
+        positions = diff = None
+        try:
+            if is_change_request(holding):
+                diff = _last_step(stream_holdings_diff(holding, DIFF_DISPLAY_MAX_ROWS))
+            else:
+                positions = fetch_holdings(holding)
+        except (DateRangeError, UnresolvedReferenceError) as e:
+            data.messages.append(f"Holding {i}: {e}")
+        data.positions.append(positions)
+        data.diffs.append(diff)
+    for i, performance in enumerate(getattr(result, "performances", None) or [], 1):
+        returns = None
+        try:
+            returns = fetch_performance(performance)
+        except (DateRangeError, UnresolvedReferenceError) as e:
+            data.messages.append(f"Performance {i}: {e}")
+        data.returns.append(returns)
+    return data
+
+@st.cache_resource
+def get_order_queue() -> OrderQueue:
+    """Return the order queue shared by all sessions, replaying its log on first use."""
+    order_queue = OrderQueue(default_order_log_path())
+    atexit.register(order_queue.close)
+    return order_queue
+
+def queue_orders(orders: List[Any], submission_id: str) -> Optional[str]:
+    """
+    Durably queue orders the trader confirmed.
+
+    The idempotency scope is the submission (one processed query), so a
+    repeated click or rerun does not queue its orders twice, while the same
+    query processed again is a new submission.
+
+    Returns:
+        A summary of what was queued, or None if the queue refused the orders
+        (full, closed, or its log could not be written); the button then stays
+        so the trader can retry
+    """
+    try:
+        submitted = get_order_queue().submit_many(orders, scope=submission_id, timeout=5)
+    except QueueFullError as e:
+        st.warning(f"Orders were not queued, the order queue is full: {e}")
+        return None
+    except QueueClosedError as e:
+        st.error(f"Orders were not queued, the order queue is shut down: {e}")
+        return None
+    except OSError as e:
+        st.error(f"Orders were not queued, the order log could not be written: {e}")
+        return None
+    new = sum(not item.duplicate for item in submitted)
+    message = f"Queued {new} order(s)"
+    if new < len(submitted):
+        message += f"; {len(submitted) - new} already queued"
+    return message
 
 def initialize_session_state():
     """Initialize Streamlit session state variables."""
     if 'query_text' not in st.session_state:
         st.session_state.query_text = ""
+    if 'history' not in st.session_state:
+        st.session_state.history = QueryHistory(HISTORY_MAX_ENTRIES, HISTORY_MAX_BYTES)
+    if 'shown_queries' not in st.session_state:
+        st.session_state.shown_queries = []
+    if 'conversation' not in st.session_state:
+        st.session_state.conversation = new_conversation()
+
+def split_queries(query_text: str) -> List[str]:
+    """Split the input box into one query per non-empty line."""
+    return [line.strip() for line in query_text.splitlines() if line.strip()]
+
+def process_queries(queries: List[str]) -> List[Any]:
+    """
+    Process several queries concurrently using the routing and extraction system.
+
+    In follow-up mode the queries run in order instead, and each one that
+    reads as a follow-up ("same for ushy", "make it 300") patches the
+    session's previous result rather than being extracted from scratch.
+
+    Args:
+        queries: The user's query texts
+
+    Returns:
+        One extracted result per query, None where processing failed
+    """
+    with tracer.timed("process_queries"):
+        with st.spinner("Processing your query..." if len(queries) == 1 else f"Processing {len(queries)} queries..."):
+            conversation = st.session_state.conversation
+            if st.session_state.get('follow_up'):
+                outcomes = run_sync(_extract_conversation(queries, conversation))
+            else:
+                outcomes = run_sync(_extract_all(queries))
+
+        results = []
+        for query, (outcome, elapsed) in zip(queries, outcomes):
+            if isinstance(outcome, Exception):
+                st.error(f"An error occurred while processing your query '{query}': {str(outcome)}")
+                st.exception(outcome)
+                st.session_state.history.add(query, None, elapsed, error=str(outcome))
+                results.append(None)
+            else:
+                with tracer.timed("fetch"):
+                    data = fetch_result_data(outcome)
+                st.session_state.history.add(query, outcome, elapsed, data=data)
+                results.append(outcome)
+        if not st.session_state.get('follow_up'):
+            # Let a follow-up sent after switching the mode on refer to this batch's last result
+            conversation.remember(next((result for result in reversed(results) if result is not None), None))
+    return results
 
 def process_query(query_text: str) -> Any:
     """
     Process a query using the routing and extraction system.
-    
+
     Args:
         query_text: The user's query text
-        
+
     Returns:
         The extracted result or None if processing failed
     """
     if not query_text.strip():
         st.warning("Please enter a query to process.")
         return None
-    
-    try:
-        with st.spinner("Processing your query..."):
-            result = route_input_and_extract(query_text)
-            return result
-    except Exception as e:
-        st.error(f"An error occurred while processing your query: {str(e)}")
-        st.exception(e)
-        return None
 
-def handle_query_processing(query_text: str):
+    return process_queries([query_text.strip()])[0]
+
+def handle_query_processing(query_text: str) -> List[Tuple[str, Any]]:
     """
     Handle the complete query processing workflow.
-    
+
+    Each non-empty line of the input is treated as its own query and all of
+    them are extracted concurrently. Results are recorded in the session's
+    query history and become the queries shown on the page.
+
     Args:
         query_text: The user's query text
+
+    Returns:
+        (query, result) pairs in input order
     """
-    if query_text.strip():
-        result = process_query(query_text)
-        return result
+    queries = split_queries(query_text)
+    if queries:
+        results = process_queries(queries)
+        st.session_state.shown_queries = queries
+        return list(zip(queries, results))
     else:
         st.warning("Please enter a query to process.")
-        return None
+        return []